@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the microbenchmarks of ImageProcessingAlgorithms.
+
+Every benchmarked function is timed on synthetic images of 2, 12, 24, 50 and 100
+megapixels, with OpenCV limited to each of the given thread counts. The results are the
+throughput in megapixels per second of the best of the repeats, the median time and the
+peak memory allocated by the call (numpy arrays and Python objects, traced with
+tracemalloc in an untimed run; buffers allocated inside Qt or OpenCV are not seen).
+
+The results are written as JSON and compared with a baseline written by an earlier run
+on the same machine, see compare_results. A function slower than the baseline by more
+than the tolerance is reported as a regression and the run fails, e.g. in a CI job.
+No baseline is shipped: timings only compare on the same hardware.
+
+Example:
+    python -m benchmarks.ImageProcessingBenchmark --save-baseline
+    python -m benchmarks.ImageProcessingBenchmark --sizes 2 12 --output results.json
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+FORMAT_NAME = "visualysium-benchmark"
+FORMAT_VERSION = 1
+SIZES_MP = (2, 12, 24, 50, 100)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.15  # Slower than the baseline by more than this fraction is a regression
+
+
+class Benchmark:
+    """
+    One timed call of a function.
+
+    :param prepare: Called with the Fixtures of an image size, returns the arguments of the
+                    call. It is not timed, e.g. copies of inputs the function modifies in place.
+    :param depths: Bit depths of the input images the function supports.
+    """
+
+    def __init__(self, name, function, prepare, depths=(8,)):
+        self.name = name
+        self.function = function
+        self.prepare = prepare
+        self.depths = depths
+
+
+class Fixtures:
+    """Synthetic inputs of one image size and depth, created once and shared by the benchmarks."""
+
+    def __init__(self, megapixels, depth, seed=0):
+        self.megapixels = megapixels
+        self.depth = depth
+        # 3:2 like most camera sensors
+        self.height = int(round((megapixels * 1e6 / 1.5) ** 0.5))
+        self.width = int(round(megapixels * 1e6 / self.height))
+        self.image = synthetic_image(self.width, self.height, depth, seed)
+        self.__mask = None
+        self.__qimage = None
+        self.lut = np.clip(np.arange(256) * 1.1, 0, 255).astype(np.uint8)
+        self.lut_2 = np.clip(np.arange(256) * 0.9 + 20, 0, 255).astype(np.uint8)
+
+    def mask(self):
+        if self.__mask is None:
+            self.__mask = ImageProcessingAlgorithms.luminance_mask(
+                ImageProcessingAlgorithms.to_display_uint8(self.image), self.width, self.height)
+        return self.__mask
+
+    def qimage(self):
+        if self.__qimage is None:
+            self.__qimage = ImageProcessingAlgorithms.convert_array_to_qimage(self.image, copy=True)
+        return self.__qimage
+
+
+def synthetic_image(width, height, depth=8, seed=0):
+    """
+    Create a reproducible RGB test image: smooth gradients with noise, so LUTs, histograms
+    and blurs see a realistic spread of values.
+    """
+    dtype = np.uint16 if depth == 16 else np.uint8
+    max_value = ImageProcessingAlgorithms.max_value(dtype)
+    rng = np.random.default_rng(seed)
+    # Gradients and noise are made at a reduced size and scaled up, full size float noise
+    # of a 100 MP image would not fit in memory next to the benchmarks
+    small = np.empty((max(height // 8, 1), max(width // 8, 1), 3), dtype=np.float32)
+    ramp_x = np.linspace(0, 1, small.shape[1], dtype=np.float32)
+    ramp_y = np.linspace(0, 1, small.shape[0], dtype=np.float32)[:, None]
+    small[:, :, 0] = ramp_x
+    small[:, :, 1] = ramp_y
+    small[:, :, 2] = 1 - (ramp_x + ramp_y) / 2
+    small += rng.normal(0, 0.08, small.shape).astype(np.float32)
+    np.clip(small, 0, 1, out=small)
+    small = (small * max_value).astype(dtype)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+    # Pixel level noise, added by blocks of rows to keep the peak memory at the size of the image
+    for top in range(0, height, 256):
+        rows = image[top:top + 256]
+        rows ^= rng.integers(0, 4, rows.shape, dtype=dtype)
+    return image
+
+
+BENCHMARKS = [
+    Benchmark("adjust_contrast_brightness_gamma", ImageProcessingAlgorithms.adjust_contrast_brightness_gamma,
+              lambda f: (f.image, 0.1, 0.05, 0.9, 0.1, 0.1, f.mask())),
+    Benchmark("change_color_temperature", ImageProcessingAlgorithms.change_color_temperature,
+              lambda f: (f.image.copy(), 5000, 1.0, 1.1, 0.9)),  # Modifies the image in place
+    Benchmark("adjust_saturation_hue", ImageProcessingAlgorithms.adjust_saturation_hue,
+              lambda f: (f.image, 1.2, 10), depths=(8, 16)),
+    Benchmark("apply_lut_global[Luminance]", ImageProcessingAlgorithms.apply_lut_global,
+              lambda f: (f.image, f.lut, "Luminance")),
+    Benchmark("apply_lut_global[Red]", ImageProcessingAlgorithms.apply_lut_global,
+              lambda f: (f.image, f.lut, "Red")),
+    Benchmark("apply_lut_local[Luminance]", ImageProcessingAlgorithms.apply_lut_local,
+              lambda f: (f.image, f.lut, f.lut_2, "Luminance", f.mask())),
+    Benchmark("apply_lut_local[Red]", ImageProcessingAlgorithms.apply_lut_local,
+              lambda f: (f.image, f.lut, f.lut_2, "Red", f.mask())),
+    Benchmark("color_sharpening", ImageProcessingAlgorithms.color_sharpening,
+              lambda f: (f.image, 0.5), depths=(8, 16)),
+    Benchmark("colour_blurring", ImageProcessingAlgorithms.colour_blurring,
+              lambda f: (f.image, 5), depths=(8, 16)),
+    Benchmark("calculate_histogram", ImageProcessingAlgorithms.calculate_histogram,
+              lambda f: (f.image, "Luminance"), depths=(8, 16)),
+    Benchmark("convert_array_to_qimage", ImageProcessingAlgorithms.convert_array_to_qimage,
+              lambda f: (f.image, True), depths=(8, 16)),
+    Benchmark("convert_qimage_to_array", ImageProcessingAlgorithms.convert_qimage_to_array,
+              lambda f: (f.qimage(), True), depths=(8, 16)),
+]
+
+
+def time_call(benchmark, fixtures, repeats):
+    """Return the times in seconds of repeated calls, the arguments are prepared before each one."""
+    times = []
+    for _ in range(repeats):
+        arguments = benchmark.prepare(fixtures)
+        start = time.perf_counter()
+        benchmark.function(*arguments)
+        times.append(time.perf_counter() - start)
+        del arguments
+    return times
+
+
+def peak_allocation(benchmark, fixtures):
+    """Return the peak bytes allocated by one call, on top of its prepared arguments."""
+    arguments = benchmark.prepare(fixtures)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        benchmark.function(*arguments)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def default_thread_counts():
+    """1, 2, 4, ... threads up to the number of cores, and the number of cores."""
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def run_benchmarks(sizes=SIZES_MP, depths=(8,), thread_counts=None, repeats=5, names=None):
+    """
+    Run the benchmarks and print one line per result.
+
+    :param names: Names of the benchmarks to run, all if None.
+    :return: The results as a JSON serializable dict.
+    """
+    thread_counts = thread_counts or default_thread_counts()
+    benchmarks = [benchmark for benchmark in BENCHMARKS if names is None or benchmark.name in names]
+    results = []
+    previous_threads = cv2.getNumThreads()
+    try:
+        for depth in depths:
+            for megapixels in sizes:
+                fixtures = Fixtures(megapixels, depth)
+                pixels = fixtures.width * fixtures.height / 1e6
+                for benchmark in benchmarks:
+                    if depth not in benchmark.depths:
+                        continue
+                    peak_bytes = peak_allocation(benchmark, fixtures)
+                    single_thread = None
+                    for threads in thread_counts:
+                        cv2.setNumThreads(threads)
+                        benchmark.function(*benchmark.prepare(fixtures))  # Warm up the thread pool and caches
+                        times = time_call(benchmark, fixtures, repeats)
+                        best = min(times)
+                        throughput = pixels / best
+                        if single_thread is None:
+                            single_thread = throughput
+                        results.append({
+                            "function": benchmark.name,
+                            "depth": depth,
+                            "megapixels": megapixels,
+                            "width": fixtures.width,
+                            "height": fixtures.height,
+                            "threads": threads,
+                            "repeats": repeats,
+                            "best_seconds": best,
+                            "median_seconds": statistics.median(times),
+                            "megapixels_per_second": throughput,
+                            "speedup": throughput / single_thread,
+                            "peak_allocation_mb": peak_bytes / 1e6,
+                        })
+                        print(f"{benchmark.name:36s} {depth:2d} bit {megapixels:4d} MP {threads:3d} threads: "
+                              f"{throughput:9.1f} MP/s  x{throughput / single_thread:4.2f}  "
+                              f"{best * 1000:9.1f} ms  peak {peak_bytes / 1e6:8.1f} MB", flush=True)
+                del fixtures
+    finally:
+        cv2.setNumThreads(previous_threads)
+    return {"format": FORMAT_NAME, "version": FORMAT_VERSION, "machine": machine_info(), "results": results}
+
+
+def result_key(result):
+    return result["function"], result["depth"], result["megapixels"], result["threads"]
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the throughput of results with a baseline.
+
+    :param tolerance: Fraction of the baseline throughput a result may lose before it is a regression.
+    :return: List of (result key, baseline MP/s, MP/s, change) of the regressions.
+    """
+    if baseline.get("machine") != results.get("machine"):
+        print("Warning: the baseline was measured on another machine or software versions, timings may not compare.")
+
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    compared = 0
+    for result in results["results"]:
+        reference = baseline_results.get(result_key(result))
+        if reference is None:
+            continue
+        compared += 1
+        change = result["megapixels_per_second"] / reference["megapixels_per_second"] - 1
+        if change < -tolerance:
+            regressions.append((result_key(result), reference["megapixels_per_second"], result["megapixels_per_second"], change))
+
+    print(f"Compared {compared} of {len(results['results'])} results with the baseline, {len(regressions)} regressions.")
+    for (name, depth, megapixels, threads), reference, throughput, change in regressions:
+        print(f"REGRESSION {name} {depth} bit {megapixels} MP {threads} threads: "
+              f"{reference:.1f} -> {throughput:.1f} MP/s ({change:+.0%})")
+    return regressions
+
+
+def read_results(path):
+    with open(path, "r", encoding="utf-8") as file:
+        results = json.load(file)
+    if results.get("format") != FORMAT_NAME or results.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a benchmark result of version {FORMAT_VERSION}.")
+    return results
+
+
+def write_results(results, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=1)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ImageProcessingBenchmark",
+                                     description="Time the functions of ImageProcessingAlgorithms on synthetic images.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES_MP), help="Image sizes in megapixels.")
+    parser.add_argument("--depths", type=int, nargs="+", choices=(8, 16), default=[8],
+                        help="Bit depths of the images, functions without high bit depth support only run at 8 bits.")
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="OpenCV thread counts, powers of two up to the number of cores by default.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per result, the best one is reported.")
+    parser.add_argument("--functions", nargs="+", choices=[benchmark.name for benchmark in BENCHMARKS], default=None,
+                        help="Benchmarks to run, all by default.")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="JSON file the results are written to.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare with, if the file exists.")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline instead of comparing.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fraction of the baseline throughput a result may lose before it is a regression.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    results = run_benchmarks(args.sizes, args.depths, args.threads, args.repeats, args.functions)
+    write_results(results, args.output)
+    print(f"Results written to {args.output}.")
+
+    if args.save_baseline:
+        write_results(results, args.baseline)
+        print(f"Baseline written to {args.baseline}.")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one.")
+        return 0
+    return 1 if compare_results(results, read_results(args.baseline), args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -39,6 +39,7 @@ from PyQt6.QtGui import QIcon, QAction, QPalette, QColor, QFileSystemModel, QDes
 from PyQt6.QtWidgets import QApplication, QMainWindow, QTreeView, QHBoxLayout, QWidget, QSplitter, QMenu, QMenuBar, QMessageBox, QFileDialog, QSplashScreen
 from src.ImageEditorWindow import ImageViewerWindow
 from src.FolderExplorer import FolderExplorer
+import src.util.Instrumentation as Instrumentation
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -290,6 +291,8 @@ class MainWindow(QMainWindow):
         self.__image_viewer_window.show_new_image(image_path)
 
     def open_image_viewer(self, image_path):
+        # Next/previous navigation follows the order of the folder explorer
+        self.__image_viewer_window.set_image_list(self.__image_list_widget.image_paths())
         self.__image_viewer_window.show()
         self.__image_viewer_window.show_new_image(image_path)
 
@@ -304,6 +307,20 @@ class MainWindow(QMainWindow):
         if image_path:
             self.open_image_viewer(image_path)
 
+    def restore_session(self):
+        """Offer to restore the autosaved edits of the previous session."""
+        if not self.__image_viewer_window.has_autosaved_session():
+            return
+        reply = QMessageBox.question(self, 'Restore Session',
+                                    'The edits of the previous session can be restored. Do you want to restore them?',
+                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                    QMessageBox.StandardButton.Yes)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.__image_viewer_window.show()
+            self.__image_viewer_window.restore_session()
+        else:
+            self.__image_viewer_window.discard_session()
+
     def exit_application(self):
         reply = QMessageBox.question(self, 'Exit Confirmation', 
                                     'Are you sure you want to exit?', 
@@ -326,6 +343,14 @@ def main():
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(u'Visualysium.ExImaVi.ImageVisualizer.0.01') # Arbitrary string
 
     app = QApplication(sys.argv)
+
+    # VISUALYSIUM_LOG_LEVEL=DEBUG logs the values of every edit. VISUALYSIUM_TRACE=<file> records the
+    # stages of the hot path and writes them as a Chrome trace when the application quits.
+    Instrumentation.configure_logging(os.environ.get("VISUALYSIUM_LOG_LEVEL", "INFO"))
+    trace_path = os.environ.get("VISUALYSIUM_TRACE")
+    if trace_path:
+        Instrumentation.INSTRUMENTATION.enable(tracing=True)
+        app.aboutToQuit.connect(lambda: Instrumentation.INSTRUMENTATION.export_chrome_trace(trace_path))
     
     # Set the application style to Fusion
     # ['Breeze', 'Oxygen', 'QtCurve', 'Windows', 'Fusion']
@@ -343,7 +368,7 @@ def main():
     window = MainWindow()
     
     # Set a timer to wait for 2 seconds before showing the main window
-    QTimer.singleShot(2000, lambda: (window.show(), splash.finish(window)))
+    QTimer.singleShot(2000, lambda: (window.show(), splash.finish(window), window.restore_session()))
 
     ################################
     # Set the geometry of the window
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the headless batch processing of the image editor.
+
+The same crop, rotation, lighting and color adjustments as in the editing windows are
+applied to a list of files or folders, see EditOperation. The images are processed on
+a pool of worker processes, each one decoding, rendering and encoding a whole image.
+Finished images are recorded in a manifest in the output folder, so an interrupted
+batch continues where it stopped when it is run again.
+
+Example:
+    python -m src.BatchProcessing photos/ -o edited/ --rotate 90 --brightness 0.1 --saturation 1.2
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from src.EditHistory import EditOperation
+
+MANIFEST_FILE = "batch-manifest.jsonl"
+WRITABLE_FORMATS = ("jpg", "jpeg", "png", "tif", "tiff", "bmp", "webp")
+HIGH_BIT_DEPTH_FORMATS = ("png", "tif", "tiff")  # Written with 16 bits per channel for high bit depth images
+
+# Values of the editing windows with their sliders in the middle
+LIGHTING_DEFAULTS = {"contrast": 0.0, "brightness": 0.0, "gamma": 1.0, "shadows": 0.0, "highlights": 0.0}
+COLORS_DEFAULTS = {"kelvin": 6550.0, "saturation": 1.0, "hue_shift": 0.0, "red_gain": 1.0, "green_gain": 1.0, "blue_gain": 1.0}
+
+
+def find_images(inputs, recursive=False):
+    """
+    Return the supported image files of a list of files and folders, in a stable order.
+
+    :return: List of (image path, path relative to its input folder), the relative path of
+             a file given as input is its name. The outputs mirror the relative paths.
+    """
+    extensions = tuple(extension[1:].lower() for extension in ImageProcessingAlgorithms.supported_extensions)
+    images = []
+    for path in inputs:
+        if os.path.isfile(path):
+            images.append((os.path.abspath(path), os.path.basename(path)))
+            continue
+        for folder, folders, files in os.walk(path):
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    image_path = os.path.join(folder, name)
+                    images.append((os.path.abspath(image_path), os.path.relpath(image_path, path)))
+            if not recursive:
+                break
+            folders.sort()
+    return images
+
+
+def operations_from_arguments(args):
+    """
+    Return the EditOperations given on the command line.
+
+    The geometric operations come first, in the order flip, rotate, crop, so the crop
+    rectangle is given in the rotated image like in the crop window. Lighting and color
+    values that are not given keep their neutral value.
+    """
+    if args.operations:
+        with open(args.operations, "r", encoding="utf-8") as file:
+            return [EditOperation.from_dict(operation) for operation in json.load(file)]
+
+    operations = []
+    for direction in args.flip or []:
+        operations.append(EditOperation("flip", direction=direction))
+    if args.rotate:
+        for _ in range(abs(args.rotate) // 90):
+            operations.append(EditOperation("rotate", angle=90 if args.rotate > 0 else -90))
+    if args.crop:
+        x, y, width, height = args.crop
+        operations.append(EditOperation("crop", x=x, y=y, width=width, height=height))
+
+    for kind, defaults in (("lighting", LIGHTING_DEFAULTS), ("colors", COLORS_DEFAULTS)):
+        values = {name: getattr(args, name) for name in defaults if getattr(args, name) is not None}
+        if values:
+            operations.append(EditOperation(kind, **{**defaults, **values}))
+    return operations
+
+
+def recipe_key(operations, output_format, quality):
+    """Return a hash of everything that changes the output of an image, see the manifest."""
+    recipe = json.dumps([[operation.to_dict() for operation in operations], output_format, quality], sort_keys=True)
+    return hashlib.sha1(recipe.encode("utf-8")).hexdigest()
+
+
+def output_path_for(relative_path, output_dir, output_format=None, suffix=""):
+    """
+    Return the output file of an image, with the format of the input if it can be written and PNG otherwise.
+
+    :param relative_path: Path of the image relative to its input folder, see find_images.
+                          Its folders are kept under the output folder.
+    """
+    folder, name = os.path.split(relative_path)
+    stem, extension = os.path.splitext(name)
+    if output_format is None:
+        output_format = extension[1:].lower() if extension[1:].lower() in WRITABLE_FORMATS else "png"
+    return os.path.join(output_dir, folder, f"{stem}{suffix}.{output_format}")
+
+
+def save_image(image, path, quality=-1):
+    """
+    Encode an image of any working depth to a file.
+
+    High bit depth images are written with 16 bits per channel if the format supports it,
+    8 bits otherwise. The file is written under a temporary name and renamed, so an
+    interrupted batch never leaves a partial output.
+    """
+    output_format = os.path.splitext(path)[1][1:].lower()
+    if output_format not in HIGH_BIT_DEPTH_FORMATS:
+        image = ImageProcessingAlgorithms.to_display_uint8(image)
+    elif image.dtype not in (np.uint8, np.uint16):
+        image = ImageProcessingAlgorithms.from_float32(ImageProcessingAlgorithms.to_float32(image), np.uint16)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = path + ".part"
+    if not ImageProcessingAlgorithms.convert_array_to_qimage(image, copy=False).save(temporary_path, output_format, quality):
+        raise OSError(f"Failed to write {path}")
+    os.replace(temporary_path, path)
+
+
+def process_image(task):
+    """
+    Decode, edit and encode one image, run on a worker process.
+
+    :param task: (image path, output path, list of EditOperation, quality)
+    :return: (image path, output path, error message or None, seconds)
+    """
+    image_path, output_path, operations, quality = task
+    start = time.perf_counter()
+    try:
+        qimage = ImageProcessingAlgorithms.load_image_to_qimage(image_path)
+        if qimage is None or qimage.isNull():
+            raise ValueError("The image could not be decoded.")
+        image = ImageProcessingAlgorithms.convert_qimage_to_array(qimage)
+        for operation in operations:
+            image = operation.apply(image, max_workers=1)  # The images are processed in parallel instead
+        save_image(image, output_path, quality)
+        return image_path, output_path, None, time.perf_counter() - start
+    except Exception as e:
+        return image_path, output_path, str(e), time.perf_counter() - start
+
+
+def init_worker():
+    cv2.setNumThreads(1)  # One image per process, threads would only compete for the cores
+
+
+def read_manifest(output_dir):
+    """Return the manifest records of the finished images by input path, the latest record of a path wins."""
+    records = {}
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Line cut by an interrupted batch
+                records[record["input"]] = record
+    except OSError:
+        pass
+    return records
+
+
+def file_signature(path):
+    file_info = os.stat(path)
+    return file_info.st_size, file_info.st_mtime_ns
+
+
+def run_batch(images, output_dir, operations, workers=None, output_format=None, quality=-1, suffix="", overwrite=False):
+    """
+    Process images on a pool of worker processes and print the progress.
+
+    Images recorded in the manifest with the same recipe, an unchanged input and an
+    existing output are skipped, unless overwrite is set.
+
+    :param images: List of (image path, path relative to its input folder), see find_images.
+    :return: Summary dict with the numbers of processed, skipped and failed images and the throughput.
+    :raises ValueError: If images would be written to the same output file.
+    """
+    output_paths = {}
+    for image_path, relative_path in images:
+        output_path = output_path_for(relative_path, output_dir, output_format, suffix)
+        if output_path in output_paths:
+            raise ValueError(f"{output_paths[output_path]} and {image_path} would both be written to {output_path}.")
+        output_paths[output_path] = image_path
+
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    recipe = recipe_key(operations, output_format, quality)
+    manifest = {} if overwrite else read_manifest(output_dir)
+
+    tasks, skipped = [], 0
+    for output_path, image_path in output_paths.items():
+        record = manifest.get(image_path)
+        if (record is not None and record["recipe"] == recipe and record["output"] == output_path
+                and tuple(record["signature"]) == file_signature(image_path) and os.path.exists(output_path)):
+            skipped += 1
+            continue
+        tasks.append((image_path, output_path, operations, quality))
+
+    total = len(images)
+    print(f"Processing {len(tasks)} of {total} images on {workers} processes, {skipped} already done.")
+    processed, failed = 0, []
+    start = time.perf_counter()
+    with open(os.path.join(output_dir, MANIFEST_FILE), "a", encoding="utf-8") as manifest_file:
+        with multiprocessing.Pool(workers, initializer=init_worker) as pool:
+            for image_path, output_path, error, seconds in pool.imap_unordered(process_image, tasks):
+                if error is None:
+                    processed += 1
+                    record = {"input": image_path, "output": output_path, "recipe": recipe, "signature": file_signature(image_path)}
+                    manifest_file.write(json.dumps(record) + "\n")
+                    manifest_file.flush()  # A finished image stays recorded if the batch is interrupted
+                    print(f"[{skipped + processed + len(failed)}/{total}] {image_path} -> {output_path} ({seconds:.2f} s)")
+                else:
+                    failed.append(image_path)
+                    print(f"[{skipped + processed + len(failed)}/{total}] FAILED {image_path}: {error}")
+
+    elapsed = time.perf_counter() - start
+    images_per_second = processed / elapsed if elapsed > 0 else 0.0
+    cores = min(workers, os.cpu_count() or workers)
+    summary = {"processed": processed, "skipped": skipped, "failed": failed, "seconds": elapsed, "workers": workers,
+               "images_per_second": images_per_second, "images_per_second_per_core": images_per_second / cores}
+    print(f"Processed {processed} images in {elapsed:.2f} s, {len(failed)} failed, {skipped} skipped: "
+          f"{images_per_second:.2f} images/s, {summary['images_per_second_per_core']:.2f} images/s per core.")
+    return summary
+
+
+def parse_crop(value):
+    try:
+        x, y, width, height = (int(number) for number in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("The crop rectangle must be given as x,y,width,height in pixels.")
+    return x, y, width, height
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.BatchProcessing", description="Apply the same edits to many images.")
+    parser.add_argument("inputs", nargs="+", help="Image files and folders.")
+    parser.add_argument("-o", "--output", required=True, help="Folder the edited images are written to, with the subfolders of the inputs.")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Include the images of subfolders.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes, the number of cores by default.")
+    parser.add_argument("--format", choices=WRITABLE_FORMATS, default=None, help="Output format, the format of the input by default.")
+    parser.add_argument("--quality", type=int, default=-1, help="Quality of lossy formats, 0 to 100.")
+    parser.add_argument("--suffix", default="", help="Appended to the file names, e.g. _edited.")
+    parser.add_argument("--overwrite", action="store_true", help="Process all images again instead of resuming.")
+    parser.add_argument("--operations", help="JSON file with a list of operations, see EditOperation.to_dict. Replaces the options below.")
+
+    geometry = parser.add_argument_group("Crop and rotate")
+    geometry.add_argument("--flip", action="append", choices=("vertical", "horizontal"))
+    geometry.add_argument("--rotate", type=int, choices=(-270, -180, -90, 0, 90, 180, 270), default=0, help="Clockwise angle in degrees.")
+    geometry.add_argument("--crop", type=parse_crop, help="x,y,width,height in pixels of the rotated image.")
+
+    lighting = parser.add_argument_group("Lighting, see ImageProcessingAlgorithms.lighting_luts")
+    for name, default in LIGHTING_DEFAULTS.items():
+        lighting.add_argument(f"--{name}", type=float, help=f"Neutral value {default}.")
+
+    colors = parser.add_argument_group("Colors, see PixelPipeline.colors_pipeline")
+    for name, default in COLORS_DEFAULTS.items():
+        colors.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, help=f"Neutral value {default}.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    images = find_images(args.inputs, args.recursive)
+    if not images:
+        print("No images found.")
+        return 1
+    try:
+        summary = run_batch(images, args.output, operations_from_arguments(args), args.workers, args.format,
+                            args.quality, args.suffix, args.overwrite)
+    except ValueError as e:
+        print(f"Nothing processed: {e}")
+        return 1
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the non-destructive edit history of the image editor.
+
+An edit is stored as the operations it made and their parameters (crop rectangle,
+rotation, lighting values, curves, ...) instead of the resulting image. Any entry of
+the history is rebuilt by replaying the operations from the nearest checkpoint, an
+image kept in a cache bounded in bytes. Only every CHECKPOINT_INTERVAL-th entry of a
+chain of edits is checkpointed, so the memory stays flat however long the history is.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import functools
+import itertools
+
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+import src.PixelPipeline as PixelPipeline
+from src.ImagePyramid import ImagePyramid
+from src.LuminanceMask import LuminanceMask
+from src.TiledRenderer import TiledRenderer
+from src.util.PreviewCache import PreviewCache
+
+
+class EditOperation:
+    """
+    One operation of an edit and its parameters.
+
+    Kinds and parameters:
+        "lighting": contrast, brightness, gamma, shadows, highlights (values of ImageViewer.adjust_lightning)
+        "colors":   kelvin, saturation, hue_shift, red_gain, green_gain, blue_gain (see PixelPipeline.colors_pipeline)
+        "curves":   points_global, points_shadows, points_highlight (control points of the curve widgets,
+                    see ImageProcessingAlgorithms.curve_lut) or lut_global, lut_shadows, lut_highlight
+                    (lists of 256 values), channel
+        "crop":     x, y, width, height in pixels
+        "rotate":   angle, 90 (clockwise) or -90
+        "flip":     direction, "vertical" or "horizontal"
+    """
+    PIPELINE_KINDS = ("lighting", "colors", "curves")
+
+    def __init__(self, kind, **params):
+        self.kind = kind
+        self.params = params
+
+    def __repr__(self):
+        return f"EditOperation({self.kind!r}, {self.params!r})"
+
+    def to_dict(self):
+        return {"kind": self.kind, "params": self.params}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["kind"], **data["params"])
+
+    def is_pipeline(self):
+        return self.kind in self.PIPELINE_KINDS
+
+    def pipeline_factory(self, pyramid):
+        """
+        Return a callable building the PixelPipeline of a pipeline operation.
+
+        :param pyramid: ImagePyramid of the image the operation is applied to.
+        """
+        params = self.params
+        if self.kind == "lighting":
+            min_val, max_val = pyramid.value_range()
+            return functools.partial(PixelPipeline.lighting_pipeline, min_val, max_val, params["contrast"], params["brightness"],
+                                     params["gamma"], params["shadows"], params["highlights"])
+        if self.kind == "colors":
+            return functools.partial(PixelPipeline.colors_pipeline, params["kelvin"], params["saturation"], params["hue_shift"],
+                                     params["red_gain"], params["green_gain"], params["blue_gain"])
+        if self.kind == "curves":
+            if "points_global" in params:
+                luts = [ImageProcessingAlgorithms.curve_lut(params[name]) for name in ("points_global", "points_shadows", "points_highlight")]
+            else:
+                luts = [np.array(params[name]) for name in ("lut_global", "lut_shadows", "lut_highlight")]
+            return functools.partial(PixelPipeline.curves_pipeline, *luts, params["channel"])
+        raise ValueError(f"{self.kind} is not a pipeline operation.")
+
+    def apply(self, image, progress_callback=None, is_cancelled=None, max_workers=None):
+        """
+        Apply the operation to a full resolution image.
+
+        Pipeline operations are rendered like ImageViewer.render_full_resolution does,
+        so a replay gives the image that was confirmed.
+
+        :param image: RGB(A) image of any working depth.
+        :param max_workers: Number of threads rendering the tiles, see TiledRenderer.
+        :return: The new image, None if the render was cancelled.
+        """
+        params = self.params
+        if self.kind == "flip":
+            return np.ascontiguousarray(image[::-1] if params["direction"] == "vertical" else image[:, ::-1])
+        if self.kind == "rotate":
+            return np.ascontiguousarray(np.rot90(image, -1 if params["angle"] == 90 else 1))
+        if self.kind == "crop":
+            x, y = max(params["x"], 0), max(params["y"], 0)
+            return image[y:params["y"] + params["height"], x:params["x"] + params["width"]].copy()
+
+        pyramid = ImagePyramid(image)
+        pipeline = self.pipeline_factory(pyramid)()
+        mask = LuminanceMask(pyramid).for_level(0) if pipeline.requires_mask() else None
+        return TiledRenderer(max_workers).render(image, pipeline, mask, progress_callback, is_cancelled)
+
+
+class HistoryEntry:
+    """An entry of the history: the operations of one edit, applied to the image of the parent entry."""
+
+    __ids = itertools.count()
+
+    def __init__(self, description, operations, parent=None):
+        self.id = next(self.__ids)
+        self.description = description
+        self.operations = list(operations)
+        self.parent = parent  # None for the original image
+
+    def depth(self):
+        """Number of entries up to the original image."""
+        depth, entry = 0, self.parent
+        while entry is not None:
+            depth, entry = depth + 1, entry.parent
+        return depth
+
+
+class EditHistory:
+    """
+    Edits of one image as operation records, rebuilt on demand from sparse checkpoints.
+
+    The entries are kept in the order they were made, the first one is the original
+    image. Every entry refers to the entry it was made on, which is not necessarily the
+    previous one, e.g. after going back in the history.
+    """
+    CHECKPOINT_INTERVAL = 4                     # Every n-th entry of a chain is checkpointed
+    DEFAULT_CHECKPOINT_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, checkpoint_bytes=DEFAULT_CHECKPOINT_BYTES):
+        self.__entries = []
+        self.__source = None  # The original image, always kept
+        self.__checkpoints = PreviewCache(checkpoint_bytes, size_of=lambda image: image.nbytes)
+        self.__checkpoint_loader = None  # Returns the stored image of an entry or None, e.g. from an autosaved session
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def entry(self, index):
+        return self.__entries[index]
+
+    def entries(self):
+        return list(self.__entries)
+
+    def index_of(self, entry):
+        return self.__entries.index(entry)
+
+    def clear(self):
+        self.__entries = []
+        self.__source = None
+        self.__checkpoints.clear()
+        self.__checkpoint_loader = None
+
+    def set_source(self, image, description="Original Image"):
+        """
+        Start a new history on an image, or replace the original image of an unedited one.
+
+        :param image: The original image, or a callable returning it when it is first needed.
+        """
+        if len(self.__entries) > 1:
+            raise ValueError("The original image of an edited history can not be replaced.")
+        self.__checkpoints.clear()
+        self.__checkpoint_loader = None
+        self.__source = image
+        self.__entries = [HistoryEntry(description, [])]
+        return self.__entries[0]
+
+    def source(self):
+        if callable(self.__source):
+            self.__source = self.__source()
+        return self.__source
+
+    def append(self, description, operations, parent=None, image=None):
+        """
+        Append the entry of an edit.
+
+        :param operations: List of EditOperation made by the edit.
+        :param parent: Entry the edit was made on, the last entry if None.
+        :param image: The resulting image or a callable returning it, if it is known. It is kept
+                      if the entry is due for a checkpoint.
+        :return: The new HistoryEntry.
+        """
+        parent = self.__entries[-1] if parent is None else parent
+        entry = HistoryEntry(description, operations, parent)
+        self.__entries.append(entry)
+        if image is not None and self.is_checkpoint(entry):
+            self.__checkpoints.put(entry.id, image() if callable(image) else image)
+        return entry
+
+    def is_checkpoint(self, entry):
+        return entry.depth() % self.CHECKPOINT_INTERVAL == 0
+
+    def checkpoint(self, entry):
+        """Return the cached image of an entry, None if it is not cached."""
+        return self.__checkpoints.get(entry.id)
+
+    def set_checkpoint_loader(self, loader):
+        """
+        Set a fallback for checkpoints that are not cached, e.g. images stored on disk.
+
+        :param loader: Called with a HistoryEntry, returns its image or None.
+        """
+        self.__checkpoint_loader = loader
+
+    def remove(self, index):
+        """
+        Remove an entry, the original image can not be removed.
+
+        The entries made on it are moved to its parent and get its operations prepended,
+        so their images stay the same.
+        """
+        if index < 1:
+            raise ValueError("The original image can not be removed from the history.")
+        removed = self.__entries.pop(index)
+        for entry in self.__entries:
+            if entry.parent is removed:
+                entry.parent = removed.parent
+                entry.operations = removed.operations + entry.operations
+                self.__checkpoints.pop(entry.id)  # Its depth changed
+        self.__checkpoints.pop(removed.id)
+
+    def operations_to(self, entry):
+        """Return the operations from the original image to an entry, e.g. for an edit recipe."""
+        chain = []
+        while entry is not None:
+            chain.append(entry)
+            entry = entry.parent
+        return [operation for entry in reversed(chain) for operation in entry.operations]
+
+    def image_at(self, index, progress_callback=None, is_cancelled=None):
+        """
+        Return the image of an entry, replayed from the nearest checkpoint.
+
+        :param progress_callback: Called with (replayed operations, operations to replay).
+        :param is_cancelled: Returns True to stop the replay.
+        :return: The image, None if the replay was cancelled.
+        """
+        entry = self.__entries[index]
+
+        # Walk up to the nearest cached image
+        chain = []
+        image = None
+        while entry is not None:
+            image = self.source() if entry.parent is None else self.__checkpoints.get(entry.id)
+            if image is None and entry.parent is not None and self.__checkpoint_loader is not None:
+                image = self.__checkpoint_loader(entry)
+                if image is not None:
+                    self.__checkpoints.put(entry.id, image)
+            if image is not None:
+                break
+            chain.append(entry)
+            entry = entry.parent
+
+        operations = [(entry, operation) for entry in reversed(chain) for operation in entry.operations]
+        for replayed, (entry, operation) in enumerate(operations, start=1):
+            image = operation.apply(image, is_cancelled=is_cancelled)
+            if image is None:
+                return None
+            if progress_callback is not None:
+                progress_callback(replayed, len(operations))
+            if operation is entry.operations[-1] and self.is_checkpoint(entry):
+                self.__checkpoints.put(entry.id, image)
+        return image
+
+    def checkpoint_bytes(self):
+        return self.__checkpoints.total_bytes()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the edit recipes, the edits of an image saved next to it.
+
+A recipe is a small versioned JSON sidecar, <image>.vsl.json, with the operations that
+turn the original image into the edited one, see EditOperation. No rendered image is
+stored: the edited image is rendered from the original when the recipe is loaded, at
+the resolution of the original it is applied to.
+
+The geometric operations of a recipe only change the view on the image they are applied
+to, and each adjustment is rendered tile by tile on its full resolution input, so a
+recipe renders exactly like a replay of the edit history.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from src.EditHistory import EditOperation
+from src.util.SessionAutosave import write_atomically
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "visualysium-recipe"
+FORMAT_VERSION = 1
+SIDECAR_SUFFIX = ".vsl.json"
+
+
+def sidecar_path(image_path):
+    return image_path + SIDECAR_SUFFIX
+
+
+def write_recipe(image_path, operations, source_width, source_height):
+    """
+    Write the recipe of an image, replacing the previous one.
+
+    :param operations: EditOperations from the original image to the edited one.
+    :param source_width: Width of the original image the operations were made on, see render_recipe.
+    """
+    recipe = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "source": {"file": os.path.basename(image_path), "width": source_width, "height": source_height},
+        "operations": [operation.to_dict() for operation in operations],
+    }
+    write_atomically(sidecar_path(image_path), json.dumps(recipe, separators=(",", ":")).encode("utf-8"))
+
+
+def read_recipe(image_path):
+    """
+    Read the recipe of an image.
+
+    :return: (list of EditOperation, (source width, source height)), None if there is no
+             readable recipe of a supported version.
+    """
+    try:
+        with open(sidecar_path(image_path), "r", encoding="utf-8") as file:
+            recipe = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to read the edit recipe of %s: %s", image_path, e)
+        return None
+
+    if recipe.get("format") != FORMAT_NAME or recipe.get("version", 0) > FORMAT_VERSION:
+        logger.warning("The edit recipe of %s has an unsupported format.", image_path)
+        return None
+    source = recipe["source"]
+    return [EditOperation.from_dict(operation) for operation in recipe["operations"]], (source["width"], source["height"])
+
+
+def remove_recipe(image_path):
+    if os.path.exists(sidecar_path(image_path)):
+        os.remove(sidecar_path(image_path))
+
+
+def scale_operations(operations, scale):
+    """Return the operations for an original image scaled by the given factor, e.g. a RAW file developed at another size."""
+    if scale == 1.0:
+        return list(operations)
+    scaled = []
+    for operation in operations:
+        if operation.kind == "crop":
+            operation = EditOperation("crop", **{name: round(value * scale) for name, value in operation.params.items()})
+        scaled.append(operation)
+    return scaled
+
+
+def geometric_view(operation, image):
+    """Apply a geometric operation as a view, without copying the pixels, see EditOperation.apply."""
+    params = operation.params
+    if operation.kind == "flip":
+        return image[::-1] if params["direction"] == "vertical" else image[:, ::-1]
+    if operation.kind == "rotate":
+        return np.rot90(image, -1 if params["angle"] == 90 else 1)
+    if operation.kind == "crop":
+        x, y = params["x"], params["y"]
+        right, bottom = x + params["width"], y + params["height"]
+        return image[max(y, 0):max(bottom, 0), max(x, 0):max(right, 0)]
+    raise ValueError(f"{operation.kind} is not a geometric operation.")
+
+
+def render_recipe(image, operations, source_size=None, progress_callback=None, is_cancelled=None, max_workers=None):
+    """
+    Render the operations of a recipe on an original image.
+
+    Each adjustment is rendered like EditOperation.apply does, with the statistics of its
+    full resolution input, so the result equals a replay of the edit history.
+
+    :param image: The original RGB(A) image of any working depth.
+    :param source_size: (width, height) of the original the operations were made on, see scale_operations.
+    :param progress_callback: Called with (finished steps, number of steps), the tiles of all adjustments.
+    :param is_cancelled: Returns True to stop the render.
+    :return: The edited image, None if the render was cancelled.
+    """
+    if source_size is not None:
+        operations = scale_operations(operations, image.shape[1] / source_size[0])
+
+    adjustments = sum(operation.is_pipeline() for operation in operations)
+    finished_adjustments = 0
+
+    def report_progress(finished, total):
+        # Every adjustment takes the same share of the progress, whatever its number of tiles
+        progress_callback(finished_adjustments * total + finished, adjustments * total)
+
+    for operation in operations:
+        if not operation.is_pipeline():
+            # A view until the next adjustment, the pixels are not copied
+            image = geometric_view(operation, image)
+            continue
+        image = operation.apply(np.ascontiguousarray(image), report_progress if progress_callback else None, is_cancelled, max_workers)
+        if image is None:
+            return None
+        finished_adjustments += 1
+    return np.ascontiguousarray(image)
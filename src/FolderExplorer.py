@@ -1,4 +1,5 @@
 
+import logging
 import os
 import sys
 from PyQt6.QtCore import Qt, QModelIndex, QDir, QSize, pyqtSignal, pyqtSlot, QThread
@@ -7,6 +8,9 @@ from PyQt6.QtWidgets import QApplication, QPushButton, QVBoxLayout, QLineEdit, Q
 
 from src.ImageProcessingAlgorithms import supported_extensions
 from src.util.FileSystemModelImagesOnly import FileSystemModelImagesOnly
+from src.util.ThumbnailDiskCache import ThumbnailDiskCache
+
+logger = logging.getLogger(__name__)
 # supported_extensions_list = [ext.replace('*.', '') for ext in raw_extensions]
 
 
@@ -14,13 +18,14 @@ class FolderExplorer(QWidget):
     show_image = pyqtSignal(str)
     path_updated = pyqtSignal(str)
 
-    def __init__(self, dir_path):
+    def __init__(self, dir_path, thumbnail_cache_bytes=ThumbnailDiskCache.DEFAULT_MAX_BYTES):
         super().__init__()
         
         self.__grid_size = QSize(140, 140)  # Initial grid size
 
         self.__path = dir_path
-        self.__files = FileSystemModelImagesOnly()
+        self.__thumbnail_cache = ThumbnailDiskCache(max_bytes=thumbnail_cache_bytes)
+        self.__files = FileSystemModelImagesOnly(diskCache=self.__thumbnail_cache)
         self.__files.setRootPath(self.__path)
 
         self.__view = QListView()
@@ -76,8 +81,23 @@ class FolderExplorer(QWidget):
 
         self.__view.doubleClicked.connect(self.on_double_clicked)
 
+        # Thumbnails of items scrolled out of view are not decoded
+        self.__view.verticalScrollBar().valueChanged.connect(self.drop_hidden_previews)
+
+    def image_paths(self):
+        """Return the paths of the images of the current folder, in the order they are shown."""
+        root_index = self.__view.rootIndex()
+        indexes = (self.__files.index(row, 0, root_index) for row in range(self.__files.rowCount(root_index)))
+        return [self.__files.filePath(index) for index in indexes if not self.__files.isDir(index)]
+
+    def drop_hidden_previews(self):
+        viewport_rect = self.__view.viewport().rect()
+        hidden_paths = [path for path in self.__files.pending_previews()
+                        if not self.__view.visualRect(self.__files.index(path)).intersects(viewport_rect)]
+        self.__files.drop_previews(hidden_paths)
+
     def update_colors(self):
-        print("Setting palette")
+        logger.debug("Setting palette")
         palette = QApplication.instance().palette()
         self.setStyleSheet(f"background-color: {palette.color(QPalette.ColorRole.Base).name()};")
         # Add more style changes as needed based on the widget's components
@@ -137,7 +157,7 @@ class FolderExplorer(QWidget):
         self.show_image.emit(file_path)    
     
     def keyPressEvent(self, event):
-        print("keyPressEvent : ", event.key())
+        logger.debug("keyPressEvent: %s", event.key())
 
         if event.key() == Qt.Key.Key_Return:
             index = self.__view.currentIndex()
@@ -1,21 +1,59 @@
-from PyQt6.QtWidgets import QApplication, QGridLayout, QLabel, QListWidget, QListWidgetItem, QWidget, QSizePolicy, QVBoxLayout, QMenu
-from PyQt6.QtGui import QPixmap, QIcon
+import functools
+import logging
+
+from PyQt6.QtWidgets import QApplication, QGridLayout, QLabel, QListWidget, QListWidgetItem, QWidget, QSizePolicy, QVBoxLayout, QMenu, QProgressDialog
+from PyQt6.QtGui import QPixmap, QImage, QIcon, QShortcut, QKeySequence
 from PyQt6.QtCore import pyqtSlot, pyqtSignal, Qt, QSize
 from src.ImageViewer import ImageViewer
+from src.EditHistory import EditHistory
+import src.EditRecipe as EditRecipe
+from src.RenderWorker import RenderWorker
 from src.WidgetUtils import HoverButton
 from src.WindowCropping import WindowCropping
 
 from src.WindowLighting import WindowLighting
 from src.WindowColors import WindowColors
 from src.WindowCurveAdjustement import WindowCurveAdjustement
+from src.util.ImagePrefetcher import ImagePrefetcher
+from src.util.RawDeveloper import RawDeveloper
+from src.util.HistoryThumbnailer import HistoryThumbnailer
+from src.util.SessionAutosave import SessionAutosave
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+logger = logging.getLogger(__name__)
 
 class ImageViewerWindow(QWidget):
+    PREFETCH_DEPTH = 2  # Number of images decoded ahead in each direction
 
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Image Viewer Window")
       
         self.__image_viewer = ImageViewer()
+
+        # Images of the folder for next/previous navigation, neighbours are decoded ahead
+        self.__image_paths = []
+        self.__image_index = -1
+        self.__prefetch_depth = self.PREFETCH_DEPTH
+        self.__prefetcher = ImagePrefetcher(raw_profile=ImageProcessingAlgorithms.RAW_PROFILE_EMBEDDED, parent=self)
+
+        # RAW files are shown from their embedded preview first, the full quality decode replaces it
+        self.__image_path = None
+        self.__is_edited = False
+        self.__raw_developer = RawDeveloper(parent=self)
+        self.__raw_developer.developed.connect(self.raw_developed)
+        self.__full_quality_image = None  # Full quality decode of an edited RAW file, the exports replay the edits on it
+        self.__image_viewer.set_export_renderer(self.__render_full_quality)
+
+        # Edits are kept as operations, an entry of the history is replayed when it is shown
+        self.__history = EditHistory()
+        self.__current_entry = None  # Entry shown in the viewer, new edits are made on it
+        self.__source_profile = None  # RAW profile the source of the history was decoded with, None for other files
+        self.__source_size = (0, 0)   # Size of the source of the history, the recipes are saved for
+        # The edits of a recipe are rendered in the background, the original is shown meanwhile
+        self.__recipe_worker = RenderWorker(parent=self)
+        self.__recipe_worker.frame_ready.connect(self.recipe_rendered)
+        self.__autosave = SessionAutosave(parent=self)
         
         self.__history_widget = HistoryWidget()  # Create instance of HistoryWidget
         self.__buttons_layer = ImageEditor_ButtonLayout()
@@ -58,6 +96,9 @@ class ImageViewerWindow(QWidget):
         self.__buttons_layer.button_histogram_clicked.connect(self.__image_viewer.toggle_info_display)
         self.__history_widget.show_image_requested.connect(self.show_image_from_history)
         self.__history_widget.delete_image_requested.connect(self.delete_image_from_history)
+
+        QShortcut(QKeySequence(Qt.Key.Key_Right), self, self.show_next_image)
+        QShortcut(QKeySequence(Qt.Key.Key_Left), self, self.show_previous_image)
         
         # Adjust window size to half of the screen size
         screen = QApplication.primaryScreen()
@@ -82,21 +123,264 @@ class ImageViewerWindow(QWidget):
         self.__image_viewer.keyPressEvent(event)
         super().keyPressEvent(event)
         
-    def show_image_from_history(self, pixmap):
-        self.__image_viewer.show_pixmap(pixmap)  # Assuming your ImageViewer widget has a method to set a QPixmap
+    def show_image_from_history(self, row):
+        entry = self.__history.entry(row)
+        if entry is self.__current_entry:
+            return
+
+        # The dialog shows up only if replaying takes longer than its minimum duration
+        progress_dialog = QProgressDialog("Rebuilding the image...", "Cancel", 0, 100, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def show_progress(replayed, number_of_operations):
+            progress_dialog.setValue(int(100 * replayed / number_of_operations))
+
+        image = self.__history.image_at(row, show_progress, progress_dialog.wasCanceled)
+        progress_dialog.close()
+        if image is None:
+            logger.info("Showing the history entry has been cancelled.")
+            return
+
+        self.__image_viewer.show_working_image(image)
+        self.__current_entry = entry
+        self.__autosave_session()
+        self.__save_recipe()
 
     def delete_image_from_history(self, index):
-        # Handle the deletion of an image from the history
-        print(f"Image at index {index} has been requested to delete")
+        entry = self.__history.entry(index)
+        self.__history.remove(index)
+        if entry is self.__current_entry:
+            self.__current_entry = None  # The widget requests a neighbour entry next
+        else:
+            self.__save_recipe()  # The operations of the removed entry may have moved onto the shown one
+        self.__autosave_session()
+
+    def __autosave_session(self):
+        if len(self.__history) > 1:
+            self.__autosave.schedule(self.__session_state)
+        else:
+            self.__autosave.clear()
+
+    def __session_state(self):
+        thumbnails = [self.__history_widget.thumbnail(row) for row in range(len(self.__history))]
+        return self.__image_path, self.__source_profile, self.__history, self.__current_entry, thumbnails
+
+    def has_autosaved_session(self):
+        return self.__autosave.load() is not None
+
+    def discard_session(self):
+        self.__autosave.clear()
+
+    def restore_session(self):
+        """
+        Restore the edits of the autosaved session, see SessionAutosave.
+
+        Only the source image is decoded, the shown entry is replayed from the nearest stored checkpoint.
+
+        :return: False if there is no session to restore.
+        """
+        record = self.__autosave.load()
+        if record is None:
+            return False
+
+        image_path = record["image_path"]
+        self.__image_index = self.__image_paths.index(image_path) if image_path in self.__image_paths else -1
+        self.__image_path = image_path
+        self.__is_edited = True
+        self.__source_profile = record["raw_profile"]
+        self.__full_quality_image = None
+        self.__recipe_worker.cancel()
+        # The edits of a session made on a RAW preview are exported from the full quality decode
+        is_preview = self.__source_profile not in (None, ImageProcessingAlgorithms.RAW_PROFILE_FULL)
+        if is_preview:
+            self.__raw_developer.develop(image_path)
+        else:
+            self.__raw_developer.cancel()
+
+        self.__history_widget.clearHistory()
+        image = ImageProcessingAlgorithms.load_image_to_qimage(image_path, self.__source_profile or ImageProcessingAlgorithms.RAW_PROFILE_FULL)
+        self.__image_viewer.open_new_image(image_path, image, is_preview=is_preview)
+        self.__image_viewer.show_image_fit_to_screen()
+
+        pixmap = self.__image_viewer.get_current_pixmap()
+        self.__source_size = (pixmap.width(), pixmap.height())
+        self.__history.clear()
+        current_entry, thumbnails = self.__autosave.restore(record, self.__history, self.__working_image(pixmap))
+        self.__current_entry = self.__history.entry(0)
+        self.__history_widget.update_history_list(self.__thumbnail_source(pixmap), self.__current_entry.description)
+        for entry, thumbnail in zip(self.__history.entries()[1:], thumbnails[1:]):
+            self.__history_widget.update_history_list(None if thumbnail.isNull() else thumbnail, entry.description)
+
+        self.show_image_from_history(self.__history.index_of(current_entry))
+        self.__image_viewer.show_image_initial_size()
+        return True
+
+    def set_image_list(self, image_paths):
+        self.__image_paths = list(image_paths)
+        self.__image_index = -1
+
+    def set_prefetch_depth(self, depth):
+        self.__prefetch_depth = depth
+        self.__prefetch_neighbours()
+
+    def show_next_image(self):
+        if self.__image_index + 1 < len(self.__image_paths):
+            self.show_new_image(self.__image_paths[self.__image_index + 1])
+
+    def show_previous_image(self):
+        if self.__image_index > 0:
+            self.show_new_image(self.__image_paths[self.__image_index - 1])
+
+    def __prefetch_neighbours(self):
+        if self.__image_index < 0:
+            self.__prefetcher.cancel()
+            return
+
+        # Next image first, the user is more likely to move forward
+        paths = []
+        for distance in range(1, self.__prefetch_depth + 1):
+            for index in (self.__image_index + distance, self.__image_index - distance):
+                if 0 <= index < len(self.__image_paths):
+                    paths.append(self.__image_paths[index])
+        self.__prefetcher.prefetch(paths)
 
     def show_new_image(self,image_path):
+        self.__image_index = self.__image_paths.index(image_path) if image_path in self.__image_paths else -1
+        # Taken before the neighbours are prefetched, a decode of this image in flight is not cancelled
+        image = self.__prefetcher.load(image_path)
+        self.__prefetch_neighbours()
+
+        if self.__is_edited:
+            self.__autosave.clear()
+        self.__image_path = image_path
+        self.__is_edited = False
+        self.__full_quality_image = None
+        is_raw = ImageProcessingAlgorithms.is_raw_file(image_path)
+        if is_raw:
+            self.__raw_developer.develop(image_path)
+        else:
+            self.__raw_developer.cancel()
+        self.__source_profile = ImageProcessingAlgorithms.RAW_PROFILE_EMBEDDED if is_raw else None
+
         self.__history_widget.clearHistory()
-        self.__image_viewer.open_new_image(image_path)
+        self.__image_viewer.open_new_image(image_path, image, is_preview=is_raw)
         self.__image_viewer.show_image_fit_to_screen()
         # self.__image_viewer.open_new_image(image_path)
-        self.__history_widget.update_history_list(self.__image_viewer.get_current_pixmap(), "Original Image")
+        self.__start_history()
         self.__image_viewer.show_image_initial_size()
 
+    def raw_developed(self, image_path, image):
+        if image_path != self.__image_path:
+            return
+        if self.__is_edited or len(self.__history) > 1:
+            # Edits already made or restored on the preview are kept, the exports render them on this decode
+            self.__full_quality_image = image
+            return
+        self.__image_viewer.replace_original_image(image)
+        self.__source_profile = ImageProcessingAlgorithms.RAW_PROFILE_FULL
+        self.__start_history()
+
+    def __start_history(self):
+        """Start the history on the image shown in the viewer, followed by the edits of its recipe if it has one."""
+        pixmap = self.__image_viewer.get_current_pixmap()
+        self.__source_size = (pixmap.width(), pixmap.height())
+        self.__history.clear()  # The history of the previous image, it may be edited
+        # The array of the pyramid of the viewer, it is not converted from the pixmap again
+        source = self.__image_viewer.get_original_image()
+        self.__current_entry = self.__history.set_source(source if source is not None else self.__working_image(pixmap))
+        self.__history_widget.clearHistory()
+        self.__history_widget.update_history_list(self.__thumbnail_source(pixmap), self.__current_entry.description)
+
+        self.__recipe_worker.cancel()  # The recipe of the previous image
+        recipe = EditRecipe.read_recipe(self.__image_path)
+        if recipe is not None:
+            operations, source_size = recipe
+            self.__render_recipe(EditRecipe.scale_operations(operations, self.__source_size[0] / source_size[0]))
+
+    def __render_recipe(self, operations):
+        """Render the edits of a recipe on the original image on a worker thread, see recipe_rendered."""
+        if not operations:
+            return
+        source = self.__history.source()
+
+        def render(is_outdated):
+            image = EditRecipe.render_recipe(source, operations, is_cancelled=is_outdated)
+            return None if image is None else (operations, image)
+
+        self.__recipe_worker.submit(render)
+
+    def recipe_rendered(self, generation, result):
+        """Add the rendered recipe as a "Saved Edits" entry, shown unless the original is being edited or left by now."""
+        if not self.__recipe_worker.is_latest(generation):
+            return  # Another image was opened in the meantime
+        operations, image = result
+
+        # The recipe is not an edit of this session, it is made on the original
+        original = self.__history.entry(0)
+        entry = self.__history.append("Saved Edits", operations, parent=original, image=image)
+        is_editing = any(window.isVisible() for window in (self.__crop_window, self.__lighting_window, self.__colors_window, self.__curve_editing))
+        if self.__current_entry is original and not is_editing:
+            self.__current_entry = entry
+            thumbnail_source = self.__thumbnail_source(self.__image_viewer.show_working_image(image))
+        else:
+            thumbnail_source = image
+        self.__history_widget.update_history_list(thumbnail_source, entry.description)
+
+    def __render_full_quality(self):
+        """
+        Replay the edits of the shown entry on the full quality decode of the RAW file,
+        see ImageViewer.set_export_renderer.
+
+        :return: The edited image, None if it was cancelled.
+        """
+        if self.__full_quality_image is None:
+            self.__full_quality_image = ImageProcessingAlgorithms.load_image_to_qimage(self.__image_path, ImageProcessingAlgorithms.RAW_PROFILE_FULL)
+            if self.__full_quality_image is None:
+                logger.error("Failed to decode %s at full quality.", self.__image_path)
+                return None
+
+        progress_dialog = QProgressDialog("Rendering the edits at full quality...", "Cancel", 0, 100, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def show_progress(rendered, number_of_tiles):
+            progress_dialog.setValue(int(100 * rendered / number_of_tiles))
+
+        # The operations were made on the preview, the crop rectangles are scaled to the decode
+        image = EditRecipe.render_recipe(ImageProcessingAlgorithms.convert_qimage_to_array(self.__full_quality_image),
+                                         self.__history.operations_to(self.__current_entry), self.__source_size,
+                                         show_progress, progress_dialog.wasCanceled)
+        progress_dialog.close()
+        if image is None:
+            logger.info("Rendering the edits at full quality has been cancelled.")
+        return image
+
+    def __save_recipe(self):
+        """Write the operations of the shown entry as the recipe of the image, remove the recipe for the original."""
+        operations = self.__history.operations_to(self.__current_entry)
+        try:
+            if operations:
+                EditRecipe.write_recipe(self.__image_path, operations, *self.__source_size)
+            else:
+                EditRecipe.remove_recipe(self.__image_path)
+        except OSError as e:
+            logger.error("Failed to save the edit recipe: %s", e)
+
+    def __thumbnail_source(self, pixmap):
+        icon_size = HistoryWidget.ICON_SIZE
+        return self.__image_viewer.get_thumbnail_source(pixmap, icon_size.width(), icon_size.height())
+
+    def __working_image(self, pixmap):
+        """
+        Return the high bit depth data of a pixmap if it is known, otherwise a callable
+        converting the pixmap, so it is only done if the image is needed.
+        """
+        working_image = ImageViewer.WORKING_IMAGES.get(pixmap.cacheKey())
+        if working_image is not None:
+            return working_image
+        return functools.partial(self.__image_viewer.convert_pixmap_to_opencv_image, pixmap)
+
     def crop_button_clicked(self):
         self.__crop_window.show()
         self.__crop_window.set_image(self.__image_viewer.get_current_pixmap())
@@ -113,17 +397,39 @@ class ImageViewerWindow(QWidget):
         self.__curve_editing.show()
         self.__curve_editing.set_image(self.__image_viewer.get_current_pixmap())
 
-    def editing_confirmed(self, pixmap, description):
-        print("Editing confirmed!")
+    def editing_confirmed(self, pixmap, description, operations):
+        logger.info("Editing confirmed: %s", description)
+        self.__is_edited = True
+
+        # Geometric edits are made on the 8 bit pixmap, apply them to the high bit depth data of the edited image
+        if ImageViewer.WORKING_IMAGES.get(pixmap.cacheKey()) is None and not any(operation.is_pipeline() for operation in operations):
+            working_image = ImageViewer.WORKING_IMAGES.get(self.__image_viewer.get_current_pixmap().cacheKey())
+            if working_image is not None:
+                for operation in operations:
+                    working_image = operation.apply(working_image)
+                ImageViewer.WORKING_IMAGES.put(pixmap.cacheKey(), working_image)
+
+        self.__current_entry = self.__history.append(description, operations, parent=self.__current_entry,
+                                                     image=self.__working_image(pixmap))
         self.__image_viewer.show_pixmap(pixmap)
-        self.__history_widget.update_history_list(pixmap, description)
+        self.__history_widget.update_history_list(self.__thumbnail_source(pixmap), description)
+        self.__autosave_session()
+        self.__save_recipe()
 
         # print(f"Rectangle Coordinates: Top Left ({rect.topLeft().x()}, {rect.topLeft().y()}) - Bottom Right ({rect.bottomRight().x()}, {rect.bottomRight().y()})")
         # print(f"Rectangle Size: Width {rect.width()} - Height {rect.height()}")
 
 class HistoryWidget(QWidget):
-    show_image_requested = pyqtSignal(QPixmap)
+    """
+    List of the edits as thumbnails. The images are kept by EditHistory, the entries are
+    requested by their row.
+
+    The list only holds the thumbnails, they are scaled down on a worker thread from the
+    image given to update_history_list, see HistoryThumbnailer.
+    """
+    show_image_requested = pyqtSignal(int)
     delete_image_requested = pyqtSignal(int)
+    ICON_SIZE = QSize(300, 100)
 
     def __init__(self):
         super().__init__()
@@ -134,35 +440,53 @@ class HistoryWidget(QWidget):
 
         self.__history_list_widget = QListWidget()
         self.__history_list_widget.setViewMode(QListWidget.ViewMode.IconMode)
-        self.__history_list_widget.setIconSize(QSize(300, 100))
+        self.__history_list_widget.setIconSize(self.ICON_SIZE)
         self.__history_list_widget.setWordWrap(True)
         self.__history_list_widget.setSpacing(10)
 
         layout.addWidget(self.__history_list_widget)
-        self.__original_pixmaps = []  # List to store original pixmaps
+        self.__thumbnailer = HistoryThumbnailer(self.ICON_SIZE.width(), self.ICON_SIZE.height(), parent=self)
+        self.__thumbnailer.thumbnail_ready.connect(self.thumbnail_ready)
         # Connect the itemDoubleClicked signal to a slot
         self.__history_list_widget.itemDoubleClicked.connect(self.onItemDoubleClicked)
     
     def clearHistory(self):
+        self.__thumbnailer.drop_all()
         self.__history_list_widget.clear()
-        for pix in self.__original_pixmaps:
-            del pix # Also remove the pixmap reference
-        self.__original_pixmaps = []
-
-    def update_history_list(self, pixmap, description:str=""):
-        self.__original_pixmaps.append(pixmap)  # Store the original pixmap
-        # icon = QIcon(pixmap.scaled(100, 100, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))  # Scale for display
-        # item = QListWidgetItem(icon, description)
-        item = QListWidgetItem(QIcon(pixmap), description)
+
+    def update_history_list(self, image, description:str=""):
+        """
+        Add an entry to the list.
+
+        :param image: Image the thumbnail is made from, see HistoryThumbnailer.request, None for no thumbnail.
+        """
+        item = QListWidgetItem(QIcon(), description)
+        if image is not None:
+            item.setData(Qt.ItemDataRole.UserRole, self.__thumbnailer.request(image))
         item.setToolTip(description)
         item.setSizeHint(QSize(200, 120))
         item.setTextAlignment(Qt.AlignmentFlag.AlignHCenter)
         self.__history_list_widget.addItem(item)
             
+    def thumbnail(self, row):
+        """Return the thumbnail of an entry, a null image if it is not ready."""
+        item = self.__history_list_widget.item(row)
+        if item is None or item.icon().isNull():
+            return QImage()
+        icon = item.icon()
+        return icon.pixmap(icon.availableSizes()[0]).toImage()
+
+    def thumbnail_ready(self, key, thumbnail):
+        for row in range(self.__history_list_widget.count()):
+            item = self.__history_list_widget.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == key:
+                item.setIcon(QIcon(QPixmap.fromImage(thumbnail)))
+                return
+
     def onItemDoubleClicked(self, item):
         row = self.__history_list_widget.row(item)
         if row != -1:
-            self.show_image_requested.emit(self.__original_pixmaps[row])
+            self.show_image_requested.emit(row)
 
     def contextMenuEvent(self, event):
         context_menu = QMenu(self)
@@ -181,16 +505,16 @@ class HistoryWidget(QWidget):
 
         if action == show_action:
             if row != -1:
-                self.show_image_requested.emit(self.__original_pixmaps[row])
+                self.show_image_requested.emit(row)
         elif action == delete_action:
             if row != -1:
                 self.delete_image_requested.emit(row)
-                self.__history_list_widget.takeItem(row)
-                del self.__original_pixmaps[row]  # Also remove the pixmap reference
+                item = self.__history_list_widget.takeItem(row)
+                self.__thumbnailer.drop([item.data(Qt.ItemDataRole.UserRole)])
                 if row < self.__history_list_widget.count(): 
-                    self.show_image_requested.emit(self.__original_pixmaps[row])
+                    self.show_image_requested.emit(row)
                 else:
-                    self.show_image_requested.emit(self.__original_pixmaps[row-1])
+                    self.show_image_requested.emit(row-1)
 
 
 class ImageEditor_ButtonLayout(QWidget):
@@ -31,17 +31,23 @@ __author__ = "Ali Karaoglu"
 __version__ = "0.0.0"
 __date__ = "2024-04-10"
 
+import logging
 import os
 import sys
+import struct
 import cv2
 import numpy as np
 import OpenEXR
 import Imath
 import rawpy
-from PyQt6.QtGui import QImage, QImageReader
-from numpy.lib.stride_tricks import as_strided
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from PyQt6.QtGui import QImage, QImageReader, QImageIOHandler, QTransform
+from PyQt6.QtCore import Qt, QSize, QBuffer, QByteArray, QIODevice
+from PyQt6 import sip
+from scipy.interpolate import interp1d
+
+import src.util.Instrumentation as Instrumentation
+
+logger = logging.getLogger(__name__)
 
 supportedFormats = QImageReader.supportedImageFormats()
 # text_filter = "Images ({})".format(" ".join(["*.{}".format(fo.data().decode()) for fo in supportedFormats]))
@@ -240,108 +246,204 @@ def linear_interpolation(kelvin_value):
     return (int(round(r)), int(round(g)), int(round(b)))
 
 
-def convert_array_to_qimage(array):
+class QImageBuffer:
+    """
+    Expose the pixels of a QImage to NumPy without copying.
+
+    np.asarray(QImageBuffer(...)) returns a read-only view whose base is the buffer
+    object, so the QImage stays alive as long as any view on its pixels exists.
+    """
+
+    def __init__(self, image, channels, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        self.image = image
+        self.__array_interface__ = {
+            "version": 3,
+            "typestr": dtype.str,
+            "shape": (image.height(), image.width(), channels),
+            "strides": (image.bytesPerLine(), channels * dtype.itemsize, dtype.itemsize),
+            "data": (int(image.constBits()), True),
+        }
+
+# QImage formats of the arrays of each dtype: (RGB format, RGBA format). High bit depth
+# formats have no 3 channel layout, RGB arrays are padded with an opaque fourth channel.
+qimage_formats = {
+    np.dtype(np.uint8): (QImage.Format.Format_RGB888, QImage.Format.Format_RGBA8888),
+    np.dtype(np.uint16): (QImage.Format.Format_RGBX64, QImage.Format.Format_RGBA64),
+    np.dtype(np.float16): (QImage.Format.Format_RGBX16FPx4, QImage.Format.Format_RGBA16FPx4),
+    np.dtype(np.float32): (QImage.Format.Format_RGBX32FPx4, QImage.Format.Format_RGBA32FPx4),
+}
+
+# Formats converted before their pixels are exposed, e.g. premultiplied alpha.
+qimage_conversions = {
+    QImage.Format.Format_Grayscale16: QImage.Format.Format_RGBX64,
+    QImage.Format.Format_RGBA64_Premultiplied: QImage.Format.Format_RGBA64,
+    QImage.Format.Format_RGBA16FPx4_Premultiplied: QImage.Format.Format_RGBA16FPx4,
+    QImage.Format.Format_RGBA32FPx4_Premultiplied: QImage.Format.Format_RGBA32FPx4,
+}
+
+def is_high_bit_depth(image):
+    """Return True if a QImage has more than 8 bits per channel, see qimage_formats."""
+    high_bit_formats = [format_ for dtype, formats in qimage_formats.items() if dtype != np.uint8 for format_ in formats]
+    return image.format() in high_bit_formats or image.format() in qimage_conversions
+
+def max_value(dtype):
+    """Return the value of full intensity of an image dtype, 1.0 for float images."""
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).max
+    return 1.0
+
+def to_float32(image):
+    """
+    Convert an image to float32 with full intensity at 1.0.
+
+    :param image: uint8, uint16 or float image.
+    :return: float32 image, the input itself if it is float32 already.
+    """
+    if image.dtype == np.float32:
+        return image
+    if np.issubdtype(image.dtype, np.integer):
+        return np.multiply(image, np.float32(1.0 / max_value(image.dtype)), dtype=np.float32)
+    return image.astype(np.float32)
+
+def from_float32(image, dtype):
+    """
+    Convert a float image with full intensity at 1.0 to the given dtype.
+
+    Integer types are clipped to their range and rounded, float types keep the values
+    above 1.0.
+    """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        scaled = np.multiply(image, np.float32(max_value(dtype)), dtype=np.float32)
+        np.clip(scaled, 0, max_value(dtype), out=scaled)
+        scaled += 0.5
+        return scaled.astype(dtype)
+    return image.astype(dtype, copy=False)
+
+def to_display_uint8(image):
+    """
+    Convert an image of any working depth to uint8 for display, values are clipped between 0 and full intensity.
+
+    Tone mapping of the HDR range belongs before this step, it only quantizes.
+    """
+    if image.dtype == np.uint8:
+        return image
+    if image.dtype == np.uint16:
+        return cv2.convertScaleAbs(image, alpha=1 / 257.0)  # Rounded and saturated by OpenCV
+    return from_float32(image, np.uint8)
+
+def convert_array_to_qimage(array, copy=True):
         """Convert an array-like image to a QImage in PyQt6.
 
-        The created QImage is using a copy of the array data.
+        By default the QImage owns a copy of the pixels. Without copy, the QImage wraps
+        the memory of the array and only its Python wrapper keeps a reference to the
+        array: Qt-side copies of the QImage, e.g. sent by a queued signal declared with
+        QImage or stored by Qt, point at freed memory once the wrapper is gone, and the
+        array must not be modified while the QImage is in use. Only pass copy=False if
+        the QImage is used while the wrapper is referenced, e.g. by QPixmap.fromImage
+        right away, which always converts the formats used here to the native pixmap
+        format, so pixmaps never share the array.
 
-        Limitation: Only RGB or RGBA images with 8 bits per channel are supported.
+        uint8, uint16, float16 and float32 arrays keep their depth, see qimage_formats.
+        Other types are converted to uint8. High bit depth RGB arrays are copied into a
+        padded 4 channel buffer, as are arrays whose pixels are not packed within the rows.
 
         :param array: Array-like image data of shape (height, width, channels)
                     Channels are expected to be either RGB or RGBA.
-        :type array: numpy.ndarray of uint8
-        :return: Corresponding Qt image with RGB888 or ARGB32 format.
+        :type array: numpy.ndarray
+        :param copy: Return a QImage owning a copy of the data, False to wrap the array.
+        :return: Corresponding Qt image, e.g. with RGB888 or RGBA8888 format for uint8 arrays.
         :rtype: QImage
         """
-        array = np.array(array, copy=False, order='C', dtype=np.uint8)
+        array = np.asarray(array)
+        if array.dtype not in qimage_formats:
+            array = array.astype(np.uint8)
 
         if array.ndim != 3 or array.shape[2] not in (3, 4):
             raise ValueError('Image must be a 3D array with 3 or 4 channels per pixel.')
 
-        if array.shape[2] == 4:
-            format_ = QImage.Format.Format_ARGB32
-            # RGBA -> ARGB + take care of endianness
-            if sys.byteorder == 'little':  # RGBA -> BGRA
-                array = array[:, :, (2, 1, 0, 3)]
-            else:  # big endian: RGBA -> ARGB
-                array = array[:, :, (3, 0, 1, 2)]
-
-            array = np.require(array, requirements=['C', 'A'])  # Ensure array is C-contiguous and aligned
-
-        else:  # array.shape[2] == 3
-            format_ = QImage.Format.Format_RGB888
-
         height, width, depth = array.shape
+        rgb_format, rgba_format = qimage_formats[array.dtype]
+        format_ = rgba_format if depth == 4 else rgb_format
+        if depth == 3 and array.dtype != np.uint8:
+            padded = np.empty((height, width, 4), dtype=array.dtype)
+            padded[:, :, :3] = array
+            padded[:, :, 3] = max_value(array.dtype)
+            array, depth = padded, 4
+
+        itemsize = array.itemsize
+        if array.strides[1:] != (depth * itemsize, itemsize) or array.strides[0] < width * depth * itemsize:
+            array = np.ascontiguousarray(array)
+
         qimage = QImage(
-            array.tobytes(),  # Convert the array to bytes
+            sip.voidptr(array.ctypes.data),
             width,
             height,
             array.strides[0],  # bytesPerLine
             format_)
 
-        return qimage.copy()  # Making a copy of the image and its data
+        if copy:
+            return qimage.copy()
 
-def convert_qimage_to_array(image):
+        qimage.numpy_array = array  # The QImage does not own its memory, keep the array alive
+        return qimage
+
+def convert_qimage_to_array(image, copy=False):
     """Convert a QImage to a numpy array in PyQt6.
 
-    If QImage format is not Format_RGB888, Format_RGBA8888, or Format_ARGB32,
-    it is first converted to one of these formats depending on
-    the presence of an alpha channel.
+    8 bit images in another format than Format_RGB888 or Format_RGBA8888 are first
+    converted to one of these formats depending on the presence of an alpha channel.
+    High bit depth images keep their depth, see qimage_formats; their padding channel
+    is dropped, which copies the pixels.
 
-    The created numpy array is using a copy of the QImage data.
+    Without copy, the array is a read-only view on the QImage data (or on its converted
+    version) and keeps the QImage alive, see QImageBuffer.
 
     :param QImage image: The QImage to convert.
+    :param copy: Return a writable array owning a copy of the data.
     :return: The image array of RGB or RGBA channels of shape
             (height, width, channels (3 or 4))
-    :rtype: numpy.ndarray of uint8
+    :rtype: numpy.ndarray of uint8, uint16, float16 or float32
     """
-    # In PyQt6, enums are accessed directly through the class rather than as attributes
-    format_rgb888 = QImage.Format.Format_RGB888
-    format_argb32 = QImage.Format.Format_ARGB32
-    format_rgba8888 = QImage.Format.Format_RGBA8888
-
-    # Convert to supported format if needed
-    if image.format() not in (format_argb32, format_rgb888, format_rgba8888):
-        if image.hasAlphaChannel():
-            image = image.convertToFormat(format_rgba8888)
-        else:
-            image = image.convertToFormat(format_rgb888)
-
-    format_ = image.format()
-    channels = 3 if format_ == format_rgb888 else 4
-
-    ptr = image.bits()
-    # Adjustments for PyQt6: image.byteCount() is replaced with image.sizeInBytes()
-    ptr.setsize(image.sizeInBytes())
+    image_format = qimage_conversions.get(image.format(), image.format())
+    if image_format != image.format():
+        image = image.convertToFormat(image_format)
 
-    # Create an array view on QImage internal data
-    view = as_strided(
-        np.frombuffer(ptr, dtype=np.uint8),
-        shape=(image.height(), image.width(), channels),
-        strides=(image.bytesPerLine(), channels, 1))
-
-    if format_ == format_argb32:
-        # Convert from ARGB to RGBA
-        # Not a byte-ordered format: do care about endianness
-        if sys.byteorder == 'little':  # BGRA -> RGBA
-            view = view[:, :, (2, 1, 0, 3)]
-        else:  # big endian: ARGB -> RGBA
-            view = view[:, :, (1, 2, 3, 0)]
-
-    # Format_RGB888 and Format_RGBA8888 do not need reshuffling channels:
-    # They are byte-ordered and already in the right order
+    for dtype, (rgb_format, rgba_format) in qimage_formats.items():
+        if image_format in (rgb_format, rgba_format):
+            break
+    else:
+        # In PyQt6, enums are accessed directly through the class rather than as attributes
+        # Convert to a byte-ordered format, the channels are then in RGB(A) order
+        dtype, (rgb_format, rgba_format) = np.dtype(np.uint8), qimage_formats[np.dtype(np.uint8)]
+        image_format = rgba_format if image.hasAlphaChannel() else rgb_format
+        image = image.convertToFormat(image_format)
+
+    if dtype == np.uint8:
+        channels = 3 if image_format == rgb_format else 4
+        view = np.asarray(QImageBuffer(image, channels))
+    else:
+        view = np.asarray(QImageBuffer(image, 4, dtype))
+        if image_format == rgb_format:
+            return np.ascontiguousarray(view[:, :, :3])
 
-    return np.array(view, copy=True, order='C')
+    if copy:
+        return np.array(view, copy=True, order='C')
+    return view
 
-def adjust_contrast_brightness_gamma(image, contrast_amount, brightness_amount, gamma_amount, shadows_amount, highlights_amount, weight_mask):
+def lighting_luts(min_val, max_val, contrast_amount, brightness_amount, gamma_amount, shadows_amount, highlights_amount):
     """
-    Adjusts the contrast, brightness, and applies gamma correction to an image.
-    
-    :param image: Input image.
-    :param alpha_amount: Contrast adjustment factor. Values > 1 increase contrast, values between 0 and 1 decrease contrast.
-    :param beta_amount: Brightness adjustment factor. The value is added to each pixel after contrast adjustment.
+    Computes the shadow and highlight lookup tables of the lighting adjustment.
+
+    :param min_val: Minimum intensity of the input image.
+    :param max_val: Maximum intensity of the input image.
+    :param contrast_amount: Contrast adjustment factor in [-1, 1].
+    :param brightness_amount: Brightness offset, added to each pixel after contrast adjustment.
     :param gamma_amount: Gamma correction factor. Values > 1 make the image darker, values < 1 make the image brighter.
-    :return: Image with adjusted contrast, brightness, and gamma correction.
+    :param shadows_amount: Offset applied where the luminance mask is dark.
+    :param highlights_amount: Offset applied where the luminance mask is bright.
+    :return: Tuple of (lut_shadows, lut_highlights), 256 entry uint8 lookup tables.
     """
 
     # Ensure alpha_amount is within a reasonable range
@@ -349,10 +451,10 @@ def adjust_contrast_brightness_gamma(image, contrast_amount, brightness_amount,
     
     # Ensure gamma_amount is positive
     gamma_amount = max(gamma_amount, 0.01)  # Avoid division by zero or negative values
-    
-    # Compute the original intensity range
-    min_val, max_val = image.min(), image.max()
-    
+
+    min_val, max_val = float(min_val), float(max_val)
+    value_range = max(max_val - min_val, 1.0)  # Avoid division by zero on flat images
+
     # Compute the target range for contrast adjustment
     target_min = (1 - contrast_amount) * min_val + contrast_amount * (255 * 0.25)
     target_max = (1 - contrast_amount) * max_val + contrast_amount * (255 * 0.75)
@@ -362,14 +464,29 @@ def adjust_contrast_brightness_gamma(image, contrast_amount, brightness_amount,
     # Apply gamma correction in the normalized space
     gamma_corrected = np.power(original_range, gamma_amount)
     # Adjust for contrast and brightness, then scale back to [0,255]
-    adjusted_range = np.clip(((gamma_corrected - min_val / 255) / ((max_val - min_val) / 255) * (target_max - target_min) + target_min) + (brightness_amount * 255), 0, 255).astype(np.uint8)
+    adjusted_range = np.clip(((gamma_corrected - min_val / 255) / (value_range / 255) * (target_max - target_min) + target_min) + (brightness_amount * 255), 0, 255).astype(np.uint8)
+
+    lut_shadows = np.clip(adjusted_range + (shadows_amount * 255), 0, 255).astype(np.uint8)
+    lut_highlights = np.clip(adjusted_range + (highlights_amount * 255), 0, 255).astype(np.uint8)
+    return lut_shadows, lut_highlights
+
+def adjust_contrast_brightness_gamma(image, contrast_amount, brightness_amount, gamma_amount, shadows_amount, highlights_amount, weight_mask):
+    """
+    Adjusts the contrast, brightness, and applies gamma correction to an image.
     
-    # Apply the lookup table
-    image_global = cv2.LUT(image, adjusted_range)
-    adjusted_shadows = np.clip((image_global) + (shadows_amount * 255), 0, 255).astype(np.uint8)
-    adjusted_highlights = np.clip((image_global) + (highlights_amount * 255), 0, 255).astype(np.uint8)
-    mask_norm = (weight_mask[:,:,None]/255.0)
-    return ( mask_norm * adjusted_highlights) + ((1-mask_norm) * adjusted_shadows)
+    :param image: Input image.
+    :param alpha_amount: Contrast adjustment factor. Values > 1 increase contrast, values between 0 and 1 decrease contrast.
+    :param beta_amount: Brightness adjustment factor. The value is added to each pixel after contrast adjustment.
+    :param gamma_amount: Gamma correction factor. Values > 1 make the image darker, values < 1 make the image brighter.
+    :return: uint8 image with adjusted contrast, brightness, and gamma correction. The shadows and
+             highlights are blended with the mask in fixed point and rounded, see blend_luts_with_mask,
+             so the result is not a float image that still needs to be converted for display.
+    """
+    lut_shadows, lut_highlights = lighting_luts(image.min(), image.max(), contrast_amount, brightness_amount, gamma_amount, shadows_amount, highlights_amount)
+
+    # Shadows are used where the mask is dark, highlights where it is bright
+    channels = image.shape[2] if image.ndim == 3 else 1
+    return blend_luts_with_mask(image, [lut_shadows] * channels, [lut_highlights] * channels, weight_mask)
 
 # Adjust Sharpening
 def color_sharpening(image, amount):
@@ -410,16 +527,22 @@ def adjust_gamma(image, gamma):
     return cv2.LUT(image, lookUpTable)
 
 
-# temperature value between 100 (warmer) to 12000 (cooler)
-def change_color_temperature(image, kelvin_value, red_gain=1.0, green_gain=1.0, blue_gain=1.0):
-    
+def color_temperature_luts(kelvin_value, red_gain=1.0, green_gain=1.0, blue_gain=1.0):
+    """
+    Computes the per-channel lookup tables of the color temperature adjustment.
+
+    Args:
+    kelvin_value (float): Color temperature between 1000 (warmer) and 12000 (cooler) Kelvin.
+    red_gain, green_gain, blue_gain (float): Additional gain of each channel.
+
+    Returns:
+    numpy.ndarray: uint8 array of shape (3, 256) with the R, G and B lookup tables.
+    """
     # Vectorized computation of the lookup table for performance improvement
     original_range = np.arange(256, dtype=np.float32) 
     original_range_rgb = original_range[:,None].repeat(3,1)
 
-    quality_factor = 2   # higher values means lesser quality. because.
-
-    print('Working on Kelvin value: ', kelvin_value)
+    logger.debug("Working on Kelvin value: %s", kelvin_value)
     temp = linear_interpolation(kelvin_value)
     r, g, b = temp
 
@@ -436,12 +559,18 @@ def change_color_temperature(image, kelvin_value, red_gain=1.0, green_gain=1.0,
     # Matrix multiplication
     transformed_img = np.dot(original_range_rgb, transformation_matrix)
 
-    adjusted_range = np.clip(np.round(transformed_img),0,255)
+    adjusted_range = np.clip(np.round(transformed_img),0,255).astype(np.uint8)
+    return np.ascontiguousarray(adjusted_range.T)
+
+# temperature value between 100 (warmer) to 12000 (cooler)
+def change_color_temperature(image, kelvin_value, red_gain=1.0, green_gain=1.0, blue_gain=1.0):
     
+    adjusted_range = color_temperature_luts(kelvin_value, red_gain, green_gain, blue_gain)
+
     # Apply the lookup table
     for c in range(3): 
         CH_RGB = image[:,:,c]
-        new_range = adjusted_range[:,c]
+        new_range = adjusted_range[c]
         CH_RGB_NEW = cv2.LUT(CH_RGB, new_range)
         image[:,:,c] = CH_RGB_NEW
     return image
@@ -456,6 +585,9 @@ def change_color_temperature(image, kelvin_value, red_gain=1.0, green_gain=1.0,
 #     return cv2.cvtColor(image_HSV, cv2.COLOR_HSV2RGB)
 
 def adjust_saturation_hue(image, saturation_amount, hue_shift):
+    if image.dtype != np.uint8:
+        return adjust_saturation_hue_float(image, saturation_amount, hue_shift)
+
     # Convert RGB to HSV
     image_HSV = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
     
@@ -471,122 +603,435 @@ def adjust_saturation_hue(image, saturation_amount, hue_shift):
     # Convert back to RGB
     return cv2.cvtColor(image_HSV, cv2.COLOR_HSV2RGB)
 
+def adjust_saturation_hue_float(image, saturation_amount, hue_shift):
+    """
+    High bit depth version of adjust_saturation_hue.
+
+    :param image: RGB float image with full intensity at 1.0, or uint16 image.
+    :param saturation_amount: Factor of the saturation.
+    :param hue_shift: Hue shift in degrees.
+    :return: float32 RGB image.
+    """
+    # OpenCV's float HSV has the hue in degrees and the saturation in 0..1
+    image_HSV = cv2.cvtColor(to_float32(image), cv2.COLOR_RGB2HSV)
+    saturation = image_HSV[..., 1]
+    np.clip(saturation * np.float32(saturation_amount), 0, 1, out=saturation)
+    # Same hue steps as the 8 bit version, so previews match
+    image_HSV[..., 0] = (image_HSV[..., 0] + 2 * int((hue_shift / 360.0) * 180)) % 360
+    return cv2.cvtColor(image_HSV, cv2.COLOR_HSV2RGB)
+
+HISTOGRAM_CHANNELS = ["Luminance", "Red", "Green", "Blue"]
+
+def calculate_histograms(image):
+    """
+    Compute the 256 bin histograms of the luminance and the R, G, B channels in one pass.
+
+    The four channels are counted together by a single bincount over offset values.
+    Histograms are usually computed on a reduced image, e.g. the smallest pyramid level.
+
+    :param image: RGB(A) image of any working depth, counted at 8 bits, see to_display_uint8.
+    :return: Array of shape (4, 256) in the order of HISTOGRAM_CHANNELS.
+    """
+    image = to_display_uint8(image)[:, :, :3]
+    gray_image = cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGB2GRAY)
+    values = np.dstack([gray_image, image]).astype(np.intp)
+    values += np.arange(4) * 256
+    return np.bincount(values.ravel(), minlength=4 * 256).reshape(4, 256)
 
 def calculate_histogram(image, channel):
-    if channel == 'Luminance':
-        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        hist = cv2.calcHist([gray_image], [0], None, [256], [0, 256])
-    else:
-        channel_map = {'Red': 0, 'Green': 1, 'Blue': 2}
-        hist = cv2.calcHist([image], [channel_map[channel]], None, [256], [0, 256])
-    return hist
-
-def plot_to_qimage(fig):
-    canvas = FigureCanvas(fig)
-    canvas.draw()
-    buf, (width, height) = canvas.print_to_buffer()
-    qimage = QImage(buf, width, height, QImage.Format.Format_RGBA8888)
-    return qimage
-
-rawpy_params = rawpy.Params(
-    demosaic_algorithm=None, 
-    half_size=False, 
-    four_color_rgb=False, 
-    dcb_iterations=0, 
-    dcb_enhance=False, 
-    fbdd_noise_reduction=rawpy.FBDDNoiseReductionMode.Off, 
-    noise_thr=None, 
-    median_filter_passes=0, 
-    use_camera_wb=False, 
-    use_auto_wb=False, 
-    user_wb=None, 
-    output_color=rawpy.ColorSpace.sRGB, 
-    output_bps=8, 
-    user_flip=None, 
-    user_black=None, 
-    user_sat=None, 
-    no_auto_bright=False, 
-    auto_bright_thr=None, 
-    adjust_maximum_thr=0.75, 
-    bright=1.0, 
-    highlight_mode=rawpy.HighlightMode.Clip, 
-    exp_shift=None, 
-    exp_preserve_highlights=0.0, 
-    no_auto_scale=False, 
-    gamma=None, 
-    chromatic_aberration=None, 
-    bad_pixels_path=None)
-
-def exr_to_numpy(exr_file, clip=False):
-    # Open the EXR file
-    exr = OpenEXR.InputFile(exr_file)
+    """
+    Compute the histogram of one of the HISTOGRAM_CHANNELS, see calculate_histograms.
+
+    :return: float32 array of shape (256, 1), like cv2.calcHist.
+    """
+    return calculate_histograms(image)[HISTOGRAM_CHANNELS.index(channel)].astype(np.float32).reshape(256, 1)
+
+# RAW decode profiles, the keyword arguments of rawpy's postprocess.
+# "preview" is used for viewing and editing: half_size skips the demosaic by merging every
+# 2x2 Bayer block into one pixel. "full" is the full resolution AHD demosaic with 16 bits per
+# channel, it is run in the background after opening a file and for exports.
+# "embedded" is not a decode: it loads the preview JPEG stored by the camera, at most
+# RAW_EMBEDDED_PREVIEW_SIZE, and falls back to "preview" if the file has none.
+RAW_PROFILE_EMBEDDED = "embedded"
+RAW_PROFILE_PREVIEW = "preview"
+RAW_PROFILE_FULL = "full"
+RAW_EMBEDDED_PREVIEW_SIZE = (1920, 1920)
+
+raw_profiles = {
+    RAW_PROFILE_PREVIEW: dict(half_size=True, demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR, output_bps=8),
+    RAW_PROFILE_FULL: dict(half_size=False, demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD, output_bps=16),
+}
+
+def is_raw_file(image_path):
+    return any(image_path.lower().endswith(ext[1:]) for ext in raw_extensions)
+
+def decode_raw(image_path, profile=RAW_PROFILE_FULL):
+    """
+    Decode a RAW file with one of the raw_profiles.
+
+    :param image_path: Path of the RAW file.
+    :param profile: RAW_PROFILE_PREVIEW or RAW_PROFILE_FULL.
+    :return: RGB array, uint8 or uint16 depending on the output_bps of the profile.
+    """
+    with rawpy.imread(image_path) as raw:
+        return raw.postprocess(**raw_profiles[profile])
+
+def exr_channel_names(exr_file):
+    """
+    Return the channel names of an EXR file grouped by layer, read from the header only.
+
+    Channels of the default layer have no prefix, e.g. "R", channels of other layers
+    are prefixed with the layer name, e.g. "diffuse.R".
 
-    # Get the header to retrieve the size of the image
+    :return: dict of layer name ("" for the default layer) -> list of channel names without the prefix.
+    """
+    layers = {}
+    for name in OpenEXR.InputFile(exr_file).header()['channels']:
+        layer, _, channel = name.rpartition('.')
+        layers.setdefault(layer, []).append(channel)
+    return layers
+
+def exr_to_numpy(exr_file, clip=False, channels=('R', 'G', 'B'), layer=None, alpha=False):
+    """
+    Read the channels of an EXR file into one interleaved float array.
+
+    The array is allocated once and every channel is copied straight into its slot.
+    If all selected channels are stored as HALF, they are read as float16 without
+    upcasting, otherwise as float32. Values are kept as they are, including the HDR
+    range above 1, unless clip is set.
+
+    :param exr_file: Path of the EXR file.
+    :param clip: Clip the values between 0 and 1.
+    :param channels: Names of the channels to read, in the order of the output.
+    :param layer: Name of the layer to read the channels from, e.g. "diffuse", None for the default layer.
+    :param alpha: Append the alpha channel "A" if the layer has one.
+    :return: float16 or float32 array of shape (height, width, channels).
+    """
+    exr = OpenEXR.InputFile(exr_file)
     header = exr.header()
     dw = header['dataWindow']
     width, height = dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1
 
-    # Define the data type of the pixels
-    pt = Imath.PixelType(Imath.PixelType.FLOAT)
+    prefix = f"{layer}." if layer else ""
+    names = [prefix + channel for channel in channels]
+    if alpha and prefix + 'A' in header['channels'] and prefix + 'A' not in names:
+        names.append(prefix + 'A')
+    missing = [name for name in names if name not in header['channels']]
+    if missing:
+        raise ValueError(f"EXR file has no channel {', '.join(missing)}")
+
+    # Read HALF natively when possible, Imath converts everything else to FLOAT
+    half = Imath.PixelType(Imath.PixelType.HALF)
+    if all(header['channels'][name].type == half for name in names):
+        pt, dtype = half, np.float16
+    else:
+        pt, dtype = Imath.PixelType(Imath.PixelType.FLOAT), np.float32
 
-    # Read the color channels (R, G, B)
-    redstr = exr.channel('R', pt)
-    greenstr = exr.channel('G', pt)
-    bluestr = exr.channel('B', pt)
+    img = np.empty((height, width, len(names)), dtype=dtype)
+    for index, data in enumerate(exr.channels(names, pt)):
+        img[:, :, index] = np.frombuffer(data, dtype=dtype).reshape(height, width)
 
-    # Convert the channel strings to numpy arrays
-    red = np.frombuffer(redstr, dtype=np.float32).reshape(height, width)
-    green = np.frombuffer(greenstr, dtype=np.float32).reshape(height, width)
-    blue = np.frombuffer(bluestr, dtype=np.float32).reshape(height, width)
+    if clip:
+        np.clip(img, 0, 1, out=img)
+    return img
+
+def exr_to_numpy_reduced(exr_file, step, clip=False):
+    """
+    Read an EXR image at reduced resolution, e.g. for thumbnails.
+
+    Only every step-th scanline is decoded, so most of the compressed line blocks are
+    never read. The rows are then averaged down horizontally.
 
-    if clip: 
-        red = np.clip(red, 0, 1)
-        green = np.clip(green, 0, 1)
-        blue = np.clip(blue, 0, 1)
+    :param exr_file: Path of the EXR file.
+    :param step: Reduction factor of both sides.
+    :param clip: Clip the values between 0 and 1.
+    :return: float32 array of shape (height // step, width // step, 3).
+    """
+    exr = OpenEXR.InputFile(exr_file)
+    dw = exr.header()['dataWindow']
+    width, height = dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1
+    pt = Imath.PixelType(Imath.PixelType.FLOAT)
 
-    # Combine the channels into a single numpy array
-    img = np.stack([red, green, blue], axis=-1)
+    rows = []
+    for y in range(dw.min.y + step // 2, dw.max.y + 1, step):
+        red, green, blue = exr.channels(['R', 'G', 'B'], pt, y, y)
+        rows.append(np.stack([np.frombuffer(channel, dtype=np.float32) for channel in (red, green, blue)], axis=-1))
 
+    img = cv2.resize(np.stack(rows), (max(width // step, 1), len(rows)), interpolation=cv2.INTER_AREA)
+    if clip:
+        img = np.clip(img, 0, 1)
     return img
 
-def load_image_to_qimage(image_path):
+def read_scaled(reader, width, height):
+    """
+    Read an image with a QImageReader and scale it to fit into width x height.
+
+    Readers supporting it (e.g. JPEG with DCT scaling) decode directly at twice the
+    target size, the last step is a smooth scale.
+    """
+    size = reader.size()
+    target = QSize(width, height)
+    if size.isValid() and reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize):
+        decode_size = size.scaled(target * 2, Qt.AspectRatioMode.KeepAspectRatio)
+        if decode_size.width() < size.width():
+            reader.setScaledSize(decode_size)
+
+    image = reader.read()
+    if image.isNull():
+        return image
+    return image.scaled(target, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+def load_raw_embedded_preview(image_path, max_width=None, max_height=None):
+    """
+    Load the preview image the camera embedded in a RAW file, usually a JPEG.
+
+    Reading it takes milliseconds compared to seconds for a demosaic. JPEG previews
+    larger than max_width x max_height are decoded at reduced size.
+
+    :param image_path: Path of the RAW file.
+    :return: QImage rotated like the developed image, None if the file has no usable preview.
+    """
+    with rawpy.imread(image_path) as raw:
+        try:
+            thumb = raw.extract_thumb()
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            return None
+        flip = raw.sizes.flip
+
+    if thumb.format == rawpy.ThumbFormat.JPEG:
+        byte_array = QByteArray(thumb.data)  # The buffer does not own the data, keep it referenced
+        buffer = QBuffer(byte_array)
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        reader = QImageReader(buffer)
+        size = reader.size()
+        if max_width and max_height and size.isValid() and (size.width() > max_width or size.height() > max_height):
+            reader.setScaledSize(size.scaled(QSize(max_width, max_height), Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+    else:
+        image = convert_array_to_qimage(thumb.data)
+        if max_width and max_height and (image.width() > max_width or image.height() > max_height):
+            image = image.scaled(QSize(max_width, max_height), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+    if image.isNull():
+        return None
+
+    # The embedded preview is stored in sensor orientation
+    rotation = {3: 180, 5: -90, 6: 90}.get(flip, 0)
+    if rotation:
+        image = image.transformed(QTransform().rotate(rotation))
+    return image
+
+def load_thumbnail(image_path, width, height):
+    """
+    Load an image scaled to fit into width x height, decoding as little as possible.
+
+    - Standard formats are decoded at reduced size by the Qt image reader.
+    - RAW files use the embedded preview, rotated like the developed image, and fall
+      back to a half size demosaic if there is none.
+    - EXR files only decode the scanlines needed, see exr_to_numpy_reduced.
+
+    :return: The thumbnail, a null QImage if the file could not be decoded.
+    """
+    lower_path = image_path.lower()
+    if is_raw_file(image_path):
+        try:
+            image = load_raw_embedded_preview(image_path, 2 * width, 2 * height)
+            if image is None:
+                image = convert_array_to_qimage(decode_raw(image_path, RAW_PROFILE_PREVIEW))
+            return image.scaled(QSize(width, height), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        except Exception as e:
+            logger.warning("Failed to load RAW thumbnail of %s: %s", image_path, e)
+            return QImage()
+
+    if any(lower_path.endswith(ext[1:]) for ext in exr_extensions):
+        try:
+            header = OpenEXR.InputFile(image_path).header()
+            dw = header['dataWindow']
+            step = max(1, min((dw.max.x - dw.min.x + 1) // width, (dw.max.y - dw.min.y + 1) // height))
+            rgb_image = np.uint8(exr_to_numpy_reduced(image_path, step, clip=True) * 255)
+            return convert_array_to_qimage(rgb_image).scaled(QSize(width, height), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        except Exception as e:
+            logger.warning("Failed to load EXR thumbnail of %s: %s", image_path, e)
+            return QImage()
+
+    return read_scaled(QImageReader(image_path), width, height)
+
+def thumbnail_from_array(image, width, height):
+    """
+    Scale an image of any working depth to fit into width x height, e.g. for the edit history.
+
+    Area interpolation averages all pixels, pass the smallest pyramid level that still
+    covers the thumbnail to keep it cheap.
+
+    :param image: RGB(A) array or QImage.
+    :return: The thumbnail, an 8 bit QImage owning its pixels.
+    """
+    if isinstance(image, QImage):
+        image = convert_qimage_to_array(image)
+    image_height, image_width = image.shape[:2]
+    scale = min(width / image_width, height / image_height, 1.0)
+    size = (max(1, round(image_width * scale)), max(1, round(image_height * scale)))
+    if image.dtype == np.float16:
+        image = image.astype(np.float32)  # cv2.resize has no float16 support
+    thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return convert_array_to_qimage(to_display_uint8(thumbnail), copy=True)
+
+# TIFF tags read by read_exif_tags
+EXIF_ORIENTATION = 0x0112
+EXIF_DATE_TIME = 0x0132
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+EXIF_HEADER_BYTES = 256 * 1024  # EXIF data is expected within the start of the file
+
+def _parse_tiff_ifd(tiff, offset, byte_order, tags):
+    """Read the SHORT, LONG and ASCII values of the wanted tags of one TIFF IFD."""
+    values = {}
+    count, = struct.unpack_from(byte_order + "H", tiff, offset)
+    for index in range(count):
+        tag, value_type, value_count, value_offset = struct.unpack_from(byte_order + "HHII", tiff, offset + 2 + 12 * index)
+        if tag not in tags:
+            continue
+        if value_type == 3:  # SHORT, stored in the first bytes of the value field
+            values[tag], = struct.unpack_from(byte_order + "H", tiff, offset + 10 + 12 * index)
+        elif value_type == 4:  # LONG
+            values[tag] = value_offset
+        elif value_type == 2:  # ASCII, stored at the offset when longer than 4 bytes
+            start = offset + 10 + 12 * index if value_count <= 4 else value_offset
+            values[tag] = tiff[start:start + value_count].split(b"\0")[0].decode("ascii", "replace")
+    return values
+
+def read_exif_tags(image_path):
+    """
+    Read the orientation and the capture time from the EXIF data of a file, without decoding it.
+
+    JPEG files are searched for their EXIF segment. TIFF files and the TIFF based RAW
+    formats (e.g. CR2, NEF, ARW, DNG) are parsed from the start of the file.
+
+    :return: dict with "orientation" (1..8) and "capture_time" ("YYYY:MM:DD HH:MM:SS")
+             if present, empty if the file has no readable EXIF data.
+    """
+    with open(image_path, "rb") as file:
+        head = file.read(EXIF_HEADER_BYTES)
+
+    tiff = None
+    if head[:2] == b"\xff\xd8":
+        # Walk the JPEG markers up to the EXIF segment (APP1)
+        position = 2
+        while position + 4 <= len(head) and head[position] == 0xFF:
+            marker = head[position + 1]
+            length, = struct.unpack_from(">H", head, position + 2)
+            if marker == 0xE1 and head[position + 4:position + 10] == b"Exif\0\0":
+                tiff = head[position + 10:position + 2 + length]
+                break
+            if marker == 0xDA:  # Start of scan, the pixels follow
+                break
+            position += 2 + length
+    elif head[:4] in (b"II*\0", b"MM\0*"):
+        tiff = head
+    if not tiff or tiff[:2] not in (b"II", b"MM"):
+        return {}
+
+    try:
+        byte_order = "<" if tiff[:2] == b"II" else ">"
+        ifd0, = struct.unpack_from(byte_order + "I", tiff, 4)
+        tags = _parse_tiff_ifd(tiff, ifd0, byte_order, (EXIF_ORIENTATION, EXIF_DATE_TIME, EXIF_IFD_POINTER))
+        if EXIF_IFD_POINTER in tags:
+            tags.update(_parse_tiff_ifd(tiff, tags[EXIF_IFD_POINTER], byte_order, (EXIF_DATE_TIME_ORIGINAL,)))
+    except struct.error:
+        return {}  # Truncated or beyond the bytes read
+
+    exif = {}
+    if EXIF_ORIENTATION in tags:
+        exif["orientation"] = tags[EXIF_ORIENTATION]
+    capture_time = tags.get(EXIF_DATE_TIME_ORIGINAL) or tags.get(EXIF_DATE_TIME)
+    if capture_time:
+        exif["capture_time"] = capture_time
+    return exif
+
+def read_image_header(image_path):
+    """
+    Read the properties of an image file from its headers, the pixels are never decoded.
+
+    - Standard formats are read with QImageReader, which only parses the header.
+    - RAW files are opened with rawpy without unpacking the sensor data.
+    - EXR files only have their header read.
+
+    :return: dict with "width", "height", "format", "bits_per_channel", "channels" and,
+             if the file has them, the EXIF "orientation" and "capture_time". Properties
+             that can not be read are missing.
+    """
+    header = {}
+    lower_path = image_path.lower()
+    try:
+        if is_raw_file(image_path):
+            with rawpy.imread(image_path) as raw:
+                sizes = raw.sizes
+                header["width"], header["height"] = (sizes.height, sizes.width) if sizes.flip in (5, 6) else (sizes.width, sizes.height)
+                header["bits_per_channel"] = int(raw.white_level).bit_length()
+                header["channels"] = 3
+            header["format"] = os.path.splitext(image_path)[1][1:].upper()
+        elif any(lower_path.endswith(ext[1:]) for ext in exr_extensions):
+            exr_header = OpenEXR.InputFile(image_path).header()
+            dw = exr_header['dataWindow']
+            header["width"], header["height"] = dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1
+            channel_types = [channel.type for channel in exr_header['channels'].values()]
+            half = Imath.PixelType(Imath.PixelType.HALF)
+            header["bits_per_channel"] = 16 if all(channel_type == half for channel_type in channel_types) else 32
+            header["channels"] = len(channel_types)
+            header["format"] = "EXR"
+        else:
+            reader = QImageReader(image_path)
+            size = reader.size()
+            if size.isValid():
+                header["width"], header["height"] = size.width(), size.height()
+            header["format"] = bytes(reader.format()).decode("ascii", "replace").upper()
+            if reader.imageFormat() != QImage.Format.Format_Invalid:
+                pixel_format = QImage.toPixelFormat(reader.imageFormat())
+                header["bits_per_channel"] = pixel_format.redSize()
+                header["channels"] = 1 if pixel_format.colorModel() == pixel_format.ColorModel.Grayscale else 3
+                if pixel_format.alphaUsage() == pixel_format.AlphaUsage.UsesAlpha:
+                    header["channels"] += 1
+        header.update(read_exif_tags(image_path))
+    except Exception as e:
+        logger.warning("Failed to read the image header of %s: %s", image_path, e)
+    return header
+
+@Instrumentation.timed(Instrumentation.DECODE)
+def load_image_to_qimage(image_path, raw_profile=RAW_PROFILE_FULL):
+    """Load an image file to a QImage, RAW files are decoded with the given profile of raw_profiles."""
 
     # Check if the file is a RAW file by its extension
-    if any(image_path.lower().endswith(ext[1:]) for ext in raw_extensions):
+    if is_raw_file(image_path):
         try:
             # Handle RAW files
-            with rawpy.imread(image_path) as raw:
-                # Postprocess and get the image data as a numpy array
-                rgb_image = raw.postprocess()
-            # Convert the image to a format that QImage can handle
-            height, width, colors = rgb_image.shape
-            bytes_per_line = 3 * width
-            image = QImage(rgb_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
+            if raw_profile == RAW_PROFILE_EMBEDDED:
+                image = load_raw_embedded_preview(image_path, *RAW_EMBEDDED_PREVIEW_SIZE)
+                if image is not None:
+                    return image
+                raw_profile = RAW_PROFILE_PREVIEW
+            rgb_image = decode_raw(image_path, raw_profile)
+            # An owning QImage, it is passed to other threads and caches
+            image = convert_array_to_qimage(rgb_image)
         except Exception as e:
-            print(f"Failed to load RAW image: {e}")
+            logger.error("Failed to load RAW image %s: %s", image_path, e)
             return None
     elif any(image_path.lower().endswith(ext[1:]) for ext in exr_extensions):
         try:
-            # Handle EXR image formats
-            rgb_image = exr_to_numpy(image_path, clip=True)
-            # Values are clipped between 0..1 to deal with overexposed areas. Multiply so we get channel values of 0..255 to show the RGB image: 
-            rgb_image = np.uint8(rgb_image * 255)
-            height, width, colors = rgb_image.shape
-            bytes_per_line = 3 * width
-            image = QImage(rgb_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
+            # Handle EXR image formats, the QImage keeps the float data, see qimage_formats
+            image = convert_array_to_qimage(exr_to_numpy(image_path, alpha=True))
         except Exception as e:
-            print(f"Failed to load image: {e}")
+            logger.error("Failed to load image %s: %s", image_path, e)
             return None
     else:
         try:
             # Handle standard image formats
             image = QImage(image_path)
         except Exception as e:
-            print(f"Failed to load image: {e}")
+            logger.error("Failed to load image %s: %s", image_path, e)
             return None
 
     if image.isNull():
-        print("Unable to load image.")
+        logger.error("Unable to load image %s.", image_path)
         return None
 
     return image
@@ -614,52 +1059,211 @@ def apply_lut_global(image, lut, channel):
         return cv2.merge((channel_red, channel_green, channel_blue))
 
 
+@Instrumentation.timed(Instrumentation.LUT_BUILD)
+def curve_lut(points):
+    """
+    Computes the lookup table of a curve through control points, as drawn by the curve widgets.
+
+    :param points: (x, y) control points in 0..255 with increasing x, y pointing up.
+    :return: 256 entry uint8 lookup table.
+    """
+    x_values, y_values = zip(*points)
+    curve = interp1d(x_values, y_values, kind="cubic", bounds_error=False, fill_value="extrapolate")
+    return np.clip(np.round(curve(np.arange(256))), 0, 255).astype(np.uint8)
+
+def as_lut(lut):
+    """
+    Convert a lookup table to the uint8 layout expected by cv2.LUT.
+
+    A single table of 256 entries is used for every channel. A table of shape
+    (channels, 256) holds one lookup table per channel.
+
+    Args:
+    lut (array-like): Lookup table(s) with 256 entries.
+
+    Returns:
+    numpy.ndarray: Contiguous uint8 array of shape (256,) or (1, 256, channels).
+    """
+    lut = np.asarray(lut)
+    if lut.dtype != np.uint8:
+        lut = np.clip(np.rint(lut), 0, 255).astype(np.uint8)
+    if lut.size == 256:
+        return np.ascontiguousarray(lut.reshape(256))
+    return np.ascontiguousarray(lut.reshape(-1, 256).T[None, :, :])
+
+def as_weight_mask(mask):
+    """
+    Convert a weight mask to uint8 in the range 0 (no weight) to 255 (full weight).
+
+    Args:
+    mask (numpy.ndarray): 2D mask with values between 0 and 255.
+
+    Returns:
+    numpy.ndarray: 2D uint8 mask.
+    """
+    if mask.dtype != np.uint8:
+        mask = np.clip(np.rint(mask), 0, 255).astype(np.uint8)
+    return mask
+
+def luminance_mask(image, width, height, mask_size=64):
+    """
+    Create the low frequency luminance mask separating shadows from highlights.
+
+    The luminance is averaged down to mask_size x mask_size and interpolated back up,
+    so any reduced resolution version of the image gives the same mask.
+
+    Args:
+    image (numpy.ndarray): RGB uint8 image, e.g. a level of the image pyramid.
+    width (int): Width of the mask.
+    height (int): Height of the mask.
+    mask_size (int): Resolution of the low frequency mask.
+
+    Returns:
+    numpy.ndarray: 2D uint8 mask of shape (height, width).
+    """
+    return cv2.resize(luminance_mask_lowres(image, mask_size), (width, height), interpolation=cv2.INTER_LINEAR)
+
+def luminance_mask_lowres(image, mask_size=64):
+    """
+    Create the mask_size x mask_size luminance mask, see luminance_mask.
+
+    Args:
+    image (numpy.ndarray): RGB image of any working depth, see to_display_uint8.
+    mask_size (int): Resolution of the mask.
+
+    Returns:
+    numpy.ndarray: 2D uint8 mask of shape (mask_size, mask_size).
+    """
+    grayscale_image = cv2.cvtColor(to_display_uint8(image), cv2.COLOR_RGB2GRAY)
+    return cv2.resize(grayscale_image, (mask_size, mask_size), interpolation=cv2.INTER_AREA)
+
+def blend_luts_with_mask(image, lut_1, lut_2, mask):
+    """
+    Apply two lookup tables to an 8 bit image and blend the results per pixel.
+
+    Both LUTs are applied with cv2.LUT straight into uint16 and blended with fixed-point
+    arithmetic: (lut_1[x] * (255 - m) + lut_2[x] * m) / 255, rounded to the nearest integer.
+    The largest intermediate value (255 * 255) fits in uint16, so no float buffers are
+    allocated and every step runs as a vectorized OpenCV kernel.
+
+    Args:
+    image (numpy.ndarray): 2D uint8 channel or 3D uint8 image.
+    lut_1 (array-like): Lookup table used where the mask is 0, see as_lut.
+    lut_2 (array-like): Lookup table used where the mask is 255, see as_lut.
+    mask (numpy.ndarray): 2D weight mask with the same size as the image, values 0..255.
+
+    Returns:
+    numpy.ndarray: Blended uint8 image with the shape of the input.
+    """
+    weight = as_weight_mask(mask)
+    inverse_weight = cv2.bitwise_not(weight)  # 255 - mask
+    if image.ndim == 3:
+        weight = cv2.merge([weight] * image.shape[2])
+        inverse_weight = cv2.merge([inverse_weight] * image.shape[2])
+
+    blended = cv2.LUT(image, as_lut(lut_2).astype(np.uint16))
+    cv2.multiply(blended, weight.astype(np.uint16), dst=blended)
+
+    low = cv2.LUT(image, as_lut(lut_1).astype(np.uint16))
+    cv2.multiply(low, inverse_weight.astype(np.uint16), dst=low)
+    cv2.add(blended, low, dst=blended)
+
+    # Rounded division by 255 back to 8 bits
+    return cv2.convertScaleAbs(blended, alpha=1 / 255.0)
+
+def expand_lut(lut, dtype):
+    """
+    Resample a 256 entry lookup table to the 65536 entries of a high bit depth image.
+
+    Values between the 8 bit entries are interpolated linearly, so smooth gradients
+    stay smooth instead of being posterized to 256 levels.
+
+    Args:
+    lut (array-like): Lookup table with 256 entries, or (channels, 256) for one table per channel.
+    dtype (numpy.dtype): Type of the output values, float tables have full intensity at 1.0.
+
+    Returns:
+    numpy.ndarray: Table of shape (65536,) or (channels, 65536), indexed with lut_indices.
+    """
+    lut = np.asarray(lut, dtype=np.float32).reshape(-1, 256)
+    positions = np.arange(65536, dtype=np.float32) / np.float32(257)
+    table = np.stack([np.interp(positions, np.arange(256), channel_lut) for channel_lut in lut]).astype(np.float32)
+    table /= 255
+    table = from_float32(table, dtype)
+    return table[0] if len(table) == 1 else table
+
+def lut_indices(image):
+    """Return the 16 bit indices of the pixels of a uint16 or float image into the tables of expand_lut."""
+    if image.dtype == np.uint16:
+        return image
+    return from_float32(image, np.uint16)
+
+def apply_lut_high_bit(image, lut):
+    """
+    Apply lookup tables to a uint16 or float image.
+
+    Float values are clipped between 0 and 1 by the lookup.
+
+    Args:
+    image (numpy.ndarray): 2D channel or 3D image.
+    lut (numpy.ndarray): Table of expand_lut, one per channel or shared by all channels.
+
+    Returns:
+    numpy.ndarray: Image with the dtype of the table.
+    """
+    indices = lut_indices(image)
+    if lut.ndim == 1:
+        return np.take(lut, indices)
+
+    output = np.empty(image.shape, dtype=lut.dtype)
+    for channel, channel_lut in enumerate(lut):
+        output[..., channel] = np.take(channel_lut, indices[..., channel])
+    return output
+
+def blend_luts_with_mask_high_bit(image, lut_1, lut_2, mask):
+    """
+    High bit depth version of blend_luts_with_mask, see expand_lut.
+
+    Args:
+    image (numpy.ndarray): 2D channel or 3D uint16 or float image.
+    lut_1 (numpy.ndarray): float32 table of expand_lut used where the mask is 0.
+    lut_2 (numpy.ndarray): float32 table of expand_lut used where the mask is 255.
+    mask (numpy.ndarray): 2D weight mask with the same size as the image, values 0..255.
+
+    Returns:
+    numpy.ndarray: Blended float32 image with full intensity at 1.0.
+    """
+    weight = np.multiply(mask, np.float32(1 / 255.0), dtype=np.float32)
+    if image.ndim == 3:
+        weight = weight[:, :, None]
+
+    blended = apply_lut_high_bit(image, lut_1)
+    high = apply_lut_high_bit(image, lut_2)
+    high -= blended
+    high *= weight
+    blended += high
+    return blended
+
 def apply_lut_local(image, lut_1, lut_2, channels, mask):
     channel_list = ["Luminance", "Red", "Green", "Blue"]
     
     if channels not in channel_list:
         raise ValueError(f"Option must be one of {channel_list}")
 
-    # Ensure mask values are within [0, 1]
-    mask = np.clip(mask/255.0, 0, 1)
-
     if channels == "Luminance":
-        # Convert to HSV, interpolate LUT for the V channel, convert back to RGB
+        # Convert to HSV, blend the LUTs on the V channel, convert back to RGB
         hsv_image = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-        v_channel = hsv_image[:, :, 2]
-        output_channel = np.zeros_like(v_channel, dtype=np.uint8)
-        
-        # Applying LUTs based on the mask
-        for i in range(256):
-            use_lut_1 = lut_1[i] * (1 - mask)
-            use_lut_2 = lut_2[i] * mask
-            output_channel[v_channel == i] = (use_lut_1 + use_lut_2)[v_channel == i]
-        
-        hsv_image[:, :, 2] = output_channel
+        hsv_image[:, :, 2] = blend_luts_with_mask(cv2.extractChannel(hsv_image, 2), lut_1, lut_2, mask)
         return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2RGB)
     else:
-        # Apply the LUT to the respective RGB channel
-        # output_image = np.zeros_like(image, dtype=np.uint8)
-        [channel_red, channel_green, channel_blue] = cv2.split(image)
-        
-        # Interpolate LUT application for each channel
+        # Blend the LUTs on the respective RGB channel
         channel_map = {
             "Red": 0,
             "Green": 1,
             "Blue": 2
         }
         selected_channel_index = channel_map[channels]
-        selected_channel = [channel_red, channel_green, channel_blue][selected_channel_index]
-        
-        output_channel = np.zeros_like(selected_channel, dtype=np.uint8)
-        
-        for i in range(256):
-            use_lut_1 = lut_1[i] * (1 - mask)
-            use_lut_2 = lut_2[i] * mask
-            output_channel[selected_channel == i] = (use_lut_1 + use_lut_2)[selected_channel == i]
-        
-        output_image = cv2.merge((channel_red, channel_green, channel_blue))
-        output_image[:, :, selected_channel_index] = output_channel
-        return output_image
-
 
+        output_image = image.copy()
+        output_image[:, :, selected_channel_index] = blend_luts_with_mask(cv2.extractChannel(image, selected_channel_index), lut_1, lut_2, mask)
+        return output_image
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the multi-resolution image pyramid used as the backing store of
+the image viewer. Level 0 is the full resolution image, every following level halves
+the width and the height, down to about MIN_SIZE pixels.
+
+Level 0 keeps the depth of the image. The reduced levels of high bit depth images
+(uint16 or float) are proxies stored as float16 with full intensity at 1.0, half the
+memory of float32 without the banding of 8 bits.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import cv2
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+
+class ImagePyramid:
+    """Mipmap pyramid of an RGB image, kept as NumPy arrays."""
+
+    MIN_SIZE = 256  # The smallest level is the last one with both sides >= MIN_SIZE
+
+    def __init__(self, image):
+        self.__levels = [image]
+        self.__value_range = None
+
+        height, width = image.shape[:2]
+        while min(width, height) // 2 >= self.MIN_SIZE:
+            width, height = (width + 1) // 2, (height + 1) // 2
+            previous = self.__levels[-1]
+            if previous.dtype == np.float16:
+                previous = previous.astype(np.float32)  # cv2.resize has no float16 support
+            level = cv2.resize(previous, (width, height), interpolation=cv2.INTER_AREA)
+            if level.dtype != np.uint8:
+                level = ImageProcessingAlgorithms.to_float32(level).astype(np.float16)
+            self.__levels.append(level)
+
+    def __len__(self):
+        return len(self.__levels)
+
+    def width(self):
+        return self.__levels[0].shape[1]
+
+    def height(self):
+        return self.__levels[0].shape[0]
+
+    def level(self, index):
+        """Return the image of the given level, 0 is the full resolution."""
+        return self.__levels[index]
+
+    def scale(self, index):
+        """Return the number of full resolution pixels per pixel of the given level."""
+        return self.width() / self.__levels[index].shape[1]
+
+    def level_for_scale(self, display_scale):
+        """
+        Return the smallest level that still covers the display.
+
+        :param display_scale: Number of device pixels per full resolution pixel,
+                              e.g. 0.25 when a 4000 px wide image is shown 1000 px wide.
+        :return: Index of the level.
+        """
+        for index in reversed(range(len(self.__levels))):
+            if self.__levels[index].shape[1] >= self.width() * display_scale:
+                return index
+        return 0
+
+    def value_range(self):
+        """
+        Return the (min, max) of the full resolution image, computed once.
+
+        The values are in 8 bit units (0..255) whatever the depth of the image, HDR
+        values above full intensity count as 255.
+        """
+        if self.__value_range is None:
+            image = self.__levels[0]
+            scale = 255 / ImageProcessingAlgorithms.max_value(image.dtype)
+            self.__value_range = tuple(min(float(value) * scale, 255.0) for value in (image.min(), image.max()))
+        return self.__value_range
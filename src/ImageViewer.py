@@ -1,19 +1,28 @@
 
+import logging
 import numpy as np
 import os
 from datetime import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
 
 from PyQt6.QtGui import QWheelEvent, QPaintEvent
-from PyQt6.QtCore import pyqtSlot,pyqtSignal, Qt, QSize, QPoint, QRect, QRectF, QPointF, QSizeF
+from PyQt6.QtCore import pyqtSlot,pyqtSignal, Qt, QSize, QPoint, QRect, QRectF, QPointF, QSizeF, QTimer
 from PyQt6.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QSpacerItem, QSizePolicy, QVBoxLayout,QHBoxLayout,QComboBox, QPushButton, QGraphicsRectItem, QFileDialog, QMenu, QGraphicsProxyWidget, QRubberBand, QLabel, QWidget
 from PyQt6.QtGui import QPixmap, QCursor, QAction, QPen, QImage, QPainterPath, QTransform, QColor, QFont, QBrush
 
 from src.WidgetUtils import HoverButton
 import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from src.ImagePyramid import ImagePyramid
+from src.EditHistory import EditOperation
+from src.LuminanceMask import LuminanceMask
+from src.RenderWorker import RenderWorker
+from src.TiledRenderer import TiledRenderer
 from src.util.CustomInfoPanel import CustomInfoPanel
+from src.util.PreviewCache import PreviewCache
+from src.util.ImageMetadataCache import ImageMetadataCache
+import src.util.Instrumentation as Instrumentation
+
+logger = logging.getLogger(__name__)
 
 
 class ImageViewer(QGraphicsView):
@@ -22,6 +31,24 @@ class ImageViewer(QGraphicsView):
     BUTTON_SIZE = QSize(60, 60)
     ICON_SIZE = QSize(40, 40)
 
+    # Pixmaps are 8 bit. The uint16/float data of high bit depth images and of the edits
+    # made on them are kept here, keyed by the cacheKey of their pixmap, and shared by all
+    # viewers so the editing windows and the history pass them along with the pixmaps.
+    # Pixmaps whose data was evicted are edited at 8 bits.
+    WORKING_IMAGES_BYTES = 1024 * 1024 * 1024
+    WORKING_IMAGES = PreviewCache(WORKING_IMAGES_BYTES, size_of=lambda array: array.nbytes)
+
+    # Histograms are counted on about HISTOGRAM_SAMPLE_SIZE x HISTOGRAM_SAMPLE_SIZE pixels
+    # and cached per pixmap, so showing an image again does not count it again.
+    HISTOGRAM_SAMPLE_SIZE = 512
+    HISTOGRAM_CACHE_BYTES = 1024 * 1024
+
+    # Header-only file metadata of the info panel, shared by all viewers
+    METADATA = ImageMetadataCache()
+
+    # The timing overlay is refreshed at this interval, for the stages run off the GUI thread
+    TIMING_OVERLAY_INTERVAL_MS = 500
+
     def __init__(self):
         super().__init__()
         self.__scene = QGraphicsScene()
@@ -40,6 +67,24 @@ class ImageViewer(QGraphicsView):
         self.__current_pixmap = None
         self.__previous_pixmap = None
         self.__original_pixmap = None
+
+        # Pyramid level of the current/previous pixmap when it is a preview of the
+        # pipeline, None when it is a full resolution image.
+        self.__current_level = None
+        self.__previous_level = None
+
+        self.__pyramid = None            # ImagePyramid of the original pixmap
+        self.__luminance_mask = None     # LuminanceMask of the original pixmap
+        self.__level_pixmaps = {}        # Pixmaps of the pyramid levels used for display
+        self.__displayed_level = None    # Pyramid level shown while displaying the original
+        self.__pipeline_factory = None   # Callable building the last PixelPipeline applied to the original
+        self.__operations = []           # EditOperations made on the original, see get_operations
+        self.__pipeline_operation = None # EditOperation of the pipeline applied to the original
+        self.__histograms = PreviewCache(self.HISTOGRAM_CACHE_BYTES, size_of=lambda histograms: histograms.nbytes)
+
+        # Previews are rendered off the GUI thread, only the newest frame is shown
+        self.__render_worker = RenderWorker(self)
+        self.__render_worker.frame_ready.connect(self.__show_rendered_frame)
         
         self.__crop_rect = QGraphicsRectItem()
         self.__crop_rect.setPen(QPen(QColor('red'), 2, Qt.PenStyle.SolidLine))
@@ -63,6 +108,8 @@ class ImageViewer(QGraphicsView):
         self.__rect_start_point = None
 
         self.__image_path = ""
+        self.__source_is_preview = False  # The original is a reduced quality decode, e.g. of a RAW file
+        self.__export_renderer = None     # Renders the edits of a preview at full quality, see set_export_renderer
         self.__info_display_visible = False
         self.__info_widget = CustomInfoPanel()
         self.__info_label_proxy = QGraphicsProxyWidget()
@@ -74,6 +121,14 @@ class ImageViewer(QGraphicsView):
         
         self.__curve_option = "Luminance" #default
         self.__info_widget.channel_combo_box.currentTextChanged.connect(self.channel_option_selected)
+
+        # Per stage timings of the hot path and the frame rate, see Instrumentation
+        self.__timing_overlay_visible = False
+        self.__timing_overlay_enabled_instrumentation = False
+        self.__frame_pending = False  # A new image is shown and not painted yet
+        self.__timing_overlay_timer = QTimer(self)
+        self.__timing_overlay_timer.setInterval(self.TIMING_OVERLAY_INTERVAL_MS)
+        self.__timing_overlay_timer.timeout.connect(self.viewport().update)
         
         # Set the focus policy to accept focus by tabbing and clicking
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
@@ -95,7 +150,7 @@ class ImageViewer(QGraphicsView):
         self.init_info_display()
         self.update_image_info()
         
-        print("Showing histogram: ", self.__info_display_visible)
+        logger.debug("Showing histogram: %s", self.__info_display_visible)
 
     def createContextMenu(self):
         self.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
@@ -108,10 +163,76 @@ class ImageViewer(QGraphicsView):
         self.__paste_action.triggered.connect(self.pasteImage)
         self.__save_action = QAction("Save As ...", self)
         self.__save_action.triggered.connect(self.saveImage)
+        self.__timing_action = QAction("Show Timings", self)
+        self.__timing_action.setCheckable(True)
+        self.__timing_action.toggled.connect(self.set_timing_overlay_visible)
 
         self.__context_menu.addAction(self.__copy_action)
         self.__context_menu.addAction(self.__paste_action)
         self.__context_menu.addAction(self.__save_action)
+        self.__context_menu.addSeparator()
+        self.__context_menu.addAction(self.__timing_action)
+
+    def set_timing_overlay_visible(self, visible):
+        """
+        Show the milliseconds of the stages of the hot path and the frame rate over the image.
+
+        The instrumentation is enabled while the overlay is shown, unless it was enabled already.
+        """
+        if visible == self.__timing_overlay_visible:
+            return
+        self.__timing_overlay_visible = visible
+        self.__timing_action.setChecked(visible)
+        instrumentation = Instrumentation.INSTRUMENTATION
+        if visible:
+            self.__timing_overlay_enabled_instrumentation = not instrumentation.is_enabled()
+            if self.__timing_overlay_enabled_instrumentation:
+                instrumentation.enable()
+            self.__timing_overlay_timer.start()
+        else:
+            if self.__timing_overlay_enabled_instrumentation:
+                instrumentation.enable(False)
+            self.__timing_overlay_timer.stop()
+        self.viewport().update()
+
+    def is_timing_overlay_visible(self):
+        return self.__timing_overlay_visible
+
+    def paintEvent(self, event):
+        with Instrumentation.span(Instrumentation.PAINT):
+            super().paintEvent(event)
+        if self.__frame_pending:
+            self.__frame_pending = False
+            Instrumentation.INSTRUMENTATION.frame()
+
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if not self.__timing_overlay_visible:
+            return
+
+        stats = Instrumentation.INSTRUMENTATION.stats()
+        lines = []
+        for stage in Instrumentation.STAGES:
+            if stage in stats:
+                count, last, mean, maximum = stats[stage]
+                lines.append(f"{stage:<10}{last:8.1f} ms  mean {mean:7.1f}  max {maximum:7.1f}")
+        lines.append(f"{'frames':<10}{Instrumentation.INSTRUMENTATION.frame_rate():8.1f} fps")
+
+        # Drawn in viewport coordinates, at the top right corner
+        painter.save()
+        painter.resetTransform()
+        font = QFont("Monospace", 9)
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        painter.setFont(font)
+        metrics = painter.fontMetrics()
+        width = max(metrics.horizontalAdvance(line) for line in lines) + 16
+        height = metrics.height() * len(lines) + 12
+        box = QRect(self.viewport().width() - width - 10, 10, width, height)
+        painter.fillRect(box, QColor(0, 0, 0, 170))
+        painter.setPen(QColor("white"))
+        for index, line in enumerate(lines):
+            painter.drawText(box.left() + 8, box.top() + 6 + metrics.ascent() + index * metrics.height(), line)
+        painter.restore()
     
     def toggle_zoom_mode(self):
         if self.transform().m11() == 1.0:  # If the current zoom is 100% (original size)
@@ -122,6 +243,7 @@ class ImageViewer(QGraphicsView):
     def set_zoom(self, factor):
         self.resetTransform()  # Reset any existing transformations
         self.scale(factor, factor)  # Apply the new zoom factor
+        self.__update_display_level()
 
 
     def create_new_button(self, icon, connect_to) -> QGraphicsProxyWidget:
@@ -136,7 +258,7 @@ class ImageViewer(QGraphicsView):
         return new_button_proxy
     
     def channel_option_selected(self, option):
-        print(f"Selected curve option: {option}")
+        logger.debug("Selected curve option: %s", option)
         self.__curve_option = option
         self.update_image_info()
         # Implement functionality based on selected option
@@ -145,51 +267,49 @@ class ImageViewer(QGraphicsView):
         if self.__info_display_visible == True:
             # Update the display with new information
             if self.__current_pixmap:
-                if self.__image_path != "":
-                    # Getting file properties
-                    file_info = os.stat(self.__image_path)
-                    file_size = file_info.st_size / 1024  # Size in KB
-                    modification_time = datetime.fromtimestamp(file_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-
-                    # Getting image properties
-                    image = QImage(self.__image_path)  # Using QImage to get bit depth
-                    bit_depth = image.depth()
+                metadata = self.METADATA.get(self.__image_path) if self.__image_path != "" else None
+                if metadata is not None:
+                    # File and image properties from the headers, the pixels are not read again
+                    file_size = metadata["file_size"] / 1024  # Size in KB
+                    if "capture_time" in metadata:
+                        date_time = metadata["capture_time"].replace(":", "-", 2)  # EXIF dates are YYYY:MM:DD
+                    else:
+                        date_time = datetime.fromtimestamp(metadata["modification_time"]).strftime('%Y-%m-%d %H:%M:%S')
+                    width = metadata.get("width", int(self.sceneRect().width()))
+                    height = metadata.get("height", int(self.sceneRect().height()))
+                    bit_depth = f"{metadata['bits_per_channel']} bits per channel" if "bits_per_channel" in metadata else "Unknown"
 
                     # Preparing info text
                     info_list = [
                         f"{os.path.basename(self.__image_path)}",
                         f"{os.path.dirname(self.__image_path)}",
-                        f"{self.__image_path.split('.')[-1].upper()}",
+                        f"{metadata.get('format') or self.__image_path.split('.')[-1].upper()}",
                         f"{file_size:.2f} KB",
-                        f"{modification_time}",
-                        f"{self.__current_pixmap.width()}x{self.__current_pixmap.height()}",
-                        f"{bit_depth} bits" ]
+                        f"{date_time}",
+                        f"{width}x{height}",
+                        bit_depth ]
 
                     # self.info_label.setText(info_text)
                     self.__info_widget.update_info(info_list)
 
-                # Calculate histogram for luminance
-                option = self.__curve_option
-                image = self.convert_pixmap_to_opencv_image(self.get_current_pixmap())
-                hist = ImageProcessingAlgorithms.calculate_histogram(image, option)
-
-                # Plot histogram
-                fig, ax = plt.subplots(figsize=(4, 2))
-                fig.patch.set_alpha(0)  # Set the figure background to transparent
-                ax.patch.set_alpha(0)  # Set the axes background to transparent
-                ax.plot(hist, color='gray')
-                # ax.set_title('Histogram for Luminance')
-                # ax.set_xlabel('Bins')
-                # ax.set_ylabel('# of Pixels')
-                # Hide Y-axis
-                ax.yaxis.set_visible(False)
-                # Convert to QPixmap and display in QLabel
-                qimage = ImageProcessingAlgorithms.plot_to_qimage(fig)
-                
-                self.__info_widget.update_histogram(QPixmap.fromImage(qimage))
-
-                # Clear the figure to release memory
-                plt.close(fig)
+                self.__info_widget.update_histogram(self.__current_histograms(), self.__curve_option)
+
+    def __current_histograms(self):
+        """Return the histograms of the current pixmap, see ImageProcessingAlgorithms.calculate_histograms."""
+        pixmap = self.__current_pixmap
+        histograms = self.__histograms.get(pixmap.cacheKey())
+        if histograms is None:
+            if self.__pyramid is not None and pixmap.cacheKey() == self.__original_pixmap.cacheKey():
+                # The smallest pyramid level is an area averaged version of the original
+                sample = self.__pyramid.level(len(self.__pyramid) - 1)
+            else:
+                size = QSize(self.HISTOGRAM_SAMPLE_SIZE, self.HISTOGRAM_SAMPLE_SIZE)
+                if pixmap.width() > size.width() or pixmap.height() > size.height():
+                    pixmap = pixmap.scaled(size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.FastTransformation)
+                sample = self.convert_pixmap_to_opencv_image(pixmap)
+            histograms = ImageProcessingAlgorithms.calculate_histograms(sample)
+            self.__histograms.put(self.__current_pixmap.cacheKey(), histograms)
+        return histograms
 
     def set_crop_mode(self, enabled):
         self.__crop_mode = enabled
@@ -208,7 +328,9 @@ class ImageViewer(QGraphicsView):
     def copyImage(self):
         if self.__pixmap_item is not None:
             # Copy the pixmap
-            QApplication.clipboard().setPixmap(self.__pixmap_item.pixmap())
+            pixmap = self.get_export_pixmap()
+            if pixmap is not None:
+                QApplication.clipboard().setPixmap(pixmap)
 
     def pasteImage(self):
         # Get the pixmap from clipboard if available and add it to the scene
@@ -221,7 +343,10 @@ class ImageViewer(QGraphicsView):
         if self.__pixmap_item is not None:
             filename, _ = QFileDialog.getSaveFileName(self, "Save As", "", "Images (*.png *.jpg *.bmp)")
             if filename:
-                self.__pixmap_item.pixmap().save(filename)
+                # PNG keeps 16 bits per channel, the other formats are written at 8 bits
+                image = self.get_export_image()
+                if image is not None:
+                    image.save(filename)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -258,21 +383,25 @@ class ImageViewer(QGraphicsView):
         # Implement fit to screen functionality
         if self.__pixmap_item is not None:
             self.fitInView(self.__pixmap_item, Qt.AspectRatioMode.KeepAspectRatio)
-        print("Fit to screen.")
+            self.__update_display_level()
+        logger.debug("Fit to screen.")
             
     def show_image_in_original_size(self):
         # Implement original size functionality
         if self.__pixmap_item is not None:
-            original_size = self.__pixmap_item.pixmap().size()
-            if not original_size.isEmpty():
-                self.resetTransform()  # Reset any previous transformation
-                scene_rect = self.__pixmap_item.sceneBoundingRect()
-                width_ratio = scene_rect.width() / original_size.width()
-                height_ratio = scene_rect.height() / original_size.height()
-                self.scale(1 / width_ratio, 1 / height_ratio)
-        print("Original size.")
+            # Scene units are full resolution pixels, also for previews of reduced levels
+            self.resetTransform()  # Reset any previous transformation
+            self.__update_display_level()
+        logger.debug("Original size.")
     
-    def show_pixmap(self, new_pixmap):
+    def show_pixmap(self, new_pixmap, level=None):
+        """
+        Show a pixmap in the viewer.
+
+        :param new_pixmap: Pixmap to show.
+        :param level: Pyramid level the pixmap was rendered from, None if it is at full resolution.
+                      Reduced levels are scaled up so the scene keeps full resolution coordinates.
+        """
         if not new_pixmap.isNull():
             # Assign new_pixmap to current_pixmap if current_pixmap is None
             if self.__current_pixmap is None:
@@ -280,18 +409,14 @@ class ImageViewer(QGraphicsView):
 
             # Fix: Assign new_pixmap to original_pixmap if original_pixmap is None
             if self.__original_pixmap is None:
-                self.__original_pixmap = new_pixmap
+                self.__set_original_pixmap(new_pixmap)
 
             self.__previous_pixmap = self.__current_pixmap
+            self.__previous_level = self.__current_level
             self.__current_pixmap = new_pixmap
+            self.__current_level = level
 
-            if self.__pixmap_item and self.__pixmap_item.scene() == self.__scene:
-                self.__scene.removeItem(self.__pixmap_item)
-            
-            self.__pixmap_item = QGraphicsPixmapItem(self.__current_pixmap)
-            self.__pixmap_item.setZValue(-1)
-            self.setSceneRect(QRectF(self.__current_pixmap.rect()))  # Set scene size to image size
-            self.__scene.addItem(self.__pixmap_item)            
+            self.__display_current_pixmap()
 
         # show the rectangle over the image.
         if self.__crop_rect is not None:
@@ -306,26 +431,151 @@ class ImageViewer(QGraphicsView):
 
         self.update_image_info()
 
+    def show_previous_pixmap(self):
+        self.show_pixmap(self.__previous_pixmap, self.__previous_level)
+
     def show_new_pixmap(self, pixmap):
-        self.__original_pixmap = pixmap
+        self.__set_original_pixmap(pixmap)
         self.__previous_pixmap = pixmap
         self.__current_pixmap = pixmap
+        self.__current_level = None
         self.show_pixmap(pixmap)
         self.show_image_initial_size()
 
         # self.reset_rect()
 
-    def open_new_image(self, image_path):
+    def open_new_image(self, image_path, image=None, is_preview=False):
+        """
+        Show an image file.
+
+        :param image_path: Path of the image.
+        :param image: The decoded QImage if available, e.g. from a prefetcher.
+        :param is_preview: The image is a reduced quality decode, e.g. the preview profile of a
+                           RAW file. It is expected to be replaced with replace_original_image,
+                           exports decode the file at full quality until then.
+        """
         self.__image_path = image_path
-        image = ImageProcessingAlgorithms.load_image_to_qimage(image_path)
-        pixmap = QPixmap.fromImage(image)
+        if image is None:
+            image = ImageProcessingAlgorithms.load_image_to_qimage(image_path)
+        pixmap = self.__pixmap_from_image(image)
 
-        self.__original_pixmap = pixmap
+        self.show_new_pixmap(pixmap)
+        self.__source_is_preview = is_preview
+        # self.reset_rect()
+
+    def show_working_image(self, image):
+        """Show an image array of any working depth, e.g. an entry of the edit history, and return its pixmap."""
+        pixmap = self.convert_opencv_image_to_pixmap(image)
+        if image.dtype != np.uint8:
+            self.WORKING_IMAGES.put(pixmap.cacheKey(), image)
+        self.show_pixmap(pixmap)
+        return pixmap
+
+    def replace_original_image(self, image):
+        """
+        Replace the shown image with another decode of the same file, e.g. the full quality
+        RAW decode replacing the preview. The zoom and the visible area are kept, even if
+        the resolution differs.
+        """
+        pixmap = self.__pixmap_from_image(image)
+        old_rect = self.sceneRect()
+        center = self.mapToScene(self.viewport().rect().center())
+        factor = old_rect.width() / pixmap.width() if old_rect.width() else 1.0
+        zoom = self.transform().m11() * factor
+
+        self.__set_original_pixmap(pixmap)
         self.__previous_pixmap = pixmap
         self.__current_pixmap = pixmap
+        self.__current_level = None
         self.show_pixmap(pixmap)
-        self.show_image_initial_size()
-        # self.reset_rect()
+
+        self.setTransform(QTransform.fromScale(zoom, zoom))
+        self.centerOn((center.x() - old_rect.left()) / factor, (center.y() - old_rect.top()) / factor)
+        self.__update_display_level()
+        self.__reposition_buttons()
+
+    def __pixmap_from_image(self, image):
+        """Convert a decoded image to a pixmap, keeping its high bit depth data for the edits."""
+        with Instrumentation.span(Instrumentation.CONVERT):
+            pixmap = QPixmap.fromImage(image)
+            if ImageProcessingAlgorithms.is_high_bit_depth(image):
+                self.WORKING_IMAGES.put(pixmap.cacheKey(), ImageProcessingAlgorithms.convert_qimage_to_array(image))
+        return pixmap
+
+    def get_original_image(self):
+        """Return the original image as an array of its working depth, None if no image is open."""
+        return self.__pyramid.level(0) if self.__pyramid is not None else None
+
+    def get_working_image(self, pixmap):
+        """Return the pixels of a pixmap as an array, with the high bit depth data if it is known."""
+        working_image = self.WORKING_IMAGES.get(pixmap.cacheKey())
+        if working_image is not None:
+            return working_image
+        return self.convert_pixmap_to_opencv_image(pixmap)
+
+    def get_thumbnail_source(self, pixmap, width, height):
+        """
+        Return the smallest image a width x height thumbnail of the pixmap can be made from.
+
+        The original is taken from the smallest pyramid level covering the thumbnail, other
+        pixmaps from their high bit depth data or a QImage copy, so it can be scaled on any thread.
+        """
+        if self.__pyramid is not None and pixmap.cacheKey() == self.__original_pixmap.cacheKey():
+            scale = min(width / self.__pyramid.width(), height / self.__pyramid.height())
+            return self.__pyramid.level(self.__pyramid.level_for_scale(scale))
+        working_image = self.WORKING_IMAGES.get(pixmap.cacheKey())
+        return working_image if working_image is not None else pixmap.toImage()
+
+    def __set_original_pixmap(self, pixmap):
+        """Use the pixmap as the source of the edits and build its pyramid."""
+        self.__original_pixmap = pixmap
+        self.__pyramid = ImagePyramid(self.get_working_image(pixmap))
+        self.__luminance_mask = LuminanceMask(self.__pyramid)
+        self.__source_is_preview = False
+        self.__level_pixmaps = {0: pixmap}
+        self.__displayed_level = None
+        self.__pipeline_factory = None
+        self.__operations = []
+        self.__pipeline_operation = None
+        self.__render_worker.cancel()
+
+    def __view_scale(self):
+        """Number of device pixels per scene (full resolution) pixel."""
+        return self.transform().m11() * self.devicePixelRatioF()
+
+    def __display_current_pixmap(self):
+        pixmap, level = self.__current_pixmap, self.__current_level
+        self.__displayed_level = None
+        if level is None and self.__pyramid is not None and pixmap.cacheKey() == self.__original_pixmap.cacheKey():
+            # The original is displayed from the smallest level covering the view
+            level = self.__pyramid.level_for_scale(self.__view_scale())
+            if level not in self.__level_pixmaps:
+                self.__level_pixmaps[level] = self.convert_opencv_image_to_pixmap(self.__pyramid.level(level))
+            pixmap = self.__level_pixmaps[level]
+            self.__displayed_level = level
+
+        if self.__pixmap_item and self.__pixmap_item.scene() == self.__scene:
+            self.__scene.removeItem(self.__pixmap_item)
+
+        self.__pixmap_item = QGraphicsPixmapItem(pixmap)
+        self.__pixmap_item.setZValue(-1)
+        if level is not None:
+            self.__pixmap_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+            self.__pixmap_item.setScale(self.__pyramid.scale(level))
+        self.setSceneRect(self.__pixmap_item.sceneBoundingRect())  # Set scene size to full image size
+        self.__scene.addItem(self.__pixmap_item)
+        self.__frame_pending = True
+
+    def __update_display_level(self):
+        """Switch to another pyramid level after the zoom changed."""
+        if self.__pyramid is None:
+            return
+
+        level = self.__pyramid.level_for_scale(self.__view_scale())
+        if self.__current_level is not None and self.__current_level != level:
+            self.__render_preview()
+        elif self.__displayed_level is not None and self.__displayed_level != level:
+            self.__display_current_pixmap()
     
     def setImage(self, image):
         if type(image) is QPixmap:
@@ -350,10 +600,12 @@ class ImageViewer(QGraphicsView):
         pixmap = self.get_current_pixmap()
         # rect = self.get_current_crop_rect()
         if not pixmap or rect.isNull():
-            print("No pixmap or invalid crop rectangle.")
+            logger.warning("No pixmap or invalid crop rectangle.")
             return None
         # Crop the pixmap using the QRect. Note that QRect should be in the pixmap's coordinate system.
-        cropped_pixmap = pixmap.copy(rect.toRect())
+        crop_rect = rect.toRect()
+        cropped_pixmap = pixmap.copy(crop_rect)
+        self.__operations.append(EditOperation("crop", x=crop_rect.x(), y=crop_rect.y(), width=crop_rect.width(), height=crop_rect.height()))
         self.show_pixmap(cropped_pixmap)
         self.show_image_initial_size()
 
@@ -374,6 +626,7 @@ class ImageViewer(QGraphicsView):
     def zoom(self, factor):
             self.scale(factor, factor)
             self.__reposition_buttons()
+            self.__update_display_level()
     
     def updateViewer(self, zoomRect):
         if not self.hasImage():
@@ -382,6 +635,7 @@ class ImageViewer(QGraphicsView):
             self.fitInView(zoomRect, self.__aspect_ratio_mode)  # Show zoomed rect.
         else:
             self.fitInView(self.sceneRect(), self.__aspect_ratio_mode)  # Show entire image.
+        self.__update_display_level()
 
     def hasImage(self):
         """ Returns whether the scene contains an image pixmap.
@@ -560,6 +814,7 @@ class ImageViewer(QGraphicsView):
         if self.__current_pixmap:
             # Flip the pixmap vertically
             self.__current_pixmap = self.__current_pixmap.transformed(QTransform().scale(1, -1))
+            self.__operations.append(EditOperation("flip", direction="vertical"))
             # Update the pixmap item with the new pixmap
             self.show_pixmap(self.__current_pixmap)
             self.show_image_initial_size()  # Adjust the view to fit the flipped image
@@ -569,6 +824,7 @@ class ImageViewer(QGraphicsView):
         if self.__current_pixmap:
             # Flip the pixmap horizontally
             self.__current_pixmap = self.__current_pixmap.transformed(QTransform().scale(-1, 1))
+            self.__operations.append(EditOperation("flip", direction="horizontal"))
             # Update the pixmap item with the new pixmap
             self.show_pixmap(self.__current_pixmap)
             self.show_image_initial_size()  # Adjust the view to fit the flipped image
@@ -578,6 +834,7 @@ class ImageViewer(QGraphicsView):
         if self.__current_pixmap:
             # Rotate the pixmap 90 degrees counter-clockwise
             self.__current_pixmap = self.__current_pixmap.transformed(QTransform().rotate(-90))
+            self.__operations.append(EditOperation("rotate", angle=-90))
             # Update the pixmap item with the new pixmap
             self.show_pixmap(self.__current_pixmap)
             self.show_image_initial_size()  # Adjust the view to fit the rotated image
@@ -587,70 +844,209 @@ class ImageViewer(QGraphicsView):
         if self.__current_pixmap:
             # Rotate the pixmap 90 degrees clockwise
             self.__current_pixmap = self.__current_pixmap.transformed(QTransform().rotate(90))
+            self.__operations.append(EditOperation("rotate", angle=90))
             # Update the pixmap item with the new pixmap
             self.show_pixmap(self.__current_pixmap)
             self.show_image_initial_size()  # Adjust the view to fit the rotated image
             self.reset_rect()
 
     def adjust_lightning(self, contrast_value, brightness_value, gamma_value, shadows_value, highlights_value):
-        print("Adjust Contrast: %.2f  Brightness: %.2f  Gamma: %.2f Shadows: %.2f Highlights: %.2f" % (contrast_value, brightness_value, gamma_value, shadows_value, highlights_value))
+        logger.debug("Adjust Contrast: %.2f  Brightness: %.2f  Gamma: %.2f Shadows: %.2f Highlights: %.2f",
+                     contrast_value, brightness_value, gamma_value, shadows_value, highlights_value)
 
-        mask_fulres_cv = self.create_mask_luminance()
-
-        image_cv = self.convert_pixmap_to_opencv_image(self.get_original_pixmap())
-        image_cv = ImageProcessingAlgorithms.adjust_contrast_brightness_gamma(image_cv, contrast_value, brightness_value, gamma_value, shadows_value, highlights_value, mask_fulres_cv)
-        image_pixmap = self.convert_opencv_image_to_pixmap(image_cv)
-        self.__current_pixmap = image_pixmap
-        self.show_pixmap(self.__current_pixmap)
+        self.apply_operation(EditOperation("lighting", contrast=contrast_value, brightness=brightness_value, gamma=gamma_value,
+                                           shadows=shadows_value, highlights=highlights_value))
 
     def adjust_colors(self, temperature_value, saturation_value, hue_value, red_value, green_value, blue_value):
-        print("Adjust Colors : temperature_value:  %.2f, saturation_value:  %.2f, hue_value:  %.2f, red_value:  %.2f, green_value:  %.2f, blue_value: %.2f" % (temperature_value, saturation_value, hue_value, red_value, green_value, blue_value))
-        
         temperature_value = np.clip(temperature_value*5500 + 1050, 1000, 12000)
-        print("Adjust Temperature: %.2f Kelvin" % (temperature_value))
-        
         hue_value = hue_value*180
-        print("Hue shift: %.2f degrees" % (hue_value))
-        
+        logger.debug("Adjust Colors: temperature %.2f Kelvin, saturation %.2f, hue shift %.2f degrees, red %.2f, green %.2f, blue %.2f",
+                     temperature_value, saturation_value, hue_value, red_value, green_value, blue_value)
 
-        image_cv = self.convert_pixmap_to_opencv_image(self.get_original_pixmap())
-        image_cv = ImageProcessingAlgorithms.change_color_temperature(image_cv, temperature_value, red_value, green_value, blue_value)
-        image_cv = ImageProcessingAlgorithms.adjust_saturation_hue(image_cv, saturation_value, hue_value)
-        
-        image_pixmap = self.convert_opencv_image_to_pixmap(image_cv)
-        self.__current_pixmap = image_pixmap
-        self.show_pixmap(self.__current_pixmap)
-    
-    def create_mask_luminance(self):
-        grayscale_image = self.get_original_pixmap().toImage().convertToFormat(QImage.Format.Format_Grayscale8)
-        mask_lowres = grayscale_image.scaled(64, 64)    
-        mask_fulres = mask_lowres.scaled(self.get_original_pixmap().width(), 
-                                            self.get_original_pixmap().height(), 
-                                            Qt.AspectRatioMode.IgnoreAspectRatio, 
-                                            Qt.TransformationMode.SmoothTransformation)
-        
-        mask_fulres_cv = ImageProcessingAlgorithms.convert_qimage_to_array(mask_fulres)[:,:,0] # decerease the 3 dimension to 2
-        return mask_fulres_cv
+        self.apply_operation(EditOperation("colors", kelvin=float(temperature_value), saturation=saturation_value, hue_shift=hue_value,
+                                           red_gain=red_value, green_gain=green_value, blue_gain=blue_value))
+
+    def apply_operation(self, operation):
+        """Apply a pipeline EditOperation to the original image, see apply_pipeline."""
+        if self.__pyramid is None:
+            return
+
+        self.apply_pipeline(operation.pipeline_factory(self.__pyramid))
+        self.__pipeline_operation = operation
+
+    def get_operations(self):
+        """
+        Return the EditOperations that turn the original image into the current one.
+
+        They are the geometric operations (crop, rotate, flip) in the order they were
+        made, or the pipeline operation last applied, see apply_operation.
+        """
+        operations = list(self.__operations)
+        if self.__pipeline_factory is not None and self.__pipeline_operation is not None:
+            operations.append(self.__pipeline_operation)
+        return operations
+
+    def apply_pipeline(self, pipeline_factory):
+        """
+        Apply a pipeline to the original image and show a preview of the result.
+
+        The preview is rendered on the render thread and shown when ready. Calls made
+        while a preview is rendering replace each other, only the newest one is shown.
+
+        :param pipeline_factory: Callable returning the PixelPipeline. It is called on the
+                                 render thread, so it must only use the values it was given.
+        """
+        if self.__pyramid is None:
+            return
+
+        self.__pipeline_factory = pipeline_factory
+        self.__pipeline_operation = None  # Set by apply_operation
+        self.__render_preview()
+
+    def __render_job(self, level):
+        """Return a render job of the pipeline on the given pyramid level, safe to run on any thread."""
+        pyramid = self.__pyramid
+        luminance_mask = self.__luminance_mask
+        pipeline_factory = self.__pipeline_factory
+
+        def job(is_outdated):
+            pipeline = pipeline_factory()
+            image_cv = pyramid.level(level)
+            mask_cv = None
+            if pipeline.requires_mask():
+                mask_cv = luminance_mask.for_level(level)
+            if is_outdated():
+                return None
+
+            with Instrumentation.span(Instrumentation.APPLY, level=level):
+                result_cv = pipeline.apply(image_cv, mask_cv)
+            if is_outdated():
+                return None
+            with Instrumentation.span(Instrumentation.CONVERT, level=level):
+                # The wrapper crosses the thread with frame_ready, declared with object, and keeps the array alive
+                return ImageProcessingAlgorithms.convert_array_to_qimage(ImageProcessingAlgorithms.to_display_uint8(result_cv), copy=False), level
+        return job
+
+    def __render_full_resolution_pixmap(self, progress_callback=None, is_cancelled=None):
+        """Render the pipeline on the full resolution image with the tiled renderer, see TiledRenderer.render."""
+        pipeline = self.__pipeline_factory()
+        mask_cv = self.__luminance_mask.for_level(0) if pipeline.requires_mask() else None
+        with Instrumentation.span(Instrumentation.APPLY, level=0):
+            result_cv = TiledRenderer().render(self.__pyramid.level(0), pipeline, mask_cv, progress_callback, is_cancelled)
+        if result_cv is None:
+            return None
+        pixmap = self.convert_opencv_image_to_pixmap(result_cv)
+        if result_cv.dtype != np.uint8:
+            self.WORKING_IMAGES.put(pixmap.cacheKey(), result_cv)
+        return pixmap
+
+    def __render_preview(self):
+        """Render the pipeline on the smallest pyramid level covering the view."""
+        level = self.__pyramid.level_for_scale(self.__view_scale())
+        self.__render_worker.submit(self.__render_job(level))
+
+    def __show_rendered_frame(self, generation, frame):
+        if not self.__render_worker.is_latest(generation):
+            return  # An edit or a confirmed result arrived in the meantime
+
+        image, level = frame
+        with Instrumentation.span(Instrumentation.CONVERT, level=level):
+            pixmap = QPixmap.fromImage(image)
+        self.show_pixmap(pixmap, level)
+
+    def get_full_resolution_pixmap(self):
+        """Return the current image at full resolution, rendering the pipeline if only a preview exists."""
+        if not self.__current_level:
+            return self.__current_pixmap
+        return self.__render_full_resolution_pixmap()
+
+    def set_export_renderer(self, renderer):
+        """
+        Set how the edits of a preview decode are exported at full quality, see get_export_image.
+
+        :param renderer: Callable returning the shown edit rendered on the full quality decode
+                         as an array, or None if it was cancelled. None exports the preview.
+        """
+        self.__export_renderer = renderer
+
+    def get_export_image(self):
+        """
+        Return the image to copy or save as a QImage, with the high bit depth data if it is known.
+
+        The unedited original of a preview decode is decoded at full quality, its edits are
+        rendered at full quality by the export renderer.
+
+        :return: The image, or None if the export renderer was cancelled.
+        """
+        is_unedited = self.__current_pixmap is not None and self.__current_pixmap.cacheKey() == self.__original_pixmap.cacheKey()
+        if self.__source_is_preview and is_unedited:
+            image = ImageProcessingAlgorithms.load_image_to_qimage(self.__image_path, ImageProcessingAlgorithms.RAW_PROFILE_FULL)
+            if image is not None:
+                return image
+        elif self.__source_is_preview and self.__export_renderer is not None:
+            image = self.__export_renderer()
+            return None if image is None else ImageProcessingAlgorithms.convert_array_to_qimage(image)
+
+        pixmap = self.get_full_resolution_pixmap()
+        working_image = self.WORKING_IMAGES.get(pixmap.cacheKey())
+        if working_image is None:
+            return pixmap.toImage()
+        return ImageProcessingAlgorithms.convert_array_to_qimage(working_image)
+
+    def get_export_pixmap(self):
+        """Return the pixmap to copy, see get_export_image."""
+        image = self.get_export_image()
+        return None if image is None else QPixmap.fromImage(image)
+
+    def render_full_resolution(self, progress_callback=None, is_cancelled=None):
+        """
+        Replace the preview with the full resolution result, e.g. to confirm the edit.
+
+        :param progress_callback: Called with (finished tiles, number of tiles) on the GUI thread.
+        :param is_cancelled: Returns True to stop the render, the preview is kept.
+        :return: False if the render was cancelled.
+        """
+        if self.__pyramid is None:
+            return True
+
+        # Previews still rendering would replace the result
+        self.__render_worker.cancel()
+        if self.__pipeline_factory is None:
+            self.show_pixmap(self.__original_pixmap)
+            return True
+
+        pixmap = self.__render_full_resolution_pixmap(progress_callback, is_cancelled)
+        if pixmap is None:
+            self.__render_preview()  # The cancelled render dropped the queued preview
+            return False
+        self.show_pixmap(pixmap)
+        return True
+
+    def create_mask_luminance(self, width=None, height=None):
+        width = self.__pyramid.width() if width is None else width
+        height = self.__pyramid.height() if height is None else height
+        return self.__luminance_mask.for_size(width, height)
     
     def apply_lut_to_current_pixmap(self, lut_global, lut_shadows, lut_highlight, mask, channel):
-        print("Apply LUT to current image.")
+        logger.debug("Apply LUT to current image.")
 
-        if self.__original_pixmap is not None:
-            mask_fulres_cv = self.create_mask_luminance()
-            
-            image_cv = self.convert_pixmap_to_opencv_image(self.get_original_pixmap())
-            image_cv = ImageProcessingAlgorithms.apply_lut_global(image_cv, lut_global, channel)
-            image_cv = ImageProcessingAlgorithms.apply_lut_local(image_cv, lut_shadows, lut_highlight, channel, mask_fulres_cv)
-            image_pixmap = self.convert_opencv_image_to_pixmap(image_cv)
+        # The curve widgets keep editing their arrays, the operation gets copies
+        self.apply_operation(EditOperation("curves", lut_global=np.asarray(lut_global).tolist(), lut_shadows=np.asarray(lut_shadows).tolist(),
+                                           lut_highlight=np.asarray(lut_highlight).tolist(), channel=channel))
 
-            self.__current_pixmap = image_pixmap
-            self.show_pixmap(self.__current_pixmap)
+    def apply_curves(self, points_global, points_shadows, points_highlight, channel):
+        """Apply the curves of the curve widgets given by their control points, see ImageProcessingAlgorithms.curve_lut."""
+        self.apply_operation(EditOperation("curves", points_global=points_global, points_shadows=points_shadows,
+                                           points_highlight=points_highlight, channel=channel))
 
     def convert_pixmap_to_opencv_image(self, pixmap):
-        return ImageProcessingAlgorithms.convert_qimage_to_array(pixmap.toImage())
+        with Instrumentation.span(Instrumentation.CONVERT):
+            return ImageProcessingAlgorithms.convert_qimage_to_array(pixmap.toImage())
 
     def convert_opencv_image_to_pixmap(self, cv_image):
-        return QPixmap.fromImage(ImageProcessingAlgorithms.convert_array_to_qimage(cv_image))
+        # Pixmaps are for display, high bit depth images are converted to 8 bits here
+        with Instrumentation.span(Instrumentation.CONVERT):
+            return QPixmap.fromImage(ImageProcessingAlgorithms.convert_array_to_qimage(ImageProcessingAlgorithms.to_display_uint8(cv_image), copy=False))
     
             
     
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the luminance mask service of the image viewer.
+
+The mask separating shadows from highlights only depends on the source image, so it
+is computed once per source from the smallest pyramid level and scaled up on demand.
+Every resolution is kept, so slider edits reuse the mask of the previewed level and
+confirming an edit reuses the full resolution one. A new source image, e.g. after
+cropping or rotating, gets a new LuminanceMask.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+
+import cv2
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+import src.util.Instrumentation as Instrumentation
+
+
+class LuminanceMask:
+    """Memoized luminance masks of one source image, safe to use from the render threads."""
+
+    MASK_SIZE = 64
+
+    def __init__(self, pyramid):
+        self.__pyramid = pyramid
+        self.__mask_lowres = None
+        self.__masks = {}  # (width, height) -> read-only mask
+        self.__lock = threading.Lock()
+
+    def for_size(self, width, height):
+        """Return the mask scaled to width x height. The array is shared and read-only."""
+        with self.__lock:
+            mask = self.__masks.get((width, height))
+            if mask is None:
+                with Instrumentation.span(Instrumentation.MASK, width=width, height=height):
+                    if self.__mask_lowres is None:
+                        smallest_level = self.__pyramid.level(len(self.__pyramid) - 1)
+                        self.__mask_lowres = ImageProcessingAlgorithms.luminance_mask_lowres(smallest_level, self.MASK_SIZE)
+                    mask = cv2.resize(self.__mask_lowres, (width, height), interpolation=cv2.INTER_LINEAR)
+                mask.setflags(write=False)
+                self.__masks[(width, height)] = mask
+            return mask
+
+    def for_level(self, index):
+        """Return the mask of the given pyramid level."""
+        image = self.__pyramid.level(index)
+        return self.for_size(image.shape[1], image.shape[0])
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file compiles the point-wise adjustments of the editing windows into a single
+per-pixel pass over the image.
+
+Every stage of an edit (curves, lighting, temperature, saturation/hue) is a function
+of the pixel value only, optionally weighted by the luminance mask. Instead of running
+one full-image pass per stage, the stages are folded into:
+
+    1. one lookup table per channel,
+    2. an optional 3D lookup table for stages mixing the channels (saturation/hue),
+    3. an optional pair of lookup tables blended by the luminance mask.
+
+Applying the compiled pipeline reads and writes the image once, whatever the number
+of stages.
+
+uint16 and float images (e.g. 16 bit RAW decodes, EXR files or the float16 levels of
+the image pyramid) keep their depth: the lookup tables are resampled to 16 bit and the
+channel mixing stages run on float32 instead of the 3D lookup table.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import cv2
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+import src.util.Instrumentation as Instrumentation
+
+CHANNELS = {"Red": 0, "Green": 1, "Blue": 2}
+
+
+def identity_luts():
+    return np.tile(np.arange(256, dtype=np.uint8), (3, 1))
+
+
+class PixelPipeline:
+    """Point-wise edit stages folded into a single pass over the image."""
+
+    # Spacing of the 3D LUT lattice in the red and green axes. 255 = 51 * 5, so every
+    # lattice node is an exact 8 bit value. The blue axis is stored at full resolution.
+    LATTICE_STEP = 5
+    LATTICE_SIZE = 255 // LATTICE_STEP + 1
+
+    # Number of image rows processed at once by the 3D LUT, bounds the size of the remap tables.
+    ROWS_PER_BAND = 256
+
+    def __init__(self):
+        self.__pre_luts = identity_luts()     # applied before the 3D LUT
+        self.__post_luts = identity_luts()    # applied after the 3D LUT
+        self.__lattice = None                 # 3D LUT as a remap texture, see add_color_transform
+        self.__blend_luts = None              # (lut_1, lut_2) blended by the mask, applied last
+        self.__blend_space = None             # "RGB" or "Luminance"
+        self.__color_stages = []              # [function, luts applied after it] of the high bit depth path
+        self.__expanded_luts = {}             # Tables of expand_lut, built once per pipeline
+
+    def is_identity(self):
+        return (self.__lattice is None and self.__blend_luts is None
+                and np.array_equal(self.__pre_luts, identity_luts()))
+
+    def requires_mask(self):
+        return self.__blend_luts is not None
+
+    def add_lut(self, lut, channel=None):
+        """
+        Append a lookup table stage.
+
+        :param lut: 256 entry lookup table.
+        :param channel: "Red", "Green", "Blue" or None to apply the table to every channel.
+        :return: The pipeline, to allow chaining.
+        """
+        self.__check_not_blended()
+        self.__expanded_luts.clear()
+        lut = ImageProcessingAlgorithms.as_lut(lut)
+        channels = range(3) if channel is None else [CHANNELS[channel]]
+        target = self.__pre_luts if self.__lattice is None else self.__post_luts
+        for c in channels:
+            target[c] = lut[target[c]]
+        return self
+
+    def add_channel_luts(self, luts):
+        """
+        Append a stage with one lookup table per channel.
+
+        :param luts: Array of shape (3, 256) with the R, G and B lookup tables.
+        :return: The pipeline, to allow chaining.
+        """
+        for channel, lut in zip(CHANNELS, luts):
+            self.add_lut(lut, channel)
+        return self
+
+    def add_color_transform(self, function):
+        """
+        Append a stage that mixes the color channels, e.g. a saturation or hue change.
+
+        The function is sampled once on a lattice of RGB values and stored as a 3D LUT,
+        which is interpolated at every pixel.
+
+        :param function: Callable taking an RGB uint8 image and returning it as uint8, and
+                         taking a float32 image and returning it as float32 for high
+                         bit depth images.
+        :return: The pipeline, to allow chaining.
+        """
+        self.__check_not_blended()
+        self.__expanded_luts.clear()
+        step = self.LATTICE_STEP
+        size = self.LATTICE_SIZE
+
+        if self.__lattice is None:
+            # Texture layout: row = green node, column = blue value * size + red node
+            nodes = np.arange(size, dtype=np.uint8) * step
+            blue = np.arange(256, dtype=np.uint8)
+            g, b, r = np.meshgrid(nodes, blue, nodes, indexing="ij")
+            samples = np.stack([r, g, b], axis=-1).reshape(size, 256 * size, 3)
+        else:
+            # Stages after an existing 3D LUT are composed on its lattice
+            samples = cv2.LUT(self.__lattice, ImageProcessingAlgorithms.as_lut(self.__post_luts))
+            self.__color_stages[-1][1] = self.__post_luts
+            self.__post_luts = identity_luts()
+
+        self.__color_stages.append([function, identity_luts()])
+        self.__lattice = np.ascontiguousarray(function(np.ascontiguousarray(samples)), dtype=np.uint8)
+        return self
+
+    def add_masked_luts(self, lut_1, lut_2, channel=None):
+        """
+        Append the final stage: two lookup tables blended by the luminance mask.
+
+        :param lut_1: Lookup table used where the mask is 0 (shadows).
+        :param lut_2: Lookup table used where the mask is 255 (highlights).
+        :param channel: "Luminance" to work on the HSV value, "Red", "Green", "Blue"
+                        for a single channel, or None for every RGB channel.
+        :return: The pipeline, to allow chaining.
+        """
+        self.__check_not_blended()
+        self.__expanded_luts.clear()
+        lut_1 = ImageProcessingAlgorithms.as_lut(lut_1)
+        lut_2 = ImageProcessingAlgorithms.as_lut(lut_2)
+
+        if channel == "Luminance":
+            self.__blend_space = "Luminance"
+            self.__blend_luts = (lut_1, lut_2)
+            return self
+
+        self.__blend_space = "RGB"
+        blend_1 = identity_luts()
+        blend_2 = identity_luts()
+        channels = range(3) if channel is None else [CHANNELS[channel]]
+        for c in channels:
+            blend_1[c] = lut_1
+            blend_2[c] = lut_2
+
+        if self.__lattice is None:
+            # No 3D LUT: fold the per-channel tables into the blended ones
+            blend_1 = np.take_along_axis(blend_1, self.__pre_luts.astype(np.intp), axis=1)
+            blend_2 = np.take_along_axis(blend_2, self.__pre_luts.astype(np.intp), axis=1)
+            self.__pre_luts = identity_luts()
+        self.__blend_luts = (blend_1, blend_2)
+        return self
+
+    def apply(self, image, mask=None):
+        """
+        Apply the pipeline to an RGB image.
+
+        :param image: Array of shape (height, width, 3), uint8, uint16 or float. An alpha
+                      channel, shape (height, width, 4), is kept as it is.
+        :param mask: Luminance mask of shape (height, width), required if requires_mask().
+        :return: New image with the dtype and channels of the input.
+        """
+        if self.requires_mask() and mask is None:
+            raise ValueError("This pipeline blends two LUTs and requires a luminance mask.")
+
+        if image.shape[2] == 4:
+            # The tables are built for RGB, e.g. a PNG with transparency
+            rgb = self.apply(np.ascontiguousarray(image[:, :, :3]), mask)
+            return np.dstack((rgb, image[:, :, 3]))
+
+        if image.dtype != np.uint8:
+            return self.__apply_high_bit(image, mask)
+
+        if self.__lattice is not None:
+            image = self.__apply_lattice(image)
+        elif not np.array_equal(self.__pre_luts, identity_luts()):
+            image = cv2.LUT(image, ImageProcessingAlgorithms.as_lut(self.__pre_luts))
+        elif self.__blend_luts is None:
+            image = image.copy()
+
+        if self.__blend_luts is None:
+            return image
+
+        lut_1, lut_2 = self.__blend_luts
+        if self.__blend_space == "Luminance":
+            hsv_image = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+            hsv_image[:, :, 2] = ImageProcessingAlgorithms.blend_luts_with_mask(cv2.extractChannel(hsv_image, 2), lut_1, lut_2, mask)
+            return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2RGB)
+        return ImageProcessingAlgorithms.blend_luts_with_mask(image, lut_1, lut_2, mask)
+
+    def __apply_lattice(self, image):
+        # Map every pixel to its texture coordinate, the per-channel LUTs are folded in
+        size = self.LATTICE_SIZE
+        pre = self.__pre_luts.astype(np.float32)
+        lut_x_red = np.ascontiguousarray(pre[0] / self.LATTICE_STEP)
+        lut_x_blue = np.ascontiguousarray(pre[2] * size)
+        lut_y_green = np.ascontiguousarray(pre[1] / self.LATTICE_STEP)
+
+        texture = self.__lattice
+        if not np.array_equal(self.__post_luts, identity_luts()):
+            texture = cv2.LUT(texture, ImageProcessingAlgorithms.as_lut(self.__post_luts))
+
+        output = np.empty_like(image)
+        for top in range(0, image.shape[0], self.ROWS_PER_BAND):
+            band = image[top:top + self.ROWS_PER_BAND]
+            map_x = cv2.LUT(cv2.extractChannel(band, 0), lut_x_red)
+            map_x += cv2.LUT(cv2.extractChannel(band, 2), lut_x_blue)
+            map_y = cv2.LUT(cv2.extractChannel(band, 1), lut_y_green)
+            cv2.remap(texture, map_x, map_y, cv2.INTER_LINEAR, dst=output[top:top + self.ROWS_PER_BAND], borderMode=cv2.BORDER_REPLICATE)
+        return output
+
+    def __apply_high_bit(self, image, mask):
+        if self.is_identity():
+            return image.copy()
+
+        if not np.array_equal(self.__pre_luts, identity_luts()):
+            result = ImageProcessingAlgorithms.apply_lut_high_bit(image, self.__expanded("pre", self.__pre_luts))
+        else:
+            result = ImageProcessingAlgorithms.to_float32(image)
+
+        for index, (function, luts) in enumerate(self.__color_stages):
+            result = function(result)
+            if index == len(self.__color_stages) - 1:
+                luts = self.__post_luts
+            if not np.array_equal(luts, identity_luts()):
+                result = ImageProcessingAlgorithms.apply_lut_high_bit(result, self.__expanded(("post", index), luts))
+
+        if self.__blend_luts is not None:
+            lut_1 = self.__expanded("blend_1", self.__blend_luts[0])
+            lut_2 = self.__expanded("blend_2", self.__blend_luts[1])
+            if self.__blend_space == "Luminance":
+                # Changing the HSV value scales the RGB channels, black becomes gray
+                value = result.max(axis=2)
+                new_value = ImageProcessingAlgorithms.blend_luts_with_mask_high_bit(value, lut_1, lut_2, mask)
+                ratio = new_value / np.maximum(value, np.float32(1e-6))
+                result = result * ratio[:, :, None]
+                np.copyto(result, new_value[:, :, None], where=(value == 0)[:, :, None])
+            else:
+                result = ImageProcessingAlgorithms.blend_luts_with_mask_high_bit(result, lut_1, lut_2, mask)
+
+        return ImageProcessingAlgorithms.from_float32(result, image.dtype)
+
+    def __expanded(self, key, luts):
+        # Resampling the tables costs more than applying them to a tile, do it once
+        table = self.__expanded_luts.get(key)
+        if table is None:
+            with Instrumentation.span(Instrumentation.LUT_BUILD, table=str(key)):
+                table = ImageProcessingAlgorithms.expand_lut(luts, np.float32)
+            self.__expanded_luts[key] = table
+        return table
+
+    def __check_not_blended(self):
+        if self.__blend_luts is not None:
+            raise ValueError("The masked LUT blend must be the last stage of the pipeline.")
+
+
+@Instrumentation.timed(Instrumentation.LUT_BUILD)
+def lighting_pipeline(min_val, max_val, contrast_value, brightness_value, gamma_value, shadows_value, highlights_value):
+    """Pipeline of WindowLighting, see ImageProcessingAlgorithms.adjust_contrast_brightness_gamma."""
+    lut_shadows, lut_highlights = ImageProcessingAlgorithms.lighting_luts(min_val, max_val, contrast_value, brightness_value, gamma_value, shadows_value, highlights_value)
+    return PixelPipeline().add_masked_luts(lut_shadows, lut_highlights)
+
+
+@Instrumentation.timed(Instrumentation.LUT_BUILD)
+def colors_pipeline(kelvin_value, saturation_value, hue_shift, red_gain, green_gain, blue_gain):
+    """Pipeline of WindowColors, see change_color_temperature and adjust_saturation_hue."""
+    pipeline = PixelPipeline()
+    pipeline.add_channel_luts(ImageProcessingAlgorithms.color_temperature_luts(kelvin_value, red_gain, green_gain, blue_gain))
+    if saturation_value != 1 or int((hue_shift / 360.0) * 180) != 0:
+        pipeline.add_color_transform(lambda image: ImageProcessingAlgorithms.adjust_saturation_hue(image, saturation_value, hue_shift))
+    return pipeline
+
+
+@Instrumentation.timed(Instrumentation.LUT_BUILD)
+def curves_pipeline(lut_global, lut_shadows, lut_highlight, channel):
+    """Pipeline of WindowCurveAdjustement, see apply_lut_global and apply_lut_local."""
+    if channel not in ["Luminance"] + list(CHANNELS):
+        raise ValueError(f"Option must be one of {['Luminance'] + list(CHANNELS)}")
+
+    # Both local curves act on the output of the global curve
+    lut_global = ImageProcessingAlgorithms.as_lut(lut_global)
+    lut_shadows = ImageProcessingAlgorithms.as_lut(lut_shadows)[lut_global]
+    lut_highlight = ImageProcessingAlgorithms.as_lut(lut_highlight)[lut_global]
+    return PixelPipeline().add_masked_luts(lut_shadows, lut_highlight, channel)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the background thread rendering the previews of the editing windows.
+
+Jobs are submitted from the GUI thread, e.g. on every slider step. Only the newest job
+is kept: submitting a job replaces the one waiting in the queue, and a job that becomes
+outdated while it runs is abandoned. Finished frames are posted back with frame_ready.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+
+from PyQt6.QtCore import QThread, QCoreApplication, pyqtSignal
+
+
+class RenderWorker(QThread):
+    """Render thread with latest-wins scheduling."""
+
+    # Generation of the job and its result, emitted only if the job is still the newest one
+    frame_ready = pyqtSignal(int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.__condition = threading.Condition()
+        self.__pending_job = None
+        self.__generation = 0
+        self.__stopped = False
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def submit(self, job):
+        """
+        Queue a render job, replacing the job still waiting in the queue.
+
+        :param job: Callable taking an is_outdated() callable and returning the result,
+                    or None if it gave up because it became outdated.
+        :return: The generation assigned to the job.
+        """
+        with self.__condition:
+            self.__generation += 1
+            self.__pending_job = (self.__generation, job)
+            self.__condition.notify()
+            generation = self.__generation
+
+        if not self.isRunning():
+            self.start()
+        return generation
+
+    def cancel(self):
+        """Drop the queued job and mark the running one as outdated."""
+        with self.__condition:
+            self.__generation += 1
+            self.__pending_job = None
+
+    def is_latest(self, generation):
+        return generation == self.__generation
+
+    def stop(self):
+        with self.__condition:
+            self.__stopped = True
+            self.__pending_job = None
+            self.__condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.__condition:
+                while self.__pending_job is None and not self.__stopped:
+                    self.__condition.wait()
+                if self.__stopped:
+                    return
+                generation, job = self.__pending_job
+                self.__pending_job = None
+
+            result = job(lambda: not self.is_latest(generation))
+            if result is not None and self.is_latest(generation):
+                self.frame_ready.emit(generation, result)
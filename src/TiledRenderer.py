@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of VisuAlysium, which is released under the GNU General Public License (GPL).
+# See the LICENSE or COPYING file in the root of this project or visit
+# http://www.gnu.org/licenses/gpl-3.0.html for the full text of the license.
+
+"""
+VisuAlysium
+=================================================================
+
+This file includes the tile-parallel renderer used for the full resolution result
+of an edit, e.g. when the edit is confirmed.
+
+The image is split into tiles of full rows, which keeps every tile contiguous in
+memory and small enough to stay in the cache. The tiles are rendered on a thread
+pool (OpenCV and NumPy release the GIL) and written into a preallocated output.
+
+(c) Visualysium, 2024
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+
+class TiledRenderer:
+    """Render a PixelPipeline tile by tile on a thread pool."""
+
+    TILE_BYTES = 1 << 20  # Approximate size of the input of one tile
+
+    def __init__(self, max_workers=None):
+        self.__max_workers = max_workers or os.cpu_count() or 1
+
+    def tiles(self, image):
+        """Return the (top, bottom) rows of the tiles of an image."""
+        row_bytes = image.shape[1] * (image.shape[2] if image.ndim == 3 else 1) * image.itemsize
+        rows = max(16, self.TILE_BYTES // max(row_bytes, 1))
+        return [(top, min(top + rows, image.shape[0])) for top in range(0, image.shape[0], rows)]
+
+    def render(self, image, pipeline, mask=None, progress_callback=None, is_cancelled=None):
+        """
+        Apply a pipeline to an image.
+
+        The callbacks are called on the calling thread, between finished tiles, so they
+        may update a progress dialog.
+
+        :param image: RGB image, uint8, uint16 or float.
+        :param pipeline: PixelPipeline to apply.
+        :param mask: Luminance mask of the image, required if the pipeline blends two LUTs.
+        :param progress_callback: Called with (finished tiles, number of tiles).
+        :param is_cancelled: Returns True to stop the render.
+        :return: The rendered image, or None if the render was cancelled.
+        """
+        output = np.empty_like(image)
+        tiles = self.tiles(image)
+        cancelled = threading.Event()
+
+        def render_tile(top, bottom):
+            if cancelled.is_set():
+                return
+            mask_tile = None if mask is None else mask[top:bottom]
+            output[top:bottom] = pipeline.apply(image[top:bottom], mask_tile)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.__max_workers, len(tiles)))) as executor:
+            futures = [executor.submit(render_tile, top, bottom) for top, bottom in tiles]
+            for finished, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress_callback is not None:
+                    progress_callback(finished, len(tiles))
+                if is_cancelled is not None and is_cancelled():
+                    cancelled.set()
+                    for pending in futures:
+                        pending.cancel()
+                    return None
+        return output
@@ -10,7 +10,7 @@ class WindowColors(ImageEditingsWindow):
 
     def slider_values_changed(self, value):
         self.read_values_from_sliders()
-        self.image_viewer.adjust_colors(self.__temperature_value, self.__saturation_value, self.__hue_value, self.__red_value, self.__green_value, self.__blue_value)
+        self._image_viewer.adjust_colors(self.__temperature_value, self.__saturation_value, self.__hue_value, self.__red_value, self.__green_value, self.__blue_value)
 
     def read_values_from_sliders(self):
         # self.slider_layer.print_values()
@@ -1,3 +1,4 @@
+import logging
 from PyQt6.QtWidgets import  QVBoxLayout, QHBoxLayout, QLabel, QSizePolicy, QSpacerItem, QLineEdit, QApplication
 from PyQt6.QtCore import pyqtSlot, pyqtSignal, Qt, QSize
 from PyQt6.QtGui import QPixmap, QIntValidator, QPalette
@@ -5,6 +6,8 @@ import typing
 from src.WidgetUtils import HoverButton
 from src.WindowImageViewerAbstract import ImageViewerWindowAbstract
 
+logger = logging.getLogger(__name__)
+
 class CropWindow_ButtonLayout(QHBoxLayout):
     flip_v_clicked = pyqtSignal()
     flip_h_clicked = pyqtSignal()
@@ -42,10 +45,10 @@ class CropWindow_ButtonLayout(QHBoxLayout):
         self.crop_layout.addLayout(self.crop_layout_settings)
         # Assuming `layout` is the main layout, add the crop layout
         # Add a spacer item between the buttons and the crop info label
-        spacer = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
-        self.addItem(spacer)
+        # The layout deletes its items, a spacer added twice would be deleted twice
+        self.addItem(QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
         self.addLayout(self.crop_layout)
-        self.addItem(spacer)
+        self.addItem(QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
 
     def add_crop_edit_line(self,placeholder:str,signal_function:typing.Callable[[], None]) -> QLineEdit:
         """
@@ -99,7 +102,7 @@ class CropWindow_ButtonLayout(QHBoxLayout):
         self.crop_height_edit.setText(str(int(height)))
     
 class WindowCropping(ImageViewerWindowAbstract):
-    editing_confirmed = pyqtSignal(QPixmap, str)
+    editing_confirmed = pyqtSignal(QPixmap, str, list)  # Result, description, EditOperations
 
     def __init__(self):
         super().__init__()
@@ -119,14 +122,13 @@ class WindowCropping(ImageViewerWindowAbstract):
         return temp_layout
     
     def update_crop_info_in_button_layer(self, crop_rect):
-        print("Crop rect changed!")
-        print(crop_rect)
+        logger.debug("Crop rect changed: %s", crop_rect)
         # Assuming the crop_rect is a QRectF or similar
         self.editing_options_layout.set_crop_info(crop_rect.x(), crop_rect.y(), crop_rect.width(), crop_rect.height())
 
     def update_image_viewer_crop(self, x, y, width, height):
         # Update the crop rectangle of the image viewer
-        print("Update the crop rectangle of the image viewer")
+        logger.debug("Update the crop rectangle of the image viewer")
         self._image_viewer.set_crop_rectangle(x, y, width, height)
 
     def set_image(self, pixmap_image):
@@ -139,43 +141,43 @@ class WindowCropping(ImageViewerWindowAbstract):
         if self._image_viewer.get_current_pixmap() is not None:
             # Assuming ImageViewer has a method to flip the image vertically
             self._image_viewer.flip_vertical()
-            print("Flip Vertical", "The image has been flipped vertically.")
+            logger.info("The image has been flipped vertically.")
 
     def flip_horizontal(self):
         if self._image_viewer.get_current_pixmap() is not None:
             # Assuming ImageViewer has a method to flip the image horizontally
             self._image_viewer.flip_horizontal()
-            print( "Flip Horizontal", "The image has been flipped horizontally.")
+            logger.info("The image has been flipped horizontally.")
 
     def rotate_right(self):
         if self._image_viewer.get_current_pixmap() is not None:
             # Assuming ImageViewer has a method to rotate the image 90 degrees to the right
             self._image_viewer.rotate_right()
-            print( "Rotate Right", "The image has been rotated 90 degrees to the right.")
+            logger.info("The image has been rotated 90 degrees to the right.")
 
     def rotate_left(self):
         if self._image_viewer.get_current_pixmap() is not None:
             # Assuming ImageViewer has a method to rotate the image 90 degrees to the left
             self._image_viewer.rotate_left()
-            print("Rotate Left", "The image has been rotated 90 degrees to the left.")
+            logger.info("The image has been rotated 90 degrees to the left.")
 
     def ok_pressed(self):
         # Here you would typically confirm the changes and possibly close the window or reset it for another operation
-        print( "OK", "Changes have been applied.")
+        logger.info("Changes have been applied.")
         # self._image_viewer.get_current_crop_rect()
         self._image_viewer.crop_image(self._image_viewer.get_current_crop_rect())
 
-        self.editing_confirmed.emit(self._image_viewer.get_current_pixmap(), "Crop and Rotate")
+        self.editing_confirmed.emit(self._image_viewer.get_current_pixmap(), "Crop and Rotate", self._image_viewer.get_operations())
         self.close() #to close the window
     
     # Define placeholder functions for slider adjustments
     def update_image(self):
-        print("Update image")
+        logger.debug("Update image")
 
     def reset_pressed(self):
-        print("Reset placeholder.")
+        logger.debug("Reset placeholder.")
 
     def cancel_pressed(self):
         # Here you would typically revert any changes or simply close the window without applying changes
-        print("Cancel", "Operation has been cancelled.")
+        logger.info("Operation has been cancelled.")
         self.close() #to close the window
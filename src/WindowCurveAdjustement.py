@@ -1,3 +1,4 @@
+import logging
 import sys
 import cv2
 import numpy as np
@@ -9,10 +10,13 @@ from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLa
 from PyQt6.QtGui import QPainter, QPen, QColor, QLinearGradient, QBrush
 
 from src.ImageViewer import ImageViewer
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
 from src.WindowImageViewerAbstract import ImageViewerWindowAbstract
 
 from scipy.interpolate import CubicSpline, interp1d
 
+logger = logging.getLogger(__name__)
+
 class CurveWidget(QWidget):
     curve_updated = pyqtSignal()
 
@@ -85,7 +89,7 @@ class CurveWidget(QWidget):
             painter.drawLine(prev_point, current_point)
             prev_point = current_point
 
-        self.curve = np.clip(cs(x_new), 0, 255).astype(np.uint8)
+        self.curve = ImageProcessingAlgorithms.curve_lut(zip(x_vals, y_vals))
         # print(x_vals)
         # print(y_vals)
 
@@ -115,12 +119,13 @@ class CurveWidget(QWidget):
         step = (self.__width+1) // (len(self.__points) - 1)
         self.__points = [QPoint(i * step, (self.__height) - i * step) for i in range(len(self.__points))]
         
-        x_vals, y_vals = zip(*[(p.x(), 255 - p.y()) for p in self.__points])  # Prepare curve data
-        cs = interp1d(x_vals, y_vals, kind="cubic", bounds_error=False, fill_value="extrapolate")
-        x_new = np.arange(0, 256, 1)
-        self.curve = np.clip(np.round(cs(x_new)), 0, 255).astype(np.uint8)
+        self.curve = ImageProcessingAlgorithms.curve_lut(self.control_points())
         self.update()
 
+    def control_points(self):
+        """Return the control points as [x, y] lists in 0..255, y pointing up, see ImageProcessingAlgorithms.curve_lut."""
+        return [[point.x(), 255 - point.y()] for point in self.__points]
+
     def reset_curve(self):
         self.initialize_curve()  # Reset curve and update widget
 
@@ -158,7 +163,7 @@ class CurveEditingLayout(QVBoxLayout):
         self.addLayout(channel_selection_layout)
 
 class WindowCurveAdjustement(ImageViewerWindowAbstract):
-    editing_confirmed = pyqtSignal(QPixmap, str)
+    editing_confirmed = pyqtSignal(QPixmap, str, list)  # Result, description, EditOperations
     
     def __init__(self):
         super().__init__()
@@ -175,7 +180,7 @@ class WindowCurveAdjustement(ImageViewerWindowAbstract):
         return temp_layout
     
     def curve_option_selected(self, option):
-        print(f"Selected curve option: {option}")
+        logger.debug("Selected curve option: %s", option)
         self.__curve_channel = option
         self.reset_pressed()
         self.update_image()
@@ -187,15 +192,14 @@ class WindowCurveAdjustement(ImageViewerWindowAbstract):
         self.reset_pressed()
 
     def update_image(self):
-        print("Update image")
-        self._image_viewer.apply_lut_to_current_pixmap(self.editing_options_layout.curve_widget_global.curve,
-                                                      self.editing_options_layout.curve_widget_local_shadow.curve,
-                                                      self.editing_options_layout.curve_widget_local_highlight.curve,
-                                                      mask = None,
-                                                      channel=self.__curve_channel)
+        logger.debug("Update image")
+        self._image_viewer.apply_curves(self.editing_options_layout.curve_widget_global.control_points(),
+                                        self.editing_options_layout.curve_widget_local_shadow.control_points(),
+                                        self.editing_options_layout.curve_widget_local_highlight.control_points(),
+                                        channel=self.__curve_channel)
         
     def reset_pressed(self):
-        print("Reset curves.")
+        logger.debug("Reset curves.")
         self.editing_options_layout.curve_widget_global.reset_curve()
         self.editing_options_layout.curve_widget_local_highlight.reset_curve()
         self.editing_options_layout.curve_widget_local_shadow.reset_curve()
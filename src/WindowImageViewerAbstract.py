@@ -1,10 +1,13 @@
-from PyQt6.QtWidgets import QVBoxLayout, QHBoxLayout, QWidget, QLabel, QSizePolicy, QPushButton, QSpacerItem,  QGridLayout, QSlider, QApplication
+import logging
+from PyQt6.QtWidgets import QVBoxLayout, QHBoxLayout, QWidget, QLabel, QSizePolicy, QPushButton, QSpacerItem,  QGridLayout, QSlider, QApplication, QProgressDialog
 from PyQt6.QtCore import pyqtSignal, Qt
 from PyQt6.QtGui import QPixmap
 from src.ImageViewer import ImageViewer
 
+logger = logging.getLogger(__name__)
+
 class ImageViewerWindowAbstract(QWidget):
-    editing_confirmed = pyqtSignal(QPixmap, str)
+    editing_confirmed = pyqtSignal(QPixmap, str, list)  # Result, description, EditOperations
     
     def __init__(self):
         super().__init__()
@@ -13,7 +16,6 @@ class ImageViewerWindowAbstract(QWidget):
 
         # Assuming ImageViewer and LightingWindow_ButtonLayout are defined elsewhere
         self._image_viewer = ImageViewer()
-        self.__pixmap_image_orig = None
 
         # Abstract method to setup editing options
         self.editing_options_layout = self.create_editing_options_layout()
@@ -76,42 +78,52 @@ class ImageViewerWindowAbstract(QWidget):
         layout.addWidget(cancel_button)
 
     def set_image(self, pixmap_image):
+        # The viewer previews the edits on the pyramid level matching the view,
+        # the full resolution is only rendered when the edit is confirmed.
+        self._image_viewer.show_new_pixmap(pixmap_image)
         self.initialize_values()
-        self.__pixmap_image_orig = pixmap_image
-        new_width = 1024
-        new_height = 1024
-        scaled_pixmap = pixmap_image.scaled(new_width, new_height, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        self._image_viewer.show_new_pixmap(scaled_pixmap)
     
     def initialize_values(self):
-        print("Fill the function with necessary initialization values")
+        logger.debug("Fill the function with necessary initialization values")
 
     def hdtsoi_pressed(self):
-        print( "HDtSOI", "Showing original image.")
+        logger.debug("Showing original image.")
         self._image_viewer.show_pixmap(self._image_viewer.get_original_pixmap())
 
     def hdtsoi_released(self):
-        print( "HDtSOI", "Showing edited image.")
-        self._image_viewer.show_pixmap(self._image_viewer.get_previous_pixmap())
+        logger.debug("Showing edited image.")
+        self._image_viewer.show_previous_pixmap()
 
     def ok_pressed(self):
-        print( "OK", "Changes have been applied.")
-        self._image_viewer.show_new_pixmap(self.__pixmap_image_orig)
-        self.update_image()
-        self.editing_confirmed.emit(self._image_viewer.get_current_pixmap(), "Lighting Adjustment")
+        # The dialog shows up only if rendering takes longer than its minimum duration
+        progress_dialog = QProgressDialog("Applying changes...", "Cancel", 0, 100, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def show_progress(finished_tiles, number_of_tiles):
+            progress_dialog.setValue(int(100 * finished_tiles / number_of_tiles))
+
+        rendered = self._image_viewer.render_full_resolution(show_progress, progress_dialog.wasCanceled)
+        progress_dialog.close()
+        if not rendered:
+            logger.info("Applying the changes has been cancelled.")
+            return
+
+        logger.info("Changes have been applied.")
+        self.editing_confirmed.emit(self._image_viewer.get_current_pixmap(), "Lighting Adjustment", self._image_viewer.get_operations())
         self.close() #to close the window
 
     def cancel_pressed(self):
         # Here you would typically revert any changes or simply close the window without applying changes
-        print("Cancel", "Operation has been cancelled.")
+        logger.info("Operation has been cancelled.")
         self.close() #to close the window
 
     # Define placeholder functions for adjustments
     def update_image(self):
-        print("Update image")
+        logger.debug("Update image")
 
     def reset_pressed(self):
-        print("Reset placeholder.")
+        logger.debug("Reset placeholder.")
 
     def histogram_pressed(self):
         self._image_viewer.toggle_info_display()
@@ -1,3 +1,4 @@
+import logging
 from PyQt6.QtWidgets import QVBoxLayout, QHBoxLayout, QWidget, QLabel, QSizePolicy, QPushButton, QSpacerItem,  QGridLayout, QSlider, QApplication
 from PyQt6.QtCore import pyqtSignal, Qt, QSize
 from PyQt6.QtGui import QPixmap
@@ -6,6 +7,8 @@ from src.ImageViewer import ImageViewer
 from src.WidgetUtils import DoubleClickSlider
 from src.WindowImageViewerAbstract import ImageViewerWindowAbstract
 
+logger = logging.getLogger(__name__)
+
 class SliderLayout(QHBoxLayout):
 
     BUTTON_SIZE = QSize(120,60)  # Button size (width and height)
@@ -35,10 +38,10 @@ class SliderLayout(QHBoxLayout):
             self.__lighting_layout.addWidget(qlabel, mod3, div*2)
             self.__lighting_layout.addWidget(slider, mod3, (div*2)+1)
 
-        spacer = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
-        self.addItem(spacer)
+        # The layout deletes its items, a spacer added twice would be deleted twice
+        self.addItem(QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
         self.addLayout(self.__lighting_layout)
-        self.addItem(spacer)
+        self.addItem(QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
     
     def reset_sliders(self):
         for i, (label, slider) in enumerate(self.sliders.items()):
@@ -46,10 +49,10 @@ class SliderLayout(QHBoxLayout):
 
     def print_values(self):
         for i, (label, slider) in enumerate(self.sliders.items()):
-            print(label, ":" , slider.value())
+            logger.debug("%s: %s", label, slider.value())
 
 class ImageEditingsWindow(ImageViewerWindowAbstract):
-    editing_confirmed = pyqtSignal(QPixmap, str)
+    editing_confirmed = pyqtSignal(QPixmap, str, list)  # Result, description, EditOperations
     slider_list = [ "slider1"]
     def __init__(self):
         super().__init__()
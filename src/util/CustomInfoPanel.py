@@ -1,7 +1,13 @@
+import logging
+
 from PyQt6.QtWidgets import QSpacerItem, QSizePolicy, QVBoxLayout,QHBoxLayout,QComboBox, QLabel, QWidget
 from PyQt6.QtCore import Qt, QSize
 from PyQt6.QtGui import QFont
 
+from src.util.HistogramWidget import HistogramWidget
+
+logger = logging.getLogger(__name__)
+
 
 class CustomInfoPanel(QWidget):
     def __init__(self, parent=None):
@@ -78,8 +84,8 @@ class CustomInfoPanel(QWidget):
         labels_and_info_layout.addLayout(info_layout)
         layout.addLayout(labels_and_info_layout)
 
-        # Placeholder for histogram
-        self.__histogram_display = QLabel()
+        # Histogram, drawn by the widget itself
+        self.__histogram_display = HistogramWidget()
         layout.addWidget(self.__histogram_display)
 
             
@@ -102,9 +108,9 @@ class CustomInfoPanel(QWidget):
 
     def update_info(self, info_dict):
         for i,info in enumerate(info_dict):
-            print(info)
+            logger.debug("%s", info)
             self.__info_labels[i].setText(info)
 
-    def update_histogram(self, pixmap):
-        scaled_pixmap = pixmap.scaled(self.__histogram_display.width(), self.__histogram_display.height())
-        self.__histogram_display.setPixmap(scaled_pixmap)
\ No newline at end of file
+    def update_histogram(self, histograms, channel):
+        """Show the histogram of a channel, histograms holds all channels, see calculate_histograms."""
+        self.__histogram_display.set_histograms(histograms, channel)
\ No newline at end of file
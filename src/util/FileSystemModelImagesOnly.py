@@ -1,43 +1,79 @@
 from PyQt6.QtGui import QFileSystemModel, QPixmap
 from PyQt6.QtCore import QDir, QModelIndex, Qt
-from PyQt6.QtWidgets import QApplication
 from src.ImageProcessingAlgorithms import supported_extensions
+from src.util.ThumbnailLoader import ThumbnailLoader
+from src.util.PreviewCache import PreviewCache
+
+_NOT_CACHED = object()
 
 class FileSystemModelImagesOnly(QFileSystemModel):
-    def __init__(self, cacheWidth=100, cacheHeight=100):
+    PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, cacheWidth=100, cacheHeight=100, diskCache=None, previewCacheBytes=PREVIEW_CACHE_BYTES):
         super().__init__()
-        self.__previews = {'None': None}
+        # (file path, modification time) -> thumbnail QPixmap, None if the file can not be decoded
+        self.__previews = PreviewCache(previewCacheBytes)
         self.__cache_width = cacheWidth
         self.__cache_height = cacheHeight
         self.__ncols = 2
-        
+
+        # Thumbnails are decoded in the background, the file icon is shown meanwhile.
+        # diskCache is an optional ThumbnailDiskCache keeping them across sessions.
+        self.__thumbnail_loader = ThumbnailLoader(cacheWidth, cacheHeight, self, diskCache)
+        self.__thumbnail_loader.thumbnail_ready.connect(self.__thumbnail_ready)
+
         # Specify the types of files to show
         self.setNameFilters(supported_extensions)
         self.setNameFilterDisables(False)  # Hide files that are not images
 
         # Include only directories and the specified files
         # Include directories and files but exclude '.' and '..'
-        self.setFilter(QDir.Filter.AllDirs | QDir.Filter.Files | QDir.Filter.NoDotAndDotDot) 
+        self.setFilter(QDir.Filter.AllDirs | QDir.Filter.Files | QDir.Filter.NoDotAndDotDot)
 
     def getPreview(self, index: QModelIndex):
-        itemName = super().data(index, Qt.ItemDataRole.DisplayRole)
+        if self.isDir(index):
+            return super().data(index, Qt.ItemDataRole.DecorationRole)
+
+        file_path = self.filePath(index)
+        preview = self.__previews.get(self.__preview_key(index), _NOT_CACHED)
+        if preview is _NOT_CACHED:
+            self.__thumbnail_loader.request(file_path)
+        elif preview is not None:
+            return preview
+
+        return self.__placeholder(index)
+
+    def __preview_key(self, index: QModelIndex):
+        return self.filePath(index), self.lastModified(index).toMSecsSinceEpoch()
+
+    def __placeholder(self, index: QModelIndex):
+        icon = super().data(index, Qt.ItemDataRole.DecorationRole)
+        if icon is None or icon.isNull():
+            return None
+        return icon.pixmap(self.__cache_width, self.__cache_height)
 
-        if itemName not in self.__previews:
-            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)  # Set cursor to waiting
+    def __thumbnail_ready(self, file_path, image):
+        index = self.index(file_path)
+        if index.isValid():
+            self.__previews.put(self.__preview_key(index), None if image.isNull() else QPixmap.fromImage(image))
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
 
-            qpm = QPixmap(self.rootPath() + "/" + itemName)
+    def previewCache(self):
+        """Return the PreviewCache of the thumbnails, e.g. to read its counters or trim it."""
+        return self.__previews
 
-            if qpm is None or qpm.isNull():
-                qpm = super().data(index, Qt.ItemDataRole.DecorationRole)
-                if qpm and not qpm.isNull():
-                    qpm = qpm.pixmap(self.__cache_width, self.__cache_height)
-            if qpm and not qpm.isNull():
-                qpm = qpm.scaled(self.__cache_width, self.__cache_height, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    def pending_previews(self):
+        """Return the file paths whose thumbnails are still being decoded."""
+        return self.__thumbnail_loader.pending_paths()
 
-            self.__previews[itemName] = qpm
-            QApplication.restoreOverrideCursor()  # Restore the cursor
+    def drop_previews(self, file_paths):
+        """Stop decoding the thumbnails of the given file paths, they are requested again when shown."""
+        self.__thumbnail_loader.drop(file_paths)
 
-        return self.__previews[itemName]
+    def setRootPath(self, path):
+        # Thumbnails of the previous folder are not needed any more
+        self.__thumbnail_loader.drop_all()
+        return super().setRootPath(path)
 
     def data(self, index, role):
         if role == Qt.ItemDataRole.DecorationRole:
@@ -0,0 +1,71 @@
+import numpy as np
+
+from PyQt6.QtWidgets import QWidget, QSizePolicy
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QPainter, QPainterPath, QColor, QPen
+
+from src.ImageProcessingAlgorithms import HISTOGRAM_CHANNELS
+
+
+class HistogramWidget(QWidget):
+    """
+    Draw a 256 bin histogram with QPainter.
+
+    The histograms of all channels are set at once, see
+    ImageProcessingAlgorithms.calculate_histograms, switching the shown channel only
+    repaints.
+    """
+
+    CHANNEL_COLORS = {
+        "Luminance": QColor(160, 160, 160),
+        "Red": QColor(220, 60, 60),
+        "Green": QColor(60, 180, 60),
+        "Blue": QColor(70, 110, 230),
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.__histograms = None  # Array of shape (4, 256), see HISTOGRAM_CHANNELS
+        self.__channel = "Luminance"
+        self.setMinimumSize(256, 100)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+
+    def set_histograms(self, histograms, channel=None):
+        self.__histograms = histograms
+        if channel is not None:
+            self.__channel = channel
+        self.update()
+
+    def set_channel(self, channel):
+        self.__channel = channel
+        self.update()
+
+    def paintEvent(self, event):
+        if self.__histograms is None:
+            return
+
+        histogram = self.__histograms[HISTOGRAM_CHANNELS.index(self.__channel)]
+        peak = histogram.max()
+        if peak == 0:
+            return
+
+        width, height = self.width(), self.height()
+        x = np.linspace(0, width, len(histogram))
+        y = height - histogram / peak * (height - 1)
+
+        path = QPainterPath(QPointF(0, height))
+        for point_x, point_y in zip(x, y):
+            path.lineTo(point_x, point_y)
+        path.lineTo(width, height)
+        path.closeSubpath()
+
+        color = self.CHANNEL_COLORS[self.__channel]
+        fill = QColor(color)
+        fill.setAlpha(90)
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.fillPath(path, fill)
+        painter.setPen(QPen(color, 1))
+        painter.drawPath(path)
+        painter.end()
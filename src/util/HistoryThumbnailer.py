@@ -0,0 +1,78 @@
+import itertools
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QSize, pyqtSignal
+from PyQt6.QtGui import QImage
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+
+class HistoryThumbnailJob(QRunnable):
+    """Scale one image down to a thumbnail on the thread pool, see ImageProcessingAlgorithms.thumbnail_from_array."""
+
+    def __init__(self, thumbnailer, key, image, size):
+        super().__init__()
+        self.__thumbnailer = thumbnailer
+        self.__key = key
+        self.__image = image
+        self.__size = size
+
+    def run(self):
+        # The entry may have been removed while the job was waiting in the queue
+        if not self.__thumbnailer.is_pending(self.__key):
+            return
+        thumbnail = ImageProcessingAlgorithms.thumbnail_from_array(self.__image, self.__size.width(), self.__size.height())
+        self.__image = None  # Do not keep the source alive with the job
+        self.__thumbnailer.finish(self.__key, thumbnail)
+
+
+class HistoryThumbnailer(QObject):
+    """
+    Produce the thumbnails of the edit history on a worker thread.
+
+    request() is given an image that must not be modified afterwards, an array of any
+    working depth (e.g. the smallest suitable pyramid level) or a QImage, and returns the
+    key thumbnail_ready is emitted with. The receiver converts the QImage to QPixmap on
+    the GUI thread.
+    """
+    thumbnail_ready = pyqtSignal(int, QImage)
+
+    def __init__(self, width=300, height=100, parent=None):
+        super().__init__(parent)
+        self.__size = QSize(width, height)
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(1)  # Leave the other cores to the rendering
+        self.__keys = itertools.count()
+        self.__pending = {}  # key -> queued HistoryThumbnailJob
+        self.__lock = threading.Lock()
+
+    def request(self, image):
+        """Queue the thumbnail of an image and return its key."""
+        key = next(self.__keys)
+        job = HistoryThumbnailJob(self, key, image, self.__size)
+        job.setAutoDelete(False)  # The job is kept in __pending until it finishes
+        with self.__lock:
+            self.__pending[key] = job
+        self.__pool.start(job)
+        return key
+
+    def is_pending(self, key):
+        with self.__lock:
+            return key in self.__pending
+
+    def drop(self, keys):
+        with self.__lock:
+            jobs = [self.__pending.pop(key) for key in keys if key in self.__pending]
+        for job in jobs:
+            self.__pool.tryTake(job)
+
+    def drop_all(self):
+        with self.__lock:
+            keys = list(self.__pending)
+        self.drop(keys)
+
+    def finish(self, key, thumbnail):
+        with self.__lock:
+            if self.__pending.pop(key, None) is None:
+                return  # Dropped while scaling
+        self.thumbnail_ready.emit(key, thumbnail)
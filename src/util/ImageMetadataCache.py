@@ -0,0 +1,41 @@
+import os
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from src.util.PreviewCache import PreviewCache
+
+
+class ImageMetadataCache:
+    """
+    Metadata of image files read from their headers, see ImageProcessingAlgorithms.read_image_header.
+
+    Entries are keyed by (path, modification time, size), a changed file is read again.
+    Besides the header properties, the metadata holds the "file_size" in bytes and the
+    "modification_time" in seconds since the epoch.
+    """
+    ENTRY_BYTES = 1024  # Approximate memory of one entry
+    DEFAULT_MAX_ENTRIES = 1024
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.__cache = PreviewCache(max_entries * self.ENTRY_BYTES, size_of=lambda metadata: self.ENTRY_BYTES)
+
+    def get(self, image_path):
+        """Return the metadata dict of a file, None if the file does not exist."""
+        try:
+            file_info = os.stat(image_path)
+        except OSError:
+            return None
+
+        key = (image_path, file_info.st_mtime_ns, file_info.st_size)
+        metadata = self.__cache.get(key)
+        if metadata is None:
+            metadata = ImageProcessingAlgorithms.read_image_header(image_path)
+            metadata["file_size"] = file_info.st_size
+            metadata["modification_time"] = file_info.st_mtime
+            self.__cache.put(key, metadata)
+        return metadata
+
+    def clear(self):
+        self.__cache.clear()
+
+    def stats(self):
+        return self.__cache.stats()
@@ -0,0 +1,122 @@
+import os
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from src.util.PreviewCache import PreviewCache
+
+
+def _cache_key(path):
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PrefetchJob(QRunnable):
+    """Decode one image into the prefetch cache."""
+
+    def __init__(self, prefetcher, path, raw_profile):
+        super().__init__()
+        self.__prefetcher = prefetcher
+        self.__path = path
+        self.__raw_profile = raw_profile
+
+    def run(self):
+        if self.__prefetcher.is_cancelled(self.__path):
+            return
+        image = ImageProcessingAlgorithms.load_image_to_qimage(self.__path, self.__raw_profile)
+        self.__prefetcher.finish(self.__path, image)
+
+
+class ImagePrefetcher(QObject):
+    """
+    Decode the neighbours of the shown image in the background.
+
+    prefetch() is given the paths in priority order, e.g. next, previous, second
+    next, ... Requests that are not in the latest list are cancelled. Decoded
+    images are kept in a PreviewCache bounded by max_bytes. RAW files are decoded
+    with raw_profile, see ImageProcessingAlgorithms.raw_profiles.
+    """
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, raw_profile=ImageProcessingAlgorithms.RAW_PROFILE_FULL, parent=None):
+        super().__init__(parent)
+        self.__raw_profile = raw_profile
+        self.__cache = PreviewCache(max_bytes)
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(2)
+        self.__jobs = {}      # path -> (PrefetchJob, threading.Event set when it finished)
+        self.__lock = threading.Lock()
+
+    def prefetch(self, paths):
+        """Decode the given paths, highest priority first, and cancel the other requests."""
+        wanted = set(paths)
+        with self.__lock:
+            dropped = [path for path in self.__jobs if path not in wanted]
+        self.cancel(dropped)
+
+        for priority, path in enumerate(paths):
+            key = _cache_key(path)
+            if key is None or key in self.__cache:
+                continue
+            with self.__lock:
+                if path in self.__jobs:
+                    continue
+                job = PrefetchJob(self, path, self.__raw_profile)
+                job.setAutoDelete(False)
+                self.__jobs[path] = (job, threading.Event())
+            self.__pool.start(job, -priority)
+
+    def cancel(self, paths=None):
+        """
+        Cancel the requests of the given paths, all of them if None.
+
+        A decode that already started is not interrupted, it finishes into the cache
+        and load() still waits for it.
+        """
+        with self.__lock:
+            paths = list(self.__jobs) if paths is None else paths
+            jobs = [(path, self.__jobs[path]) for path in paths if path in self.__jobs]
+        for path, (job, finished) in jobs:
+            if self.__pool.tryTake(job):
+                with self.__lock:
+                    self.__jobs.pop(path, None)
+                finished.set()
+
+    def is_cancelled(self, path):
+        with self.__lock:
+            return path not in self.__jobs
+
+    def finish(self, path, image):
+        key = _cache_key(path)
+        with self.__lock:
+            job = self.__jobs.pop(path, None)
+        if image is not None and key is not None:
+            self.__cache.put(key, image)
+        if job is not None:
+            job[1].set()
+
+    def load(self, path):
+        """
+        Return the decoded image of a path as a QImage, or None if it can not be loaded.
+
+        A prefetched image is returned right away, an image being prefetched is
+        waited for, any other image is decoded on the calling thread.
+        """
+        with self.__lock:
+            job = self.__jobs.get(path)
+        if job is not None:
+            job[1].wait()
+
+        key = _cache_key(path)
+        image = self.__cache.get(key) if key is not None else None
+        if image is None:
+            image = ImageProcessingAlgorithms.load_image_to_qimage(path, self.__raw_profile)
+            if image is not None and key is not None:
+                self.__cache.put(key, image)
+        return image
+
+    def cache(self):
+        return self.__cache
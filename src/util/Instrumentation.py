@@ -0,0 +1,251 @@
+import collections
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Stages of the hot path, the names of the spans shown by the timing overlay of ImageViewer
+DECODE = "decode"
+MASK = "mask"
+LUT_BUILD = "lut build"
+APPLY = "apply"
+CONVERT = "convert"
+PAINT = "paint"
+STAGES = (DECODE, MASK, LUT_BUILD, APPLY, CONVERT, PAINT)
+
+MAX_TRACE_EVENTS = 200000  # Oldest events are dropped first, about 40 MB of trace
+FRAME_RATE_WINDOW_S = 1.0
+
+
+class StageStats:
+    """Aggregated durations of the spans of one name, in seconds."""
+    __slots__ = ("count", "total", "last", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.maximum = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Span:
+    """Times a block of code, see Instrumentation.span."""
+    __slots__ = ("__instrumentation", "__name", "__args", "__start")
+
+    def __init__(self, instrumentation, name, args):
+        self.__instrumentation = instrumentation
+        self.__name = name
+        self.__args = args
+        self.__start = 0
+
+    def __enter__(self):
+        self.__start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__instrumentation.record(self.__name, self.__start, time.perf_counter_ns(), self.__args)
+        return False
+
+
+class NullSpan:
+    """Span of disabled instrumentation, it does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Instrumentation:
+    """
+    Named timing spans of the hot path, safe to use from any thread.
+
+    Disabled, span() returns a shared no-op context manager after a single flag check, so
+    spans can stay in the code. Enabled, the duration of every span is aggregated per name
+    (count, last, mean and maximum), and with tracing every span is also kept as a Chrome
+    trace event, see export_chrome_trace. The trace opens in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self):
+        self.__enabled = False
+        self.__tracing = False
+        self.__lock = threading.Lock()
+        self.__stats = {}  # Span name -> StageStats
+        self.__events = collections.deque(maxlen=MAX_TRACE_EVENTS)
+        self.__frame_times = collections.deque(maxlen=1000)
+        self.__origin_ns = time.perf_counter_ns()
+
+    def enable(self, enabled=True, tracing=False):
+        """
+        :param tracing: Keep every span for export_chrome_trace, on top of the aggregated durations.
+        """
+        self.__tracing = enabled and tracing
+        self.__enabled = enabled
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def is_tracing(self):
+        return self.__tracing
+
+    def span(self, name, **args):
+        """
+        Return a context manager timing its block as a span of the given name, e.g.
+
+            with INSTRUMENTATION.span(APPLY, level=2):
+                ...
+
+        :param args: Values shown with the span in the trace.
+        """
+        if not self.__enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        """Add a finished span, the times are time.perf_counter_ns() values."""
+        duration = (end_ns - start_ns) / 1e9
+        with self.__lock:
+            stats = self.__stats.get(name)
+            if stats is None:
+                stats = self.__stats[name] = StageStats()
+            stats.add(duration)
+            if self.__tracing:
+                # Kept raw, the events are only formatted when they are exported
+                self.__events.append((name, start_ns, end_ns, threading.get_ident(), args))
+
+    def frame(self):
+        """Count a frame shown to the user, see frame_rate."""
+        if self.__enabled:
+            with self.__lock:
+                self.__frame_times.append(time.perf_counter())
+
+    def frame_rate(self):
+        """Frames per second over the last FRAME_RATE_WINDOW_S seconds."""
+        start = time.perf_counter() - FRAME_RATE_WINDOW_S
+        with self.__lock:
+            frames = sum(1 for frame_time in self.__frame_times if frame_time >= start)
+        return frames / FRAME_RATE_WINDOW_S
+
+    def stats(self):
+        """Return {span name: (count, last ms, mean ms, maximum ms)} of the spans recorded so far."""
+        with self.__lock:
+            return {name: (stats.count, stats.last * 1000, stats.mean() * 1000, stats.maximum * 1000)
+                    for name, stats in self.__stats.items()}
+
+    def reset(self):
+        with self.__lock:
+            self.__stats = {}
+            self.__events.clear()
+            self.__frame_times.clear()
+
+    def export_chrome_trace(self, path):
+        """
+        Write the traced spans as Chrome trace JSON, see enable.
+
+        :return: The number of exported spans.
+        """
+        with self.__lock:
+            events = list(self.__events)
+
+        process_id = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": process_id, "tid": thread_id,
+                         "args": {"name": thread_names.get(thread_id, f"thread {thread_id}")}}
+                        for thread_id in {event[3] for event in events}]
+        for name, start_ns, end_ns, thread_id, args in events:
+            trace_events.append({"name": name, "cat": "visualysium", "ph": "X", "pid": process_id, "tid": thread_id,
+                                 "ts": (start_ns - self.__origin_ns) / 1000, "dur": (end_ns - start_ns) / 1000,
+                                 "args": args or {}})
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file, separators=(",", ":"))
+        return len(events)
+
+
+# Instrumentation of the application, disabled unless enabled in main or by the timing overlay
+INSTRUMENTATION = Instrumentation()
+
+
+# Span of the application instrumentation, see Instrumentation.span. Bound once, so a
+# disabled span costs one call and a flag check.
+span = INSTRUMENTATION.span
+
+
+def timed(name):
+    """Decorate a function to run it in a span of the given name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with INSTRUMENTATION.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most burst records per interval through from each line of code.
+
+    Records of a line logging faster, e.g. on every slider tick, are dropped and counted;
+    the next record let through from the line mentions how many were dropped.
+    """
+
+    def __init__(self, burst=5, interval=1.0):
+        super().__init__()
+        self.__burst = burst
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__sites = {}  # (path, line) -> [start of the interval, records let through, records dropped]
+
+    def filter(self, record):
+        now = time.monotonic()
+        site = (record.pathname, record.lineno)
+        with self.__lock:
+            state = self.__sites.get(site)
+            if state is None or now - state[0] >= self.__interval:
+                dropped = state[2] if state is not None else 0
+                state = self.__sites[site] = [now, 0, 0]
+                if dropped:
+                    record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+            if state[1] >= self.__burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+        return True
+
+
+def configure_logging(level=logging.INFO, burst=5, interval=1.0):
+    """
+    Log to stderr with levels and the rate limit of RateLimitFilter.
+
+    :param level: Level name or number, e.g. "DEBUG" to see the values of every edit.
+    """
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+    handler.addFilter(RateLimitFilter(burst, interval))
+    root_logger = logging.getLogger()
+    for previous_handler in list(root_logger.handlers):
+        root_logger.removeHandler(previous_handler)
+    root_logger.addHandler(handler)
+    root_logger.setLevel(level)
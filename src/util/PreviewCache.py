@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+
+
+def image_bytes(image):
+    """Approximate memory use of a QImage or QPixmap, None counts as empty."""
+    if image is None or image.isNull():
+        return 0
+    return image.width() * image.height() * image.depth() // 8
+
+
+class PreviewCache:
+    """
+    In-memory LRU cache with a budget in bytes.
+
+    Keys should identify the content, e.g. (file path, modification time), so a
+    changed file never returns a stale entry. The cost of an entry is given by
+    size_of, image_bytes by default. The cache may be used from several threads.
+    """
+
+    ENTRY_OVERHEAD = 64  # Accounted for every entry, so empty entries are bounded too
+
+    def __init__(self, max_bytes, size_of=image_bytes):
+        self.__max_bytes = max_bytes
+        self.__size_of = size_of
+        self.__entries = OrderedDict()  # key -> (value, size), least recently used first
+        self.__total_bytes = 0
+        self.__lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__entries
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.__size_of(value) + self.ENTRY_OVERHEAD
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__total_bytes -= previous[1]
+            self.__entries[key] = (value, size)
+            self.__total_bytes += size
+            self.__evict(self.__max_bytes)
+
+    def pop(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                return default
+            self.__total_bytes -= entry[1]
+            return entry[0]
+
+    def trim(self, target_bytes=0):
+        """Evict least recently used entries until at most target_bytes are used, e.g. under memory pressure."""
+        with self.__lock:
+            self.__evict(target_bytes)
+
+    def clear(self):
+        self.trim(0)
+
+    def __evict(self, target_bytes):
+        while self.__total_bytes > target_bytes and self.__entries:
+            _, (_, size) = self.__entries.popitem(last=False)
+            self.__total_bytes -= size
+            self.evictions += 1
+
+    def total_bytes(self):
+        return self.__total_bytes
+
+    def max_bytes(self):
+        return self.__max_bytes
+
+    def stats(self):
+        with self.__lock:
+            return {"entries": len(self.__entries), "bytes": self.__total_bytes, "max_bytes": self.__max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
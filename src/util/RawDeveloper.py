@@ -0,0 +1,60 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+
+class DevelopJob(QRunnable):
+    def __init__(self, developer, path, profile):
+        super().__init__()
+        self.__developer = developer
+        self.__path = path
+        self.__profile = profile
+
+    def run(self):
+        if not self.__developer.is_current(self.__path):
+            return
+        image = ImageProcessingAlgorithms.load_image_to_qimage(self.__path, self.__profile)
+        if image is not None:
+            self.__developer.finish(self.__path, image)
+
+
+class RawDeveloper(QObject):
+    """
+    Decode a RAW file with the full quality profile in the background.
+
+    Only the file of the latest develop() call is decoded; starting another one or
+    calling cancel() drops the pending one, and a result that arrives late is not
+    emitted.
+    """
+    # Path and QImage. Declared with object, so the Python wrapper crosses the thread and keeps
+    # alive an array the image may wrap, see ImageProcessingAlgorithms.convert_array_to_qimage.
+    developed = pyqtSignal(str, object)
+
+    def __init__(self, profile=ImageProcessingAlgorithms.RAW_PROFILE_FULL, parent=None):
+        super().__init__(parent)
+        self.__profile = profile
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(1)
+        self.__current_path = None
+        self.__lock = threading.Lock()
+
+    def develop(self, path):
+        with self.__lock:
+            self.__current_path = path
+        self.__pool.clear()  # Drop the queued file, a running decode finishes but is not emitted
+        self.__pool.start(DevelopJob(self, path, self.__profile))
+
+    def cancel(self):
+        with self.__lock:
+            self.__current_path = None
+        self.__pool.clear()
+
+    def is_current(self, path):
+        with self.__lock:
+            return path == self.__current_path
+
+    def finish(self, path, image):
+        if self.is_current(path):
+            self.developed.emit(path, image)
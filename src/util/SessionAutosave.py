@@ -0,0 +1,308 @@
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+
+import numpy as np
+
+from PyQt6.QtCore import QBuffer, QByteArray, QCoreApplication, QIODevice, QObject, QRunnable, QStandardPaths, QThreadPool, QTimer
+from PyQt6.QtGui import QImage
+
+from src.EditHistory import EditOperation
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Sleep the calling thread so that at most bytes_per_second are consumed on average."""
+
+    def __init__(self, bytes_per_second):
+        self.__bytes_per_second = bytes_per_second
+        self.__start = time.monotonic()
+        self.__consumed = 0
+
+    def consume(self, number_of_bytes):
+        self.__consumed += number_of_bytes
+        ahead = self.__consumed / self.__bytes_per_second - (time.monotonic() - self.__start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def write_atomically(path, data, rate_limiter=None, chunk_bytes=1024 * 1024):
+    """Write a file through a temporary file renamed over it, so a crash never leaves a partial file."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        view = memoryview(data)
+        for offset in range(0, len(view), chunk_bytes):
+            chunk = view[offset:offset + chunk_bytes]
+            file.write(chunk)
+            if rate_limiter is not None:
+                rate_limiter.consume(len(chunk))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def encode_checkpoint(image):
+    """Serialize an image array of any working depth, compressed with zlib."""
+    buffer = io.BytesIO()
+    np.save(buffer, image, allow_pickle=False)
+    return zlib.compress(buffer.getbuffer(), 1)  # Fast level, checkpoints are written often
+
+
+def decode_checkpoint(data):
+    return np.load(io.BytesIO(zlib.decompress(data)), allow_pickle=False)
+
+
+def encode_thumbnail(image):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    return data.data()
+
+
+class AutosaveJob(QRunnable):
+    """Write one snapshot of the session on the thread pool."""
+
+    def __init__(self, autosave, record, files):
+        super().__init__()
+        self.__autosave = autosave
+        self.__record = record
+        self.__files = files  # [(file name, image array or thumbnail QImage)] not written yet
+
+    def run(self):
+        directory = self.__autosave.directory()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            rate_limiter = RateLimiter(self.__autosave.max_bytes_per_second())
+            for name, image in self.__files:
+                data = encode_thumbnail(image) if isinstance(image, QImage) else encode_checkpoint(image)
+                write_atomically(os.path.join(directory, name), data, rate_limiter)
+                self.__autosave.file_written(name)
+
+            # The record is written last, it only refers to files that exist
+            data = json.dumps(self.__record).encode("utf-8")
+            write_atomically(os.path.join(directory, SessionAutosave.RECORD_FILE), data, rate_limiter)
+
+            referenced = {SessionAutosave.RECORD_FILE}
+            for entry in self.__record["entries"]:
+                referenced.update(name for name in (entry["checkpoint"], entry["thumbnail"]) if name)
+            for name in os.listdir(directory):
+                if name not in referenced:
+                    os.remove(os.path.join(directory, name))
+                    self.__autosave.file_removed(name)
+        except OSError as e:
+            logger.error("Failed to autosave the session: %s", e)
+
+
+class SessionAutosave(QObject):
+    """
+    Crash-safe autosave of the edit history of one image.
+
+    The session is stored in a directory as a JSON record of the operations of every
+    entry, see EditHistory, next to zlib compressed checkpoint images and the PNG
+    thumbnails of the history list. Saves are debounced: schedule() may be called after
+    every change, the state is written at most once per delay_ms on a worker thread,
+    at most max_bytes_per_second, and files are only written once. Every file is
+    replaced atomically and the record is written last, so a crash at any point leaves
+    the previous or the new session.
+
+    A restored session only decodes the source image; the entries are replayed from the
+    stored checkpoints when they are shown.
+    """
+    FORMAT_VERSION = 1
+    RECORD_FILE = "session.json"
+    DEFAULT_DELAY_MS = 2000
+    DEFAULT_MAX_BYTES_PER_SECOND = 32 * 1024 * 1024
+
+    def __init__(self, directory=None, delay_ms=DEFAULT_DELAY_MS, max_bytes_per_second=DEFAULT_MAX_BYTES_PER_SECOND, parent=None):
+        super().__init__(parent)
+        self.__directory = directory or self.default_path()
+        self.__max_bytes_per_second = max_bytes_per_second
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(delay_ms)
+        self.__timer.timeout.connect(self.save)
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(1)  # Snapshots are written in order
+        self.__state = None    # Callable returning (image path, raw profile, EditHistory, current entry, thumbnails)
+        self.__file_names = {}  # (entry id, "checkpoint" or "thumbnail") -> file name
+        self.__written = set()  # File names in the directory
+        self.__lock = threading.Lock()
+
+        # A save still waiting for its delay is written before the application quits
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.wait_for_done)
+
+    @staticmethod
+    def default_path():
+        data_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericDataLocation)
+        if not data_dir:
+            data_dir = os.path.join(os.path.expanduser("~"), ".local", "share")
+        return os.path.join(data_dir, "VisuAlysium", "session")
+
+    def directory(self):
+        return self.__directory
+
+    def max_bytes_per_second(self):
+        return self.__max_bytes_per_second
+
+    def schedule(self, state):
+        """
+        Save the session after the delay, the state is read when it is saved.
+
+        :param state: Callable returning (image path, RAW profile of the source or None, EditHistory,
+                      current HistoryEntry, list of thumbnail QImages of the entries, null if unknown).
+        """
+        self.__state = state
+        if not self.__timer.isActive():
+            self.__timer.start()
+
+    def save(self):
+        """Take a snapshot of the scheduled state and write it in the background."""
+        self.__timer.stop()
+        if self.__state is None:
+            return
+        image_path, raw_profile, history, current_entry, thumbnails = self.__state()
+        self.__state = None
+
+        try:
+            file_info = os.stat(image_path)
+        except OSError as e:
+            # The image was moved or deleted, a session of it could not be restored
+            logger.warning("Not autosaving the session: %s", e)
+            return
+        record = {
+            "version": self.FORMAT_VERSION,
+            "image_path": image_path,
+            "file_size": file_info.st_size,
+            "modification_time_ns": file_info.st_mtime_ns,
+            "raw_profile": raw_profile,
+            "current": history.index_of(current_entry) if current_entry is not None else 0,
+            "entries": [],
+        }
+        files = []
+        entries = history.entries()
+        for index, entry in enumerate(entries):
+            checkpoint = history.checkpoint(entry) if index > 0 else None
+            thumbnail = thumbnails[index] if index < len(thumbnails) else None
+            record["entries"].append({
+                "description": entry.description,
+                "parent": entries.index(entry.parent) if entry.parent is not None else None,
+                "operations": [operation.to_dict() for operation in entry.operations],
+                "checkpoint": self.__file_name(entry, "checkpoint", checkpoint, files),
+                "thumbnail": self.__file_name(entry, "thumbnail", thumbnail, files),
+            })
+        self.__pool.start(AutosaveJob(self, record, files))
+
+    def __file_name(self, entry, kind, data, files):
+        """Return the file of the entry data, queued for writing if it is not written yet."""
+        name = self.__file_names.get((entry.id, kind))
+        with self.__lock:
+            if name is not None and name in self.__written:
+                return name
+        if data is None or (isinstance(data, QImage) and data.isNull()):
+            return None
+        if name is None:
+            name = f"{kind}-{uuid.uuid4().hex}.{'png' if kind == 'thumbnail' else 'npy.zlib'}"
+            self.__file_names[(entry.id, kind)] = name
+        files.append((name, data))
+        return name
+
+    def file_written(self, name):
+        with self.__lock:
+            self.__written.add(name)
+
+    def file_removed(self, name):
+        with self.__lock:
+            self.__written.discard(name)
+
+    def wait_for_done(self, msecs=-1):
+        """Write a scheduled save now and wait for the writes, e.g. before quitting."""
+        if self.__timer.isActive():
+            self.save()
+        return self.__pool.waitForDone(msecs)
+
+    def clear(self):
+        """Drop the scheduled save and remove the stored session, after a running write finished."""
+        self.__timer.stop()
+        self.__state = None
+        self.__pool.clear()
+        self.__file_names = {}
+        with self.__lock:
+            self.__written = set()
+        directory = self.__directory
+        self.__pool.start(QRunnable.create(lambda: shutil.rmtree(directory, ignore_errors=True)))
+
+    def load(self):
+        """
+        Return the stored session record, None if there is none or its image changed since.
+
+        A session that can not be restored is removed.
+        """
+        try:
+            with open(os.path.join(self.__directory, self.RECORD_FILE), "rb") as file:
+                record = json.loads(file.read())
+            file_info = os.stat(record["image_path"])
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.__directory):
+                logger.warning("Discarding the autosaved session: %s", e)
+                self.clear()
+            return None
+
+        if (record.get("version") != self.FORMAT_VERSION or file_info.st_size != record["file_size"]
+                or file_info.st_mtime_ns != record["modification_time_ns"]):
+            logger.info("Discarding the autosaved session, its image has changed.")
+            self.clear()
+            return None
+        return record
+
+    def restore(self, record, history, source):
+        """
+        Rebuild the history of a stored session.
+
+        :param record: Session record, see load.
+        :param history: EditHistory to fill.
+        :param source: The decoded source image or a callable returning it, see EditHistory.set_source.
+        :return: (current HistoryEntry, list of the thumbnail QImages of the entries, null if missing)
+        """
+        self.__file_names = {}
+        history.set_source(source, record["entries"][0]["description"])
+        entries = [history.entry(0)]
+        checkpoint_files = {}
+        for stored in record["entries"][1:]:
+            entry = history.append(stored["description"], [EditOperation.from_dict(operation) for operation in stored["operations"]],
+                                   parent=entries[stored["parent"]])
+            entries.append(entry)
+            if stored["checkpoint"]:
+                checkpoint_files[entry.id] = stored["checkpoint"]
+
+        thumbnails = []
+        with self.__lock:
+            self.__written = set(os.listdir(self.__directory))
+        for entry, stored in zip(entries, record["entries"]):
+            for kind in ("checkpoint", "thumbnail"):
+                if stored[kind] in self.__written:
+                    self.__file_names[(entry.id, kind)] = stored[kind]
+            thumbnails.append(QImage(os.path.join(self.__directory, stored["thumbnail"])) if stored["thumbnail"] else QImage())
+
+        def load_checkpoint(entry):
+            name = checkpoint_files.get(entry.id)
+            if name is None:
+                return None
+            try:
+                with open(os.path.join(self.__directory, name), "rb") as file:
+                    return decode_checkpoint(file.read())
+            except (OSError, ValueError, zlib.error) as e:
+                logger.warning("Failed to load the checkpoint %s: %s", name, e)
+                return None
+
+        history.set_checkpoint_loader(load_checkpoint)
+        return entries[record["current"]], thumbnails
@@ -0,0 +1,176 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice, QStandardPaths
+from PyQt6.QtGui import QImage
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailDiskCache:
+    """
+    Persistent thumbnail store in an SQLite database under the user cache directory.
+
+    Entries are keyed by the absolute path of the image and the thumbnail size, and
+    are only valid for the file size and modification time they were created from.
+    The database holds at most max_bytes of thumbnails, the least recently used
+    entries are evicted first. Every entry carries a CRC32 of its data and the
+    database is checked when opened, a corrupt database is recreated.
+
+    The cache may be used from several threads.
+    """
+
+    SCHEMA_VERSION = 1
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, database_path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.__database_path = database_path or self.default_path()
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__connection = self.__open()
+        self.__total_bytes = self.__connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails").fetchone()[0]
+
+    @staticmethod
+    def default_path():
+        cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation)
+        if not cache_dir:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_dir, "VisuAlysium", "thumbnails.sqlite")
+
+    def __open(self):
+        os.makedirs(os.path.dirname(self.__database_path), exist_ok=True)
+        try:
+            connection = self.__connect()
+            if connection is not None:
+                return connection
+        except sqlite3.DatabaseError as e:
+            logger.warning("Thumbnail cache is corrupt: %s", e)
+
+        logger.info("Recreating the thumbnail cache %s", self.__database_path)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.__database_path + suffix):
+                os.remove(self.__database_path + suffix)
+        return self.__connect()
+
+    def __connect(self):
+        """Open the database, None if it fails the integrity check or has another schema."""
+        connection = sqlite3.connect(self.__database_path, check_same_thread=False, isolation_level=None)
+        if connection.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            connection.close()
+            return None
+
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        has_table = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='thumbnails'").fetchone()
+        if has_table and version != self.SCHEMA_VERSION:
+            connection.close()
+            return None
+
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                path TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                checksum INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (path, width, height))""")
+        connection.execute("CREATE INDEX IF NOT EXISTS thumbnails_last_access ON thumbnails (last_access)")
+        connection.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+        return connection
+
+    @staticmethod
+    def __file_key(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, path, width, height):
+        """Return the cached thumbnail as a QImage, or None if there is no valid entry."""
+        file_key = self.__file_key(path)
+        if file_key is None:
+            return None
+        abs_path, file_size, mtime_ns = file_key
+
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT file_size, mtime_ns, checksum, data FROM thumbnails WHERE path=? AND width=? AND height=?",
+                (abs_path, width, height)).fetchone()
+            if row is None:
+                return None
+
+            cached_size, cached_mtime_ns, checksum, data = row
+            if (cached_size, cached_mtime_ns) != (file_size, mtime_ns) or zlib.crc32(data) != checksum:
+                # The file changed since, or the entry is damaged
+                self.__delete(abs_path, width, height, len(data))
+                return None
+
+            self.__connection.execute("UPDATE thumbnails SET last_access=? WHERE path=? AND width=? AND height=?",
+                                      (time.time(), abs_path, width, height))
+
+        image = QImage.fromData(data)
+        return None if image.isNull() else image
+
+    def put(self, path, width, height, image):
+        """Store a thumbnail, evicting the least recently used entries if the cache is full."""
+        file_key = self.__file_key(path)
+        if file_key is None or image.isNull():
+            return
+        abs_path, file_size, mtime_ns = file_key
+
+        byte_array = QByteArray()
+        buffer = QBuffer(byte_array)
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        image.save(buffer, "PNG" if image.hasAlphaChannel() else "JPG", 90)
+        data = bytes(byte_array)
+
+        with self.__lock:
+            previous = self.__connection.execute("SELECT LENGTH(data) FROM thumbnails WHERE path=? AND width=? AND height=?",
+                                                 (abs_path, width, height)).fetchone()
+            self.__connection.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      (abs_path, width, height, file_size, mtime_ns, zlib.crc32(data), time.time(), data))
+            self.__total_bytes += len(data) - (previous[0] if previous else 0)
+            if self.__total_bytes > self.__max_bytes:
+                self.__evict(int(self.__max_bytes * 0.9))
+
+    def __delete(self, abs_path, width, height, size):
+        self.__connection.execute("DELETE FROM thumbnails WHERE path=? AND width=? AND height=?", (abs_path, width, height))
+        self.__total_bytes -= size
+
+    def __evict(self, target_bytes):
+        rows = self.__connection.execute("SELECT path, width, height, LENGTH(data) FROM thumbnails ORDER BY last_access")
+        victims = []
+        for abs_path, width, height, size in rows:
+            if self.__total_bytes <= target_bytes:
+                break
+            victims.append((abs_path, width, height))
+            self.__total_bytes -= size
+        self.__connection.executemany("DELETE FROM thumbnails WHERE path=? AND width=? AND height=?", victims)
+
+    def total_bytes(self):
+        with self.__lock:
+            return self.__total_bytes
+
+    def check_integrity(self):
+        """Run the full SQLite integrity check, return True if the database is fine."""
+        with self.__lock:
+            return self.__connection.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+    def clear(self):
+        with self.__lock:
+            self.__connection.execute("DELETE FROM thumbnails")
+            self.__connection.execute("VACUUM")
+            self.__total_bytes = 0
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
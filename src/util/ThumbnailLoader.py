@@ -0,0 +1,85 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QSize, pyqtSignal
+from PyQt6.QtGui import QImage
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+
+
+class ThumbnailJob(QRunnable):
+    """Decode one thumbnail on the thread pool, see ImageProcessingAlgorithms.load_thumbnail."""
+
+    def __init__(self, loader, path, size, disk_cache=None):
+        super().__init__()
+        self.__loader = loader
+        self.__path = path
+        self.__size = size
+        self.__disk_cache = disk_cache
+
+    def run(self):
+        # The request may have been dropped while the job was waiting in the queue
+        if not self.__loader.is_pending(self.__path):
+            return
+
+        width, height = self.__size.width(), self.__size.height()
+        image = self.__disk_cache.get(self.__path, width, height) if self.__disk_cache else None
+        if image is None:
+            image = ImageProcessingAlgorithms.load_thumbnail(self.__path, width, height)
+            if not image.isNull():
+                if self.__disk_cache:
+                    self.__disk_cache.put(self.__path, width, height, image)
+        self.__loader.finish(self.__path, image)
+
+
+class ThumbnailLoader(QObject):
+    """
+    Produce thumbnails on a pool of worker threads.
+
+    Only QImage is used on the workers, the receiver converts the images of
+    thumbnail_ready to QPixmap on the GUI thread. A null image means the file
+    could not be decoded. With a ThumbnailDiskCache, thumbnails are read from
+    and stored to the cache on the workers.
+    """
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, width=100, height=100, parent=None, disk_cache=None):
+        super().__init__(parent)
+        self.__size = QSize(width, height)
+        self.__disk_cache = disk_cache
+        self.__pool = QThreadPool(self)
+        self.__pending = {}  # path -> queued ThumbnailJob
+        self.__lock = threading.Lock()
+
+    def request(self, path):
+        """Queue the thumbnail of an image, requests for a pending path are ignored."""
+        with self.__lock:
+            if path in self.__pending:
+                return
+            job = ThumbnailJob(self, path, self.__size, self.__disk_cache)
+            job.setAutoDelete(False)  # The job is kept in __pending until it finishes
+            self.__pending[path] = job
+        self.__pool.start(job)
+
+    def is_pending(self, path):
+        with self.__lock:
+            return path in self.__pending
+
+    def pending_paths(self):
+        with self.__lock:
+            return list(self.__pending)
+
+    def drop(self, paths):
+        """Drop the requests of the given paths, e.g. for items scrolled out of view."""
+        with self.__lock:
+            jobs = [self.__pending.pop(path) for path in paths if path in self.__pending]
+        for job in jobs:
+            self.__pool.tryTake(job)
+
+    def drop_all(self):
+        self.drop(self.pending_paths())
+
+    def finish(self, path, image):
+        with self.__lock:
+            if self.__pending.pop(path, None) is None:
+                return  # Dropped while decoding
+        self.thumbnail_ready.emit(path, image)
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    yield app
+
+
+def process_events_until(app, condition, timeout=10.0):
+    """Run the event loop until condition() is true, return its last value."""
+    import time
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    return condition()
+
+
+def smooth_image(dtype, height=1200, width=1600):
+    """Return an RGB test image of the given integer dtype."""
+    # Gradients with some noise, like a photograph. Large enough for an ImagePyramid with several
+    # levels, so statistics taken from a low resolution level would show
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.dstack((x / width, y / height, (x + y) / (width + height))) * 0.5 + 0.2
+    image = image + rng.normal(0, 0.02, image.shape)
+    return (image * np.iinfo(dtype).max).astype(dtype)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import src.EditRecipe as EditRecipe
+from src.EditHistory import EditHistory, EditOperation
+from conftest import smooth_image
+
+
+EDITS = [
+    ("Colors", [EditOperation("colors", kelvin=4000.0, saturation=1.4, hue_shift=10.0, red_gain=1.1, green_gain=1.0, blue_gain=0.9)]),
+    ("Lighting", [EditOperation("lighting", contrast=0.3, brightness=0.2, gamma=1.2, shadows=0.4, highlights=-0.3)]),
+    ("Rotate", [EditOperation("rotate", angle=90), EditOperation("flip", direction="horizontal")]),
+    ("Lighting", [EditOperation("lighting", contrast=-0.2, brightness=-0.1, gamma=0.9, shadows=-0.2, highlights=0.5)]),
+    ("Crop", [EditOperation("crop", x=100, y=150, width=900, height=1200)]),
+    ("Curves", [EditOperation("curves", points_global=[(0, 0), (64, 90), (192, 200), (255, 255)],
+                              points_shadows=[(0, 0), (85, 85), (170, 170), (255, 255)],
+                              points_highlight=[(0, 0), (85, 80), (170, 165), (255, 255)], channel="Luminance")]),
+]
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_recipe_renders_like_the_history_replay(dtype):
+    image = smooth_image(dtype)
+    history = EditHistory()
+    history.set_source(image)
+    for description, operations in EDITS:
+        entry = history.append(description, operations)
+
+    expected = history.image_at(len(history) - 1)
+    rendered = EditRecipe.render_recipe(image, history.operations_to(entry))
+
+    assert rendered.shape == expected.shape and rendered.dtype == expected.dtype
+    assert np.abs(rendered.astype(np.int64) - expected).max() <= 1
+
+
+def test_recipe_scales_the_crop_to_a_larger_original():
+    image = smooth_image(np.uint8, 400, 600)
+    operations = [EditOperation("crop", x=10, y=20, width=100, height=50),
+                  EditOperation("lighting", contrast=0.3, brightness=0.1, gamma=1.0, shadows=0.0, highlights=0.0)]
+
+    rendered = EditRecipe.render_recipe(image, operations, source_size=(300, 200))
+
+    expected = EditOperation("crop", x=20, y=40, width=200, height=100).apply(image)
+    expected = operations[1].apply(expected)
+    np.testing.assert_array_equal(rendered, expected)
+
+
+def test_cancelled_recipe_returns_none():
+    image = smooth_image(np.uint8)
+    assert EditRecipe.render_recipe(image, EDITS[1][1], is_cancelled=lambda: True) is None
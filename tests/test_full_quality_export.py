@@ -0,0 +1,65 @@
+import threading
+
+import cv2
+import numpy as np
+from PyQt6.QtGui import QImage
+
+import src.EditRecipe as EditRecipe
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from conftest import process_events_until, smooth_image
+
+
+def test_export_replays_the_edits_on_the_full_quality_decode(qapp, monkeypatch, tmp_path):
+    path = str(tmp_path / "image.dng")
+    full = smooth_image(np.uint8, 1600, 2400)
+
+    edited = threading.Event()
+
+    def decode(image_path, profile=ImageProcessingAlgorithms.RAW_PROFILE_FULL):
+        # A RAW file: the preview is a quarter of the full quality decode, which is developed after the edits
+        if profile == ImageProcessingAlgorithms.RAW_PROFILE_FULL:
+            edited.wait(10)
+        image = full if profile == ImageProcessingAlgorithms.RAW_PROFILE_FULL else cv2.resize(full, (600, 400), interpolation=cv2.INTER_AREA)
+        return ImageProcessingAlgorithms.convert_array_to_qimage(image)
+
+    monkeypatch.setattr(ImageProcessingAlgorithms, "load_image_to_qimage", decode)
+    monkeypatch.setattr(ImageProcessingAlgorithms, "is_raw_file", lambda image_path: image_path == path)
+    from src.ImageEditorWindow import ImageViewerWindow
+
+    window = ImageViewerWindow()
+    window.show()
+    window.show_new_image(path)
+    viewer = window._ImageViewerWindow__image_viewer
+    lighting_window = window._ImageViewerWindow__lighting_window
+    crop_window = window._ImageViewerWindow__crop_window
+
+    def edit(open_window, edit_window, change):
+        open_window()
+        qapp.processEvents()
+        change(edit_window._image_viewer)
+        qapp.processEvents()
+        edit_window.ok_pressed()
+        qapp.processEvents()
+
+    edit(window.brightness_button_clicked, lighting_window, lambda viewer: viewer.adjust_lightning(0.2, 0.1, 1.0, 0.3, 0.2))
+    edit(window.crop_button_clicked, crop_window, lambda viewer: (viewer.rotate_right(), viewer.set_crop_rectangle(60, 40, 300, 200)))
+    edit(window.brightness_button_clicked, lighting_window, lambda viewer: viewer.adjust_lightning(-0.2, 0.0, 1.2, 0.0, 0.4))
+    history = window._ImageViewerWindow__history
+    operations = history.operations_to(history.entries()[-1])
+    assert [operation.kind for operation in operations] == ["lighting", "rotate", "crop", "lighting"]
+
+    edited.set()
+    assert process_events_until(qapp, lambda: window._ImageViewerWindow__full_quality_image is not None)
+    exported = viewer.get_export_image()
+
+    # The edits replayed one after the other, with the crop made on the preview scaled to the decode
+    expected = full
+    for operation in EditRecipe.scale_operations(operations, 4):
+        expected = operation.apply(expected)
+    assert exported.size().width() == expected.shape[1] and exported.size().height() == expected.shape[0]
+    exported = ImageProcessingAlgorithms.convert_qimage_to_array(exported.convertToFormat(QImage.Format.Format_RGB888), copy=True)
+    assert np.abs(exported.astype(np.int64) - expected).max() <= 1
+
+    window.discard_session()
+    # Stops the worker threads and the autosave like quitting the application, before the window is deleted
+    qapp.aboutToQuit.emit()
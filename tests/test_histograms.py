@@ -0,0 +1,27 @@
+import cv2
+import numpy as np
+import pytest
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from conftest import smooth_image
+
+
+@pytest.mark.parametrize("channel, index", [("Red", 0), ("Green", 1), ("Blue", 2)])
+def test_channel_histogram_matches_calc_hist(channel, index):
+    image = smooth_image(np.uint8, 300, 400)
+    expected = cv2.calcHist([image], [index], None, [256], [0, 256])
+
+    histogram = ImageProcessingAlgorithms.calculate_histogram(image, channel)
+
+    assert histogram.shape == (256, 1) and histogram.dtype == np.float32
+    np.testing.assert_array_equal(histogram, expected)
+
+
+def test_luminance_histogram_weights_the_rgb_channels():
+    image = smooth_image(np.uint8, 300, 400)
+    expected = cv2.calcHist([cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)], [0], None, [256], [0, 256])
+
+    histogram = ImageProcessingAlgorithms.calculate_histogram(image, "Luminance")
+
+    assert histogram.shape == (256, 1) and histogram.dtype == np.float32
+    np.testing.assert_array_equal(histogram, expected)
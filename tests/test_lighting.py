@@ -0,0 +1,21 @@
+import cv2
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+from conftest import smooth_image
+
+
+def test_lighting_returns_the_rounded_float_blend_as_uint8():
+    image = smooth_image(np.uint8, 300, 400)
+    mask = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    amounts = (0.3, 0.1, 1.2, 0.2, -0.1)
+
+    adjusted = ImageProcessingAlgorithms.adjust_contrast_brightness_gamma(image, *amounts, mask)
+
+    # The blend of the shadow and highlight tables in floating point
+    lut_shadows, lut_highlights = ImageProcessingAlgorithms.lighting_luts(image.min(), image.max(), *amounts)
+    weight = mask[:, :, None] / 255.0
+    expected = weight * cv2.LUT(image, lut_highlights) + (1 - weight) * cv2.LUT(image, lut_shadows)
+
+    assert adjusted.dtype == np.uint8 and adjusted.shape == image.shape
+    assert np.abs(adjusted - expected).max() <= 0.5 + 1e-6
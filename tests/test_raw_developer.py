@@ -0,0 +1,28 @@
+import gc
+
+import numpy as np
+
+import src.ImageProcessingAlgorithms as ImageProcessingAlgorithms
+import src.util.RawDeveloper as RawDeveloper
+from conftest import process_events_until
+
+
+def test_developed_image_outlives_the_worker_thread(qapp, monkeypatch):
+    expected = np.random.default_rng(0).integers(0, 65536, (300, 400, 3), dtype=np.uint16)
+
+    def decode(path, profile):
+        # A QImage wrapping an array only the Python wrapper keeps alive, like a RAW decode can be
+        return ImageProcessingAlgorithms.convert_array_to_qimage(expected.copy(), copy=False)
+
+    monkeypatch.setattr(RawDeveloper.ImageProcessingAlgorithms, "load_image_to_qimage", decode)
+    developer = RawDeveloper.RawDeveloper()
+    results = []
+    developer.developed.connect(lambda path, image: results.append((path, image)))
+    developer.develop("image.dng")
+    assert process_events_until(qapp, lambda: results)
+
+    # The worker thread and its locals are gone, the pixels must still be readable
+    gc.collect()
+    path, image = results[0]
+    assert path == "image.dng"
+    np.testing.assert_array_equal(ImageProcessingAlgorithms.convert_qimage_to_array(image, copy=True), expected)